@@ -1,19 +1,38 @@
 import "./ProductCard.css";
+import usePriceStream from "./usePriceStream";
+
+const API_URL = process.env.REACT_APP_API_URL || "http://localhost:5000";
+const PLACEHOLDER_IMAGE = "https://via.placeholder.com/300x300?text=No+Image";
+
+// Thumbnails come from the API's image proxy; the version lets browsers cache them for good
+function thumbnailUrl(product, width) {
+  const version = encodeURIComponent(product.updated_at || "");
+  return `${API_URL}/img/${product.id}?w=${width}&v=${version}`;
+}
 
 export default function ProductCard({ product, onAddToComparison, isInComparison }) {
-  const discountPercentage = product.discount_percentage || 0;
-  const availability = product.availability === "in_stock";
+  // Price changes stream in while the card is open; a deleted listing shows as unavailable
+  const live = usePriceStream(product.id, product.price);
+  const priceChanged = live?.price != null;
+  const price = priceChanged ? live.price : product.price;
+  const discountPercentage = priceChanged
+    ? Math.max(0, (1 - price / (product.original_price || price)) * 100)
+    : product.discount_percentage || 0;
+  const availability = product.availability === "in_stock" && !live?.deleted;
 
   return (
     <div className={`product-card ${!availability ? "out-of-stock" : ""}`}>
       {/* Image Section */}
       <div className="product-image-container">
         <img
-          src={product.image || "https://via.placeholder.com/300x300?text=No+Image"}
+          src={product.image ? thumbnailUrl(product, 320) : PLACEHOLDER_IMAGE}
+          srcSet={product.image ? `${thumbnailUrl(product, 640)} 2x` : undefined}
           alt={product.name}
           className="product-image"
+          loading="lazy"
           onError={(e) => {
-            e.target.src = "https://via.placeholder.com/300x300?text=No+Image";
+            e.target.srcset = "";
+            e.target.src = PLACEHOLDER_IMAGE;
           }}
         />
         
@@ -57,18 +76,18 @@ export default function ProductCard({ product, onAddToComparison, isInComparison
 
         {/* Price Section */}
         <div className="price-section">
-          {product.original_price && product.original_price > product.price ? (
+          {product.original_price && product.original_price > price ? (
             <>
               <span className="original-price">
                 ${product.original_price.toFixed(2)}
               </span>
-              <span className="current-price">
-                ${product.price.toFixed(2)}
+              <span key={price} className={`current-price ${priceChanged ? "price-changed" : ""}`}>
+                ${price.toFixed(2)}
               </span>
             </>
           ) : (
-            <span className="current-price">
-              ${product.price.toFixed(2)}
+            <span key={price} className={`current-price ${priceChanged ? "price-changed" : ""}`}>
+              ${price.toFixed(2)}
             </span>
           )}
         </div>
@@ -0,0 +1,125 @@
+"""
+Admission control for the API.
+
+Two gates run before an expensive handler touches SQLite:
+
+- RateLimiter gives every client a token bucket. Each request spends tokens
+  according to its estimated cost (mostly the rows it is expected to read),
+  so one client paging through the whole catalogue runs out long before a
+  client browsing normally. An empty bucket means 429 with Retry-After.
+- ConcurrencyLimiter caps how many expensive requests run at once. Extra
+  requests queue for a bounded time and then get 503 with Retry-After,
+  instead of piling up behind the SQLite lock and dragging every other
+  request's latency up with them.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class Overloaded(Exception):
+    """No concurrency slot freed up within the queue timeout."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server busy; retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Tokens refilled at `rate` per second up to `burst`."""
+
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+
+class RateLimiter:
+    """Per-client token buckets, bounded to the `max_clients` most recently seen clients."""
+
+    def __init__(self, rate: float = 20.0, burst: float = 60.0, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, client, cost: float = 1.0) -> float:
+        """Spend `cost` tokens from the client's bucket.
+
+        Returns 0 if the request is admitted, otherwise the seconds until the
+        bucket will hold enough tokens. A cost above `burst` is charged as a
+        full bucket, so large requests are slowed down but never locked out.
+        """
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.burst, now)
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+                bucket.updated = now
+
+            if bucket.tokens >= cost:
+                bucket.tokens -= cost
+                return 0.0
+            return (cost - bucket.tokens) / self.rate
+
+    def clients(self):
+        """Number of clients currently tracked."""
+        return len(self._buckets)
+
+
+class ConcurrencyLimiter:
+    """At most `limit` holders at once; others wait up to `queue_timeout` seconds."""
+
+    def __init__(self, limit: int = 8, queue_timeout: float = 2.0):
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+
+    def acquire(self) -> bool:
+        """Take a slot, waiting up to queue_timeout. Returns False if none freed up."""
+        with self._lock:
+            self.waiting += 1
+        acquired = self._slots.acquire(timeout=self.queue_timeout)
+        with self._lock:
+            self.waiting -= 1
+            if acquired:
+                self.active += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for the duration of the block; raises Overloaded if none frees up."""
+        if not self.acquire():
+            raise Overloaded(self.retry_after())
+        try:
+            yield
+        finally:
+            self.release()
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait: about one queue timeout per queued batch."""
+        batches = 1 + self.waiting // max(self.limit, 1)
+        return max(1, math.ceil(batches * self.queue_timeout))
+
+    def stats(self):
+        return {"limit": self.limit, "active": self.active, "waiting": self.waiting}
+
@@ -0,0 +1,67 @@
+"""
+Price-drop alerts.
+
+Users watch a single listing or a product name (every store's listing of it)
+with a target price. PriceAlertMatcher follows the product change log, so it
+sees prices written by update_product, the admin API and the scrapers alike.
+For each price change it range-scans only the watches whose threshold the new
+price just crossed and queues one outbox row per triggered watch. The outbox
+is drained in batches by drain_alert_outbox:
+
+    python alerts.py            # match pending changes, then deliver (log) queued alerts
+"""
+
+import logging
+from changefeed import ChangeConsumer, ChangeFeed
+from database import get_pending_alerts, mark_alerts_delivered, match_price_watches
+
+logger = logging.getLogger(__name__)
+
+
+class PriceAlertMatcher(ChangeConsumer):
+    """Queue alerts for watches crossed by price changes; resumes from its checkpoint."""
+
+    name = "price_alerts"
+    persistent = True
+
+    def apply(self, changes):
+        queued = match_price_watches(changes)
+        if queued:
+            logger.info(f"Queued {queued} price alerts from {len(changes)} product changes")
+
+
+def match_pending_alerts(batch_size: int = 1000) -> int:
+    """Run the matcher over changes it has not seen yet, e.g. at the end of a scrape."""
+    return ChangeFeed([PriceAlertMatcher()], batch_size=batch_size).poll_once()
+
+
+def log_alerts(alerts):
+    """Default delivery: write each alert to the log."""
+    for alert in alerts:
+        logger.info(f"Alert for {alert['user_id']}: {alert['name']} at {alert['store']} "
+                    f"is ${alert['price']:.2f} (target ${alert['threshold']:.2f})")
+
+
+def drain_alert_outbox(deliver=log_alerts, batch_size: int = 500) -> int:
+    """Hand pending alerts to deliver(alerts) in batches and mark them delivered.
+
+    If deliver raises, the batch stays pending and is retried on the next drain.
+    Returns the number of alerts delivered.
+    """
+    delivered = 0
+    while True:
+        alerts = get_pending_alerts(batch_size)
+        if not alerts:
+            return delivered
+        deliver(alerts)
+        mark_alerts_delivered([alert['id'] for alert in alerts])
+        delivered += len(alerts)
+        if len(alerts) < batch_size:
+            return delivered
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    matched = match_pending_alerts()
+    delivered = drain_alert_outbox()
+    logger.info(f"Processed {matched} product changes, delivered {delivered} alerts")
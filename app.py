@@ -1,25 +1,170 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, g
 from flask_cors import CORS
 from functools import wraps
+import cProfile
+import csv
+import io
+import json
+import math
 import logging
+import os
+import pstats
+import threading
+import time
+import metrics
+from cache import SingleFlight, SingleFlightTimeout
+from admission import RateLimiter, ConcurrencyLimiter, Overloaded
 from database import (
     init_db, get_all_products, search_products, filter_products,
     get_product_by_id, get_products_by_ids, get_all_stores, 
     get_all_categories, get_products_by_store, get_products_by_category,
-    get_price_comparison, update_product, delete_product, get_statistics,
-    insert_product
+    get_price_comparison, update_product, delete_product,
+    insert_product, get_frequently_compared, add_query_observer,
+    add_price_watch, get_price_watches, delete_price_watch, set_read_source,
+    get_similar_products, apply_product_batch, release_partition_connections, UPDATABLE_FIELDS
 )
-
-# Initialize Flask app
+from alerts import PriceAlertMatcher
+from partitions import configure_from_env as configure_partitions_from_env
+from changefeed import ChangeFeed, ProductCacheInvalidator, CatalogueStatistics
+from comparison_log import ComparisonLogger
+from suggest import SuggestionIndex
+from pricestream import PriceBroadcaster
+from thumbnails import ThumbnailCache, ImageFetchError, DEFAULT_THUMBNAIL_WIDTH
+
+# Initialize Flask app; create_app() does the rest, so importing this module has no side effects
 app = Flask(__name__)
 CORS(app)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize database
-init_db()
+# ?profile=1 returns a cProfile report instead of the response; keep it off in production
+app.config['PROFILING_ENABLED'] = os.environ.get('PRICECOMPARE_PROFILING') == '1'
+
+# Largest ID list accepted by the batch lookup endpoint
+MAX_BATCH_IDS = 500
+
+# Most store listings /price-comparison returns, cheapest first
+MAX_PRICE_COMPARISON = 100
+
+# Largest operation list accepted by /admin/products/batch
+MAX_ADMIN_BATCH = int(os.environ.get('PRICECOMPARE_MAX_ADMIN_BATCH', '50000'))
+
+# /stream/prices: products per stream, seconds between heartbeats, events a client may fall
+# behind before it is dropped, open streams per process, and the reconnect delay sent to clients
+MAX_STREAM_IDS = MAX_BATCH_IDS
+STREAM_HEARTBEAT = float(os.environ.get('PRICECOMPARE_STREAM_HEARTBEAT', '15'))
+STREAM_BUFFER = int(os.environ.get('PRICECOMPARE_STREAM_BUFFER', '64'))
+MAX_STREAMS = int(os.environ.get('PRICECOMPARE_MAX_STREAMS', '1000'))
+STREAM_RETRY_SECONDS = 5
+
+# Identical searches and filters running at the same time share one query and one JSON encoding
+in_flight = SingleFlight(timeout=float(os.environ.get('PRICECOMPARE_COALESCE_TIMEOUT', '10')))
+
+# Per-client token buckets (tokens/second, burst); PRICECOMPARE_RATE_LIMIT=0 turns them off
+rate_limiter = None
+if float(os.environ.get('PRICECOMPARE_RATE_LIMIT', '20')) > 0:
+    rate_limiter = RateLimiter(rate=float(os.environ.get('PRICECOMPARE_RATE_LIMIT', '20')),
+                               burst=float(os.environ.get('PRICECOMPARE_RATE_BURST', '60')))
+
+# Queries that scan the catalogue run at most this many at a time; the rest queue briefly, then get 503
+expensive_queries = ConcurrencyLimiter(
+    limit=int(os.environ.get('PRICECOMPARE_MAX_EXPENSIVE', '8')),
+    queue_timeout=float(os.environ.get('PRICECOMPARE_QUEUE_TIMEOUT', '2')))
+
+# Request cost in tokens: 1, plus 1 per ROWS_PER_TOKEN rows returned and per
+# SCANNED_ROWS_PER_TOKEN rows SQLite reads without an index
+ROWS_PER_TOKEN = 100
+SCANNED_ROWS_PER_TOKEN = 10000
+
+# No request costs more than this share of the burst, so a big scan still leaves room for others
+MAX_REQUEST_SHARE = 0.25
+
+# Reverse proxies in front of the app; 0 rate-limits on the connecting address itself
+PROXY_HOPS = int(os.environ.get('PRICECOMPARE_PROXY_HOPS', '0'))
+
+# A product grid loads one /img per card, so an image costs a tenth of a token
+IMAGE_REQUEST_TOKENS = 0.1
+
+# Set up by create_app()
+query_tracer = None
+thumbnail_cache = None
+suggestion_index = None
+catalogue_stats = None
+change_feed = None
+comparison_logger = None
+price_broadcaster = None
+_started = False
+_start_lock = threading.Lock()
+_warned_proxy = False
+
+def create_app():
+    """Prepare the database, instrumentation and background workers; returns the app.
+    
+    WSGI servers should load `app:create_app()`. Calling it again returns the same app.
+    Loaders that import `app` directly (`flask --app app run`) get it called on the
+    first request instead.
+    """
+    with _start_lock:
+        if not _started:
+            _start()
+    return app
+
+def _start():
+    """The body of create_app(); runs once, under _start_lock."""
+    global query_tracer, thumbnail_cache, suggestion_index, catalogue_stats, change_feed
+    global comparison_logger, price_broadcaster, _started
+    
+    # Configure logging
+    logging.basicConfig(level=logging.INFO)
+    
+    # Behind N reverse proxies, rate-limit on the client address they forward
+    if PROXY_HOPS:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS)
+    
+    # Initialize database (one PRAGMA when the schema is already current)
+    init_db()
+    
+    # Count SQL statements, time and rows per request
+    add_query_observer(metrics.record_query)
+    
+    # Slow-query log, enabled by setting a threshold in milliseconds
+    if os.environ.get('PRICECOMPARE_SLOW_QUERY_MS'):
+        from querylog import QueryTracer
+        query_tracer = QueryTracer(slow_ms=float(os.environ['PRICECOMPARE_SLOW_QUERY_MS'])).install()
+    
+    # Serve product reads from published snapshots (see snapshot.py) instead of the live database
+    if os.environ.get('PRICECOMPARE_SNAPSHOT_DIR'):
+        from snapshot import SnapshotReader
+        set_read_source(SnapshotReader(os.environ['PRICECOMPARE_SNAPSHOT_DIR']))
+    
+    # Keep product rows in one SQLite file per store (see partitions.py); reads fan out across them
+    configure_partitions_from_env()
+    
+    # Resized product images served by /img/<product_id>
+    thumbnail_cache = ThumbnailCache(
+        os.environ.get('PRICECOMPARE_IMAGE_CACHE_DIR', 'image_cache'),
+        allow_private=os.environ.get('PRICECOMPARE_IMAGE_ALLOW_PRIVATE') == '1')
+    
+    # Derived views kept current from the product change log, whichever process wrote the change
+    suggestion_index = SuggestionIndex()
+    catalogue_stats = CatalogueStatistics()
+    price_broadcaster = PriceBroadcaster(buffer_size=STREAM_BUFFER, max_subscribers=MAX_STREAMS)
+    change_feed = ChangeFeed([ProductCacheInvalidator(), suggestion_index, catalogue_stats,
+                              PriceAlertMatcher(), price_broadcaster])
+    change_feed.start()
+    
+    # Background writer for comparison analytics
+    comparison_logger = ComparisonLogger()
+    comparison_logger.start()
+    
+    _started = True
+
+@app.before_request
+def ensure_started():
+    """Run the factory if whatever loaded `app` didn't."""
+    if not _started:
+        create_app()
 
 # ==================== MIDDLEWARE ====================
 
@@ -31,6 +176,11 @@ def handle_errors(f):
             return f(*args, **kwargs)
         except ValueError as e:
             return jsonify({"error": str(e)}), 400
+        except Overloaded as e:
+            metrics.admission_rejections.inc(request.url_rule.rule, "overloaded")
+            response = jsonify({"error": "Server busy, please retry"})
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 503
         except Exception as e:
             logger.error(f"Error in {f.__name__}: {str(e)}")
             return jsonify({"error": "Internal server error"}), 500
@@ -53,6 +203,123 @@ def validate_pagination(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def _page_size():
+    """The limit a paginated route will use, clamped like validate_pagination."""
+    limit = request.args.get('limit', 50, type=int)
+    return limit if limit and 1 <= limit <= 500 else 50
+
+def _listing_cost():
+    """A page read through an index: the page plus the rows OFFSET skips."""
+    return _page_size() + max(request.args.get('offset', 0, type=int) or 0, 0), 0
+
+def _scan_cost():
+    """A page of results from a query that reads every product (e.g. LIKE '%term%')."""
+    total = catalogue_stats.total_products if catalogue_stats else 0
+    return _page_size(), total
+
+def _filter_cost():
+    """Filters on category or store use an index; without them every product is read."""
+    if catalogue_stats is None:
+        return _page_size(), 0
+    candidates = [catalogue_stats.total_products]
+    if request.args.get('category'):
+        candidates.append(catalogue_stats.category_counts.get(request.args['category'], 0))
+    if request.args.get('store'):
+        candidates.append(catalogue_stats.store_counts.get(request.args['store'], 0))
+    return _page_size() + max(request.args.get('offset', 0, type=int) or 0, 0), min(candidates)
+
+def _group_cost(counts, name):
+    """Store and category listings read every product in the group, then slice a page."""
+    rows = getattr(catalogue_stats, counts).get(name, 0) if catalogue_stats else 0
+    return rows, 0
+
+def _batch_cost():
+    # Runs before handle_errors; a malformed body costs nothing and the handler answers 400
+    data = request.get_json(silent=True)
+    ids = data.get('ids') if isinstance(data, dict) else None
+    return (len(ids) if isinstance(ids, list) else 0), 0
+
+def rate_limited(cost=None, base=1.0):
+    """Decorator charging the client for the request's estimated cost; 429 when out of tokens.
+    
+    `cost` returns (rows returned, rows scanned) for the current request. `base` is
+    what a request costs before rows are counted.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if rate_limiter is not None:
+                _warn_unconfigured_proxy()
+                returned, scanned = cost() if cost else (0, 0)
+                tokens = base + returned / ROWS_PER_TOKEN + scanned / SCANNED_ROWS_PER_TOKEN
+                tokens = min(tokens, rate_limiter.burst * MAX_REQUEST_SHARE)
+                wait = rate_limiter.acquire(request.remote_addr, tokens)
+                if wait:
+                    metrics.admission_rejections.inc(request.url_rule.rule, "rate_limited")
+                    response = jsonify({"error": "Rate limit exceeded"})
+                    response.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+                    return response, 429
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+def _warn_unconfigured_proxy():
+    """Warn once if requests arrive through a proxy that PRICECOMPARE_PROXY_HOPS doesn't know about."""
+    global _warned_proxy
+    if PROXY_HOPS or _warned_proxy or 'X-Forwarded-For' not in request.headers:
+        return
+    _warned_proxy = True
+    logger.warning("Requests carry X-Forwarded-For but PRICECOMPARE_PROXY_HOPS is 0: every client "
+                   f"shares the rate-limit bucket of {request.remote_addr}. Set it to the number "
+                   "of proxies in front of the app.")
+
+@app.before_request
+def start_request_instrumentation():
+    """Start timing the request and, if asked for, profiling it."""
+    g.request_started = time.perf_counter()
+    metrics.begin_request()
+    
+    if app.config['PROFILING_ENABLED'] and request.args.get('profile') == '1':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def finish_request_instrumentation(response):
+    """Record request metrics; replace the response with the profile report if profiling."""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(40)
+        response = app.response_class(report.getvalue(), mimetype='text/plain')
+    
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        body_size = None if response.is_streamed else response.calculate_content_length()
+        metrics.end_request(route, request.method, response.status_code,
+                            time.perf_counter() - started, body_size)
+    return response
+
+@app.teardown_appcontext
+def close_partition_connections(exc):
+    """Request threads come and go; don't leave their partition connections open."""
+    release_partition_connections()
+
+def coalesced_json(key, compute):
+    """Respond with compute()'s JSON, sharing it with concurrent requests for the same key.
+    
+    `key` must cover every parameter that affects the response.
+    """
+    route = request.url_rule.rule
+    try:
+        body, shared = in_flight.do((route,) + key, lambda: jsonify(compute()).get_data())
+    except SingleFlightTimeout:
+        metrics.coalesced_requests.inc(route, "timeout")
+        return jsonify({"error": "Timed out waiting for an identical request"}), 504
+    metrics.coalesced_requests.inc(route, "follower" if shared else "leader")
+    return app.response_class(body, status=200, mimetype='application/json')
+
 # ==================== HEALTH CHECK ====================
 
 @app.route("/health", methods=["GET"])
@@ -60,15 +327,22 @@ def health():
     """Health check endpoint."""
     return jsonify({"status": "healthy", "service": "PriceCompare API"}), 200
 
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Expose request and query metrics in Prometheus text format."""
+    return app.response_class(metrics.registry.render(),
+                              mimetype='text/plain; version=0.0.4')
+
 # ==================== PRODUCTS ENDPOINTS ====================
 
 @app.route("/products", methods=["GET"])
+@rate_limited(_listing_cost)
 @handle_errors
 @validate_pagination
 def get_products(limit, offset):
     """Get all products with pagination."""
     products = get_all_products(limit=limit, offset=offset)
-    stats = get_statistics()
+    stats = catalogue_stats.snapshot()
     
     return jsonify({
         "data": products,
@@ -90,7 +364,27 @@ def get_product_detail(product_id):
     
     return jsonify(product), 200
 
+@app.route("/products/<int:product_id>/similar", methods=["GET"])
+@rate_limited()
+@handle_errors
+def similar_products(product_id):
+    """Get products similar to one product, from the lists precomputed by similar.py."""
+    limit = request.args.get('limit', 10, type=int)
+    if limit < 1 or limit > 50:
+        limit = 10
+    
+    similar = get_similar_products(product_id, limit=limit)
+    if not similar and not get_product_by_id(product_id):
+        return jsonify({"error": "Product not found"}), 404
+    
+    return jsonify({
+        "product_id": product_id,
+        "similar": similar,
+        "count": len(similar)
+    }), 200
+
 @app.route("/products/search", methods=["GET"])
+@rate_limited(_scan_cost)
 @handle_errors
 def search():
     """Search products by query."""
@@ -100,18 +394,47 @@ def search():
         return jsonify({"error": "Search query must be at least 2 characters"}), 400
     
     limit = request.args.get('limit', 50, type=int)
-    products = search_products(query, limit=limit)
+    if limit < 1 or limit > 500:
+        limit = 50
+    
+    def run_search():
+        with expensive_queries.slot():
+            products = search_products(query, limit=limit)
+        return {
+            "query": query,
+            "results": products,
+            "count": len(products)
+        }
+    
+    return coalesced_json((query, limit), run_search)
+
+@app.route("/products/suggest", methods=["GET"])
+@handle_errors
+def suggest():
+    """Autocomplete product names, brands and categories for a prefix."""
+    query = request.args.get('q', '').strip()
+    
+    if not query:
+        return jsonify({"error": "Query prefix required"}), 400
+    
+    limit = request.args.get('limit', 10, type=int)
+    if limit < 1 or limit > 25:
+        limit = 10
+    
+    suggestions = suggestion_index.suggest(query, limit=limit)
     
     return jsonify({
         "query": query,
-        "results": products,
-        "count": len(products)
+        "suggestions": suggestions,
+        "count": len(suggestions)
     }), 200
 
 @app.route("/products/filter", methods=["GET"])
+@rate_limited(_filter_cost)
 @handle_errors
-def filter_products_endpoint():
-    """Filter products by various criteria."""
+@validate_pagination
+def filter_products_endpoint(limit, offset):
+    """Filter products by various criteria, cheapest first, one page at a time."""
     category = request.args.get('category')
     store = request.args.get('store')
     min_price = request.args.get('min_price', type=float)
@@ -119,28 +442,39 @@ def filter_products_endpoint():
     min_rating = request.args.get('min_rating', type=float)
     availability = request.args.get('availability')
     
-    products = filter_products(
-        category=category,
-        min_price=min_price,
-        max_price=max_price,
-        store=store,
-        min_rating=min_rating,
-        availability=availability
-    )
+    def run_filter():
+        with expensive_queries.slot():
+            products = filter_products(
+                category=category,
+                min_price=min_price,
+                max_price=max_price,
+                store=store,
+                min_rating=min_rating,
+                availability=availability,
+                limit=limit,
+                offset=offset
+            )
+        return {
+            "filters": {
+                "category": category,
+                "store": store,
+                "price_range": [min_price, max_price],
+                "min_rating": min_rating,
+                "availability": availability
+            },
+            "results": products,
+            "count": len(products),
+            "pagination": {
+                "limit": limit,
+                "offset": offset
+            }
+        }
     
-    return jsonify({
-        "filters": {
-            "category": category,
-            "store": store,
-            "price_range": [min_price, max_price],
-            "min_rating": min_rating,
-            "availability": availability
-        },
-        "results": products,
-        "count": len(products)
-    }), 200
+    return coalesced_json((category, store, min_price, max_price, min_rating, availability,
+                           limit, offset), run_filter)
 
 @app.route("/products/compare", methods=["GET"])
+@rate_limited()
 @handle_errors
 def compare_products():
     """Compare multiple products by IDs."""
@@ -165,11 +499,65 @@ def compare_products():
     if not products:
         return jsonify({"error": "Products not found"}), 404
     
+    comparison_logger.record(product['id'] for product in products)
+    
     return jsonify({
         "comparison": products,
         "count": len(products)
     }), 200
 
+@app.route("/products/frequently-compared", methods=["GET"])
+@handle_errors
+def frequently_compared():
+    """Get product pairs most often compared together; ?warm=1 preloads them into the cache."""
+    limit = request.args.get('limit', 10, type=int)
+    if limit < 1 or limit > 100:
+        limit = 10
+    
+    pairs = get_frequently_compared(limit=limit)
+    
+    warmed = 0
+    if request.args.get('warm', '').lower() in ('1', 'true'):
+        product_ids = [product_id for pair in pairs
+                       for product_id in (pair['product_a'], pair['product_b'])]
+        warmed = len(get_products_by_ids(product_ids))
+    
+    return jsonify({
+        "pairs": pairs,
+        "count": len(pairs),
+        "warmed": warmed
+    }), 200
+
+@app.route("/products/batch", methods=["POST"])
+@rate_limited(_batch_cost)
+@handle_errors
+def batch_get_products():
+    """Fetch many products by ID in one round trip, preserving the requested order."""
+    data = request.get_json(silent=True)
+    ids = data.get('ids') if isinstance(data, dict) else None
+    
+    if not isinstance(ids, list) or not ids:
+        return jsonify({"error": "Body must contain a non-empty 'ids' list"}), 400
+    
+    if len(ids) > MAX_BATCH_IDS:
+        return jsonify({"error": f"Maximum {MAX_BATCH_IDS} IDs per batch"}), 400
+    
+    try:
+        product_ids = [int(product_id) for product_id in ids]
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid product IDs"}), 400
+    
+    products = get_products_by_ids(product_ids)
+    found_ids = {product['id'] for product in products}
+    missing = [product_id for product_id in dict.fromkeys(product_ids)
+               if product_id not in found_ids]
+    
+    return jsonify({
+        "data": products,
+        "missing": missing,
+        "count": len(products)
+    }), 200
+
 # ==================== STORES ENDPOINTS ====================
 
 @app.route("/stores", methods=["GET"])
@@ -183,6 +571,7 @@ def get_stores():
     }), 200
 
 @app.route("/stores/<store_name>/products", methods=["GET"])
+@rate_limited(lambda: _group_cost('store_counts', request.view_args['store_name']))
 @handle_errors
 @validate_pagination
 def get_store_products(store_name, limit, offset):
@@ -213,6 +602,7 @@ def get_categories():
     }), 200
 
 @app.route("/categories/<category_name>/products", methods=["GET"])
+@rate_limited(lambda: _group_cost('category_counts', request.view_args['category_name']))
 @handle_errors
 @validate_pagination
 def get_category_products(category_name, limit, offset):
@@ -233,6 +623,7 @@ def get_category_products(category_name, limit, offset):
 # ==================== PRICE COMPARISON ENDPOINTS ====================
 
 @app.route("/price-comparison", methods=["GET"])
+@rate_limited(_scan_cost)
 @handle_errors
 def price_comparison():
     """Get price comparison for a product across stores."""
@@ -241,7 +632,9 @@ def price_comparison():
     if not product_name:
         return jsonify({"error": "Product name required"}), 400
     
-    comparison = get_price_comparison(product_name)
+    # Name matching is a LIKE '%name%' scan of every product, like /products/search
+    with expensive_queries.slot():
+        comparison = get_price_comparison(product_name, limit=MAX_PRICE_COMPARISON)
     
     if not comparison:
         return jsonify({"error": "No products found"}), 404
@@ -259,9 +652,158 @@ def price_comparison():
 @handle_errors
 def statistics():
     """Get database statistics."""
-    stats = get_statistics()
+    stats = catalogue_stats.snapshot()
     return jsonify(stats), 200
 
+# ==================== IMAGE ENDPOINTS ====================
+
+@app.route("/img/<int:product_id>", methods=["GET"])
+@rate_limited(base=IMAGE_REQUEST_TOKENS)
+@handle_errors
+def product_image(product_id):
+    """Serve a resized thumbnail of a product's image from the local cache."""
+    try:
+        width = int(request.args.get('w', DEFAULT_THUMBNAIL_WIDTH))
+    except ValueError:
+        return jsonify({"error": "w must be an integer"}), 400
+    if width < 1:
+        return jsonify({"error": "w must be positive"}), 400
+    
+    product = get_product_by_id(product_id)
+    if not product or not product.get('image'):
+        return jsonify({"error": "Product image not found"}), 404
+    
+    webp = 'image/webp' in request.headers.get('Accept', '')
+    try:
+        thumbnail = thumbnail_cache.thumbnail(product['image'], width, webp=webp)
+    except ImageFetchError as e:
+        logger.warning(f"Image for product {product_id} unavailable: {str(e)}")
+        return jsonify({"error": "Product image unavailable"}), 502
+    
+    response = Response(thumbnail.data, mimetype=thumbnail.mimetype)
+    response.set_etag(thumbnail.etag)
+    response.vary.add('Accept')
+    # Versioned URLs (?v=<updated_at>) change whenever the product does, so they never go stale
+    if request.args.get('v'):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'public, max-age=86400'
+    return response.make_conditional(request)
+
+# ==================== ALERTS ENDPOINTS ====================
+
+@app.route("/alerts/watches", methods=["POST"])
+@handle_errors
+def create_price_watch():
+    """Watch a product (by ID or by name across stores) for a price drop."""
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('user_id')
+    product_id = data.get('product_id')
+    product_name = data.get('product_name')
+    
+    if not user_id or data.get('threshold') is None:
+        return jsonify({"error": "Missing required fields"}), 400
+    
+    if (product_id is None) == (product_name is None):
+        return jsonify({"error": "Provide exactly one of 'product_id' or 'product_name'"}), 400
+    
+    try:
+        threshold = float(data['threshold'])
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid threshold"}), 400
+    
+    if threshold <= 0:
+        return jsonify({"error": "Threshold must be positive"}), 400
+    
+    if product_id is not None and not get_product_by_id(product_id):
+        return jsonify({"error": "Product not found"}), 404
+    
+    watch_id = add_price_watch(str(user_id), threshold, product_id=product_id,
+                               product_name=product_name)
+    
+    return jsonify({
+        "message": "Price watch created successfully",
+        "watch_id": watch_id
+    }), 201
+
+@app.route("/alerts/watches", methods=["GET"])
+@handle_errors
+def list_price_watches():
+    """Get a user's price watches."""
+    user_id = request.args.get('user_id', '').strip()
+    
+    if not user_id:
+        return jsonify({"error": "user_id parameter required"}), 400
+    
+    watches = get_price_watches(user_id)
+    return jsonify({
+        "data": watches,
+        "count": len(watches)
+    }), 200
+
+@app.route("/alerts/watches/<int:watch_id>", methods=["DELETE"])
+@handle_errors
+def delete_price_watch_endpoint(watch_id):
+    """Delete one of a user's price watches."""
+    user_id = request.args.get('user_id', '').strip()
+    
+    if not user_id:
+        return jsonify({"error": "user_id parameter required"}), 400
+    
+    if not delete_price_watch(watch_id, user_id):
+        return jsonify({"error": "Price watch not found"}), 404
+    
+    return jsonify({"message": "Price watch deleted successfully"}), 200
+
+# ==================== STREAMING ENDPOINTS ====================
+
+@app.route("/stream/prices", methods=["GET"])
+@handle_errors
+def stream_prices():
+    """Server-Sent Events stream of price changes for the products in ?ids=1,2,3.
+    
+    Only updates that change a price and deletions are sent; inserts are not,
+    since nobody can be watching a product that didn't exist. Events missed
+    while disconnected (or after a `dropped` event) are not replayed: a client
+    that reconnects re-reads current prices, e.g. through /products/batch.
+    """
+    try:
+        product_ids = {int(id.strip()) for id in request.args.get('ids', '').split(',') if id.strip()}
+    except ValueError:
+        return jsonify({"error": "Invalid product IDs"}), 400
+    
+    if not product_ids:
+        return jsonify({"error": "No product IDs provided"}), 400
+    
+    if len(product_ids) > MAX_STREAM_IDS:
+        return jsonify({"error": f"At most {MAX_STREAM_IDS} products per stream"}), 400
+    
+    subscription = price_broadcaster.subscribe(product_ids)
+    if subscription is None:
+        raise Overloaded(STREAM_RETRY_SECONDS)
+    
+    return Response(_price_events(subscription), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _price_events(subscription):
+    """SSE frames for a subscription: price/deleted events, heartbeats, then `dropped` if it lagged."""
+    try:
+        yield f"retry: {STREAM_RETRY_SECONDS * 1000}\n\n"
+        while True:
+            events = subscription.wait(STREAM_HEARTBEAT)
+            if subscription.dropped:
+                yield "event: dropped\ndata: {}\n\n"
+                return
+            if subscription.closed:
+                return
+            if not events:
+                # Comment line; keeps proxies from timing the connection out and finds dead clients
+                yield ": heartbeat\n\n"
+                continue
+            yield ''.join(f"event: price\ndata: {json.dumps(event)}\n\n" for event in events)
+    finally:
+        price_broadcaster.unsubscribe(subscription)
+
 # ==================== ADMIN ENDPOINTS ====================
 
 @app.route("/admin/products", methods=["POST"])
@@ -332,6 +874,103 @@ def delete_product_endpoint(product_id):
     
     return jsonify({"message": "Product deleted successfully"}), 200
 
+_BATCH_REQUIRED_FIELDS = ('name', 'price', 'store', 'link', 'category')
+_BATCH_NUMERIC_FIELDS = ('price', 'original_price', 'discount_percentage', 'rating')
+
+def _read_batch_operations():
+    """Batch items from a JSON body ({"operations": [...]}) or a CSV upload.
+    
+    CSV rows have an `op` column plus the product fields; empty cells are
+    treated as absent.
+    """
+    if request.mimetype == 'text/csv':
+        reader = csv.DictReader(io.StringIO(request.get_data(as_text=True)))
+        return [{k.strip(): v.strip() for k, v in row.items() if k and v and v.strip()}
+                for row in reader]
+    
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else data
+    if not isinstance(operations, list):
+        raise ValueError('Body must be {"operations": [...]} or a CSV upload')
+    return operations
+
+def _batch_operation(item):
+    """Validate one batch item; returns the operation apply_product_batch() expects."""
+    if not isinstance(item, dict):
+        raise ValueError("Operation must be an object")
+    op = item.get('op')
+    fields = {k: v for k, v in item.items() if k not in ('op', 'id')}
+    for field in _BATCH_NUMERIC_FIELDS:
+        if fields.get(field) is not None:
+            try:
+                fields[field] = float(fields[field])
+            except (TypeError, ValueError):
+                raise ValueError(f"{field} must be a number")
+            if not math.isfinite(fields[field]) or fields[field] < 0:
+                raise ValueError(f"{field} must be a non-negative number")
+    
+    if op == 'create':
+        missing = [field for field in _BATCH_REQUIRED_FIELDS if fields.get(field) in (None, '')]
+        if missing:
+            raise ValueError(f"Missing required fields: {', '.join(missing)}")
+        return {'op': op, 'product': fields}
+    if op not in ('update', 'delete'):
+        raise ValueError("op must be create, update or delete")
+    
+    try:
+        product_id = int(item['id'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"{op} needs an integer id")
+    if op == 'delete':
+        return {'op': op, 'id': product_id}
+    if not any(field in UPDATABLE_FIELDS for field in fields):
+        raise ValueError(f"No updatable fields; allowed: {', '.join(sorted(UPDATABLE_FIELDS))}")
+    return {'op': op, 'id': product_id, 'fields': fields}
+
+@app.route("/admin/products/batch", methods=["POST"])
+@handle_errors
+def batch_products():
+    """Create, update and delete many products in one request (admin endpoint)."""
+    items = _read_batch_operations()
+    if len(items) > MAX_ADMIN_BATCH:
+        return jsonify({"error": f"At most {MAX_ADMIN_BATCH} operations per batch"}), 400
+    
+    # Validate everything up front; invalid items are reported and the rest still apply
+    results = []
+    valid, positions = [], []
+    for index, item in enumerate(items):
+        op = item.get('op') if isinstance(item, dict) else None
+        results.append({"index": index, "op": op})
+        try:
+            valid.append(_batch_operation(item))
+            positions.append(index)
+        except ValueError as e:
+            results[index].update(status="invalid", error=str(e))
+    
+    for index, (status, product_id) in zip(positions, apply_product_batch(valid)):
+        results[index].update(status=status, product_id=product_id)
+    
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return jsonify({"summary": summary, "results": results}), 200
+
+@app.route("/admin/query-stats", methods=["GET"])
+@handle_errors
+def query_stats():
+    """Dump per-statement query statistics collected by the slow-query log."""
+    if query_tracer is None:
+        return jsonify({"error": "Query tracing disabled; set PRICECOMPARE_SLOW_QUERY_MS"}), 404
+    
+    limit = request.args.get('limit', 50, type=int)
+    statements = query_tracer.dump()[:limit]
+    
+    return jsonify({
+        "slow_ms": query_tracer.slow_ms,
+        "statements": statements,
+        "count": len(statements)
+    }), 200
+
 # ==================== ERROR HANDLERS ====================
 
 @app.errorhandler(404)
@@ -348,5 +987,6 @@ def internal_error(error):
 # ==================== MAIN ====================
 
 if __name__ == "__main__":
+    create_app()
     logger.info("Starting PriceCompare API server...")
     app.run(host="0.0.0.0", port=5000, debug=True)
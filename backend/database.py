@@ -16,7 +16,7 @@ def init_db():
 def get_all_products():
     conn = sqlite3.connect("products.db")
     c = conn.cursor()
-    c.execute("SELECT * FROM products")
+    c.execute("SELECT id, name, price, store, link, image FROM products")
     rows = c.fetchall()
     conn.close()
     return [{"id": r[0], "name": r[1], "price": r[2], "store": r[3], "link": r[4], "image": r[5]} for r in rows]
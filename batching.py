@@ -0,0 +1,94 @@
+"""
+Background batch writer shared by the comparison log and the scrape sink.
+
+Producers put items on a bounded queue from any thread. One writer thread
+waits up to `flush_interval` to fill a batch of `batch_size`, then hands
+whatever arrived to _write(), so the database sees one transaction per batch
+instead of one per item.
+"""
+
+import queue
+import threading
+import time
+
+
+class BatchWriter:
+    """Queue items in memory and write them in batches from a background thread.
+
+    Subclasses implement _write(batch) and may override _tick(), which the
+    writer thread calls after every batch (or idle wait).
+    """
+
+    # Name of the writer thread
+    thread_name = "batch-writer"
+    # Seconds stop() waits for the writer thread; None waits until it has finished
+    stop_timeout = None
+
+    def __init__(self, batch_size: int, flush_interval: float, max_queue: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background writer thread (idempotent). Returns False if it was running."""
+        if self.running():
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+        self._thread.start()
+        return True
+
+    def running(self) -> bool:
+        """Whether the writer thread is alive and draining the queue."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        """Write everything queued and stop the writer thread."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.stop_timeout)
+            if not self._thread.is_alive():
+                self._thread = None
+        self.flush()
+
+    def flush(self):
+        """Write everything currently queued. Returns the total _write() reported."""
+        written = 0
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return written
+            written += self._write(batch)
+
+    def _drain(self, limit, timeout=None):
+        """Take up to `limit` items, waiting at most `timeout` seconds to fill the batch."""
+        batch = []
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(batch) < limit:
+            try:
+                if deadline is None:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch) -> int:
+        raise NotImplementedError
+
+    def _tick(self):
+        pass
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Wait up to flush_interval to fill a batch, then write whatever arrived
+            batch = self._drain(self.batch_size, timeout=self.flush_interval)
+            if batch:
+                self._write(batch)
+            self._tick()
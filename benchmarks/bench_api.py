@@ -0,0 +1,160 @@
+"""
+End-to-end benchmarks for every app.py route through the Flask test client.
+"""
+
+import itertools
+import pytest
+
+GET_ROUTES = [
+    "/health",
+    "/products?limit=50",
+    "/products?limit=500&offset=2000",
+    "/products/search?q=Galaxy",
+    "/products/suggest?q=ga",
+    "/products/filter?category=Phones&min_price=500&max_price=900",
+    "/products/filter?category=Laptops",
+    "/products/1/similar",
+    "/products/frequently-compared",
+    "/stores",
+    "/stores/Apple/products?limit=50",
+    "/categories",
+    "/categories/Headphones/products?limit=50",
+    "/price-comparison?product=Galaxy%205%20Pro",
+    "/statistics",
+    "/metrics",
+]
+
+
+@pytest.mark.parametrize("path", GET_ROUTES)
+def bench_get_route(benchmark, client, path):
+    response = benchmark(client.get, path)
+    assert response.status_code in (200, 404)
+
+
+def bench_product_detail(benchmark, client, product_ids):
+    ids = itertools.cycle(product_ids)
+    benchmark(lambda: client.get(f"/products/{next(ids)}"))
+
+
+def bench_compare(benchmark, client, product_ids):
+    ids = ",".join(str(product_id) for product_id in product_ids[:5])
+    benchmark(client.get, f"/products/compare?ids={ids}")
+
+
+def bench_batch_get(benchmark, client, product_ids):
+    benchmark(client.post, "/products/batch", json={"ids": product_ids[:200]})
+
+
+def bench_admin_create_update_delete(benchmark, client):
+    counter = itertools.count()
+
+    def round_trip():
+        n = next(counter)
+        created = client.post("/admin/products", json={
+            "name": f"API Benchmark Product {n}", "price": 10.0 + n, "store": "Target",
+            "link": f"https://example.com/api-bench/{n}", "category": "Tablets"})
+        product_id = created.get_json()["product_id"]
+        client.put(f"/admin/products/{product_id}", json={"price": 5.0 + n})
+        client.delete(f"/admin/products/{product_id}")
+
+    benchmark(round_trip)
+
+
+def bench_admin_batch(benchmark, client):
+    """1,000 creates, then the same products updated and deleted, in three batch requests."""
+    counter = itertools.count()
+
+    def round_trip():
+        n = next(counter)
+        created = client.post("/admin/products/batch", json={"operations": [
+            {"op": "create", "name": f"Batch Benchmark Product {n}-{i}", "price": 10.0 + i,
+             "store": "Target", "link": f"https://example.com/batch-bench/{n}/{i}", "category": "Tablets"}
+            for i in range(1000)]}).get_json()
+        ids = [result["product_id"] for result in created["results"]]
+        client.post("/admin/products/batch", json={"operations": [
+            {"op": "update", "id": product_id, "price": 5.0} for product_id in ids]})
+        deleted = client.post("/admin/products/batch", json={"operations": [
+            {"op": "delete", "id": product_id} for product_id in ids]}).get_json()
+        return created["summary"], deleted["summary"]
+
+    created, deleted = benchmark.pedantic(round_trip, rounds=5)
+    assert created == {"created": 1000} and deleted == {"deleted": 1000}
+
+
+def bench_product_image(benchmark, client, tmp_path, monkeypatch):
+    """Cached thumbnail hits; the source image comes from the local store stub."""
+    import app
+    from benchmarks.store_stub import start_stub
+    from thumbnails import ThumbnailCache
+
+    server, stub_url = start_stub()
+    try:
+        monkeypatch.setattr(app, "thumbnail_cache", ThumbnailCache(str(tmp_path), allow_private=True))
+        created = client.post("/admin/products", json={
+            "name": "API Benchmark Image Product", "price": 99.0, "store": "Target",
+            "link": "https://example.com/api-bench/image", "category": "Tablets",
+            "image": f"{stub_url}/images/bench.png?w=1200&h=900"})
+        product_id = created.get_json()["product_id"]
+        first = client.get(f"/img/{product_id}?w=320", headers={"Accept": "image/webp"})
+        assert first.status_code == 200
+
+        response = benchmark(client.get, f"/img/{product_id}?w=320", headers={"Accept": "image/webp"})
+        assert response.status_code == 200
+        assert server.config.counts["ok"] == 1
+        client.delete(f"/admin/products/{product_id}")
+    finally:
+        server.shutdown()
+
+
+def bench_search_thundering_herd(benchmark, client):
+    """32 identical searches at once; single-flight should run the query once per burst."""
+    import threading
+    import app
+
+    def burst():
+        barrier = threading.Barrier(32)
+        statuses = []
+
+        def request_once():
+            barrier.wait()
+            statuses.append(app.app.test_client().get("/products/search?q=Galaxy&limit=200").status_code)
+
+        threads = [threading.Thread(target=request_once) for _ in range(32)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    before = app.in_flight.stats()
+    statuses = benchmark.pedantic(burst, rounds=5)
+    after = app.in_flight.stats()
+    assert set(statuses) == {200}
+    benchmark.extra_info["coalesced"] = after["coalesced"] - before["coalesced"]
+
+
+def bench_rate_limiter_acquire(benchmark):
+    """Per-request admission overhead with 10k distinct clients in the bucket table."""
+    from admission import RateLimiter
+
+    limiter = RateLimiter(rate=20.0, burst=60.0)
+    clients = itertools.cycle([f"10.0.{n // 256}.{n % 256}" for n in range(10000)])
+    benchmark(lambda: limiter.acquire(next(clients), 1.5))
+
+
+def bench_price_stream_fanout(benchmark):
+    """One price change published with 1,000 open streams, 10 of them watching that product."""
+    from pricestream import PriceBroadcaster
+
+    broadcaster = PriceBroadcaster(buffer_size=64, max_subscribers=1000)
+    subscriptions = [broadcaster.subscribe([n % 100 + 1]) for n in range(1000)]
+    event = {"id": 1, "price": 9.99, "old_price": 10.99}
+
+    def publish():
+        broadcaster.publish(event)
+        for subscription in subscriptions[::100]:
+            subscription.wait(0)
+
+    benchmark(publish)
+    assert broadcaster.stats["dropped"] == 0
+    assert broadcaster.subscribers() == 1000
@@ -0,0 +1,141 @@
+"""
+Benchmarks for the query functions in database.py.
+"""
+
+import itertools
+import database
+
+
+def _uncached(func):
+    """Wrap a lookup so every call starts from an empty product cache."""
+    def run(*args, **kwargs):
+        database.product_cache.clear()
+        return func(*args, **kwargs)
+    return run
+
+
+def bench_init_db(benchmark, catalogue_db):
+    benchmark(database.init_db)
+
+
+def bench_get_all_products_first_page(benchmark, catalogue_db):
+    benchmark(database.get_all_products, limit=50, offset=0)
+
+
+def bench_get_all_products_deep_page(benchmark, catalogue_db):
+    benchmark(database.get_all_products, limit=50, offset=5000)
+
+
+def bench_search_products(benchmark, catalogue_db):
+    benchmark(database.search_products, "Galaxy", limit=50)
+
+
+def bench_search_products_no_match(benchmark, catalogue_db):
+    benchmark(database.search_products, "zz-no-such-product", limit=50)
+
+
+def bench_filter_products_selective(benchmark, catalogue_db):
+    benchmark(database.filter_products, category="Phones", store="Apple",
+              min_price=500, max_price=900, min_rating=4.0)
+
+
+def bench_filter_products_price_boundary(benchmark, catalogue_db):
+    """A listing priced exactly at both bounds is included (19.99 * 100 is 1998.999...)."""
+    products = database.get_all_products(limit=200)
+    # A price whose float dollars x 100 isn't a whole number of cents
+    product = next((p for p in products if p['price'] * 100 != round(p['price'] * 100)), products[0])
+    results = benchmark(database.filter_products, min_price=product['price'], max_price=product['price'])
+    assert product['id'] in {p['id'] for p in results}
+
+
+def bench_filter_products_unfiltered(benchmark, catalogue_db):
+    benchmark(database.filter_products)
+
+
+def bench_get_product_by_id_cold(benchmark, catalogue_db, product_ids, cold_cache):
+    ids = itertools.cycle(product_ids)
+    benchmark(lambda: _uncached(database.get_product_by_id)(next(ids)))
+
+
+def bench_get_product_by_id_cached(benchmark, catalogue_db, product_ids):
+    database.get_products_by_ids(product_ids)
+    ids = itertools.cycle(product_ids)
+    benchmark(lambda: database.get_product_by_id(next(ids)))
+
+
+def bench_get_products_by_ids_cold(benchmark, catalogue_db, product_ids, cold_cache):
+    benchmark(_uncached(database.get_products_by_ids), product_ids[:100])
+
+
+def bench_get_all_stores(benchmark, catalogue_db):
+    benchmark(database.get_all_stores)
+
+
+def bench_get_all_categories(benchmark, catalogue_db):
+    benchmark(database.get_all_categories)
+
+
+def bench_get_products_by_store(benchmark, catalogue_db):
+    benchmark(database.get_products_by_store, "Apple")
+
+
+def bench_get_products_by_category(benchmark, catalogue_db):
+    benchmark(database.get_products_by_category, "Headphones")
+
+
+def bench_get_price_comparison(benchmark, catalogue_db):
+    benchmark(database.get_price_comparison, "Galaxy 5 Pro")
+
+
+def bench_get_statistics(benchmark, catalogue_db):
+    benchmark(database.get_statistics)
+
+
+def bench_update_product(benchmark, catalogue_db, product_ids):
+    ids = itertools.cycle(product_ids)
+    prices = itertools.count(100)
+    benchmark(lambda: database.update_product(next(ids), price=float(next(prices) % 2000)))
+
+
+def bench_insert_and_delete_product(benchmark, catalogue_db):
+    counter = itertools.count()
+
+    def insert_then_delete():
+        n = next(counter)
+        product_id = database.insert_product(
+            name=f"Benchmark Product {n}", price=99.0 + n, store="Amazon",
+            link=f"https://example.com/bench/{n}", image="", category="Phones")
+        database.delete_product(product_id)
+
+    benchmark(insert_then_delete)
+
+
+def bench_record_comparisons(benchmark, catalogue_db, product_ids):
+    events = [product_ids[i:i + 3] for i in range(0, 300, 3)]
+    benchmark(database.record_comparisons, events)
+
+
+def bench_rollup_comparison_pairs(benchmark, catalogue_db, product_ids):
+    events = [product_ids[i:i + 3] for i in range(0, 300, 3)]
+
+    def setup():
+        database.record_comparisons(events)
+
+    benchmark.pedantic(database.rollup_comparison_pairs, setup=setup, rounds=20)
+
+
+def bench_get_frequently_compared(benchmark, catalogue_db):
+    benchmark(database.get_frequently_compared, limit=20)
+
+
+def bench_similar_products_full_build(benchmark, catalogue_db):
+    """Every product's neighbour list, NumPy scorer when installed."""
+    from similar import update_similar_products
+
+    stats = benchmark.pedantic(update_similar_products, kwargs={"full": True}, rounds=1)
+    assert stats["scored"]
+
+
+def bench_get_similar_products(benchmark, catalogue_db, product_ids):
+    ids = itertools.cycle(product_ids)
+    benchmark(lambda: database.get_similar_products(next(ids)))
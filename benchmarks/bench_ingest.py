@@ -0,0 +1,209 @@
+"""
+Bulk ingest benchmarks: synthetic catalogue into an empty database.
+"""
+
+import itertools
+import os
+import pytest
+import database
+from benchmarks.catalogue import generate_catalogue
+
+INGEST_PRODUCTS = int(os.environ.get("BENCH_INGEST_PRODUCTS", "20000"))
+
+
+def _fresh_database(tmp_path, counter):
+    path = tmp_path / f"ingest-{next(counter)}.db"
+    database.DATABASE = str(path)
+    database.init_db()
+
+
+def bench_generate_catalogue(benchmark):
+    benchmark(lambda: sum(1 for _ in generate_catalogue(INGEST_PRODUCTS)))
+
+
+def bench_bulk_insert_products(benchmark, tmp_path, catalogue_db):
+    products = list(generate_catalogue(INGEST_PRODUCTS, seed=99))
+    counter = itertools.count()
+
+    try:
+        benchmark.pedantic(database.insert_products, args=(products,),
+                           setup=lambda: _fresh_database(tmp_path, counter), rounds=3)
+    finally:
+        database.DATABASE = str(catalogue_db)
+
+
+def bench_row_by_row_insert(benchmark, tmp_path, catalogue_db):
+    """Baseline: the one-connection-per-row path used by scraper.py."""
+    products = list(generate_catalogue(min(INGEST_PRODUCTS, 2000), seed=99))
+    counter = itertools.count()
+
+    def insert_each():
+        for product in products:
+            database.insert_product(
+                name=product["name"], price=product["price"], store=product["store"],
+                link=product["link"], image=product["image"], category=product["category"],
+                description=product["description"], original_price=product["original_price"],
+                rating=product["rating"], availability=product["availability"])
+
+    try:
+        benchmark.pedantic(insert_each, setup=lambda: _fresh_database(tmp_path, counter), rounds=3)
+    finally:
+        database.DATABASE = str(catalogue_db)
+
+
+def bench_scraper_registry(benchmark, tmp_path, catalogue_db):
+    """Amazon and BestBuy adapters against the local store stub, through the batching sink."""
+    from benchmarks.store_stub import start_stub
+    from scraper import run_scrapers
+
+    server, stub_url = start_stub()
+    settings = {name: {"base_url": stub_url, "request_delay": (0.0, 0.0)}
+                for name in ("amazon", "bestbuy")}
+    counter = itertools.count()
+    try:
+        report = benchmark.pedantic(run_scrapers, args=(["amazon", "bestbuy"], settings),
+                                    setup=lambda: _fresh_database(tmp_path, counter), rounds=3)
+        assert all(stats["items"] for stats in report.values())
+    finally:
+        server.shutdown()
+        database.DATABASE = str(catalogue_db)
+
+
+STREAMING_SCRAPE = """
+import sys, tracemalloc
+import database
+from benchmarks.catalogue import generate_catalogue
+from ingest import Product, ProductSink
+from scraper import BaseScraper
+
+class CatalogueScraper(BaseScraper):
+    def scrape(self):
+        for product in generate_catalogue(int(sys.argv[2]), seed=5):
+            yield Product.from_dict(product)
+
+database.DATABASE = sys.argv[1]
+database.init_db()
+scraper = CatalogueScraper("Catalogue")
+sink = ProductSink()
+sink.start()
+tracemalloc.start()
+scraper.run(sink)
+sink.stop()
+print(tracemalloc.get_traced_memory()[1])
+"""
+
+
+def bench_streaming_scrape_memory(benchmark, tmp_path):
+    """A store yielding INGEST_PRODUCTS records through the sink, in a fresh interpreter.
+
+    Peak memory is a few sink batches, not the crawl: the whole crawl as
+    records would take about 475 bytes per product.
+    """
+    import subprocess
+    import sys
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    counter = itertools.count()
+
+    def run():
+        result = subprocess.run([sys.executable, "-c", STREAMING_SCRAPE,
+                                 str(tmp_path / f"stream-{next(counter)}.db"), str(INGEST_PRODUCTS)],
+                                cwd=root, capture_output=True, text=True, check=True)
+        return int(result.stdout.split()[-1])
+
+    peak = benchmark.pedantic(run, rounds=1)
+    benchmark.extra_info["peak_bytes"] = peak
+    assert peak < 4 * 1024 * 1024
+
+
+def bench_scraper_paginated_crawl(benchmark, tmp_path, catalogue_db):
+    """Five result pages per search, each linking to the others; every page is fetched once."""
+    from benchmarks.store_stub import start_stub, StubConfig
+    from scraper import run_scrapers, AmazonScraper, BestBuyScraper
+
+    server, stub_url = start_stub(config=StubConfig(pages_per_query=5))
+    settings = {name: {"base_url": stub_url, "request_delay": (0.0, 0.0)}
+                for name in ("amazon", "bestbuy")}
+    counter = itertools.count()
+    try:
+        report = benchmark.pedantic(run_scrapers, args=(["amazon", "bestbuy"], settings),
+                                    kwargs={"crawl_state": str(tmp_path / "crawl")},
+                                    setup=lambda: _fresh_database(tmp_path, counter), rounds=3)
+        assert report["amazon"]["pages"] == 5 * len(AmazonScraper.SEARCHES)
+        assert report["bestbuy"]["pages"] == 5 * len(BestBuyScraper.CATEGORIES)
+        benchmark.extra_info["duplicate_links"] = sum(stats["duplicate_links"] for stats in report.values())
+    finally:
+        server.shutdown()
+        database.DATABASE = str(catalogue_db)
+
+
+def bench_url_frontier(benchmark):
+    """100k links (half of them repeats with tracking parameters) queued and popped."""
+    from frontier import URLFrontier
+
+    links = [(f"https://store.example/p/{i % 50000}?utm_source=bench&ref=x{i}", "Phones")
+             for i in range(100000)]
+
+    def crawl():
+        frontier = URLFrontier(capacity=len(links))
+        frontier.add_many(links)
+        while (entry := frontier.pop()) is not None:
+            frontier.done(entry)
+        frontier.close()
+        return frontier
+
+    frontier = benchmark.pedantic(crawl, rounds=3)
+    assert frontier.stats["fetched"] == 50000
+    benchmark.extra_info["bloom_bytes"] = frontier.seen.nbytes
+
+
+def _search_page(structured):
+    from benchmarks.store_stub import _products_for, render_amazon_page
+    return render_amazon_page("smartphone", _products_for("smartphone", 24), structured)
+
+
+def bench_parse_page_dom(benchmark):
+    """Baseline: BeautifulSoup over a 24-result search page."""
+    from scraper import AmazonScraper
+
+    scraper = AmazonScraper()
+    products = benchmark(scraper.parse, _search_page(structured=False), "Phones")
+    assert products
+
+
+def bench_parse_page_structured(benchmark):
+    """The same page read from its JSON-LD; no DOM is built."""
+    from scraper import AmazonScraper
+
+    scraper = AmazonScraper()
+    products = benchmark(scraper.parse_structured, _search_page(structured=True),
+                         "https://www.amazon.com/s?k=smartphone", "Phones")
+    assert len(products) == 24
+
+
+def bench_crawl_page_partial_structured(benchmark):
+    """One sponsored JSON-LD item on a 24-result page: the DOM listings are merged in."""
+    from benchmarks.store_stub import _products_for, render_amazon_page, render_amazon_json_ld
+    from scraper import AmazonScraper
+
+    products = _products_for("smartphone", 24)
+    page = render_amazon_page("smartphone", products).replace(
+        "</title>", "</title>" + render_amazon_json_ld("smartphone", products[:1]), 1)
+    scraper = AmazonScraper()
+    scraper.fetch_page = lambda url, retries=3: page
+    items, _ = benchmark(scraper.crawl_page, "https://www.amazon.com/s?k=smartphone", "Phones")
+    # parse() reads the first 10 results; the JSON-LD item is one of them
+    assert len(items) == 10 and len({item.link for item in items}) == 10
+    assert scraper.stats["merged_pages"] == scraper.stats["structured_pages"]
+
+
+@pytest.mark.parametrize("text, price", [
+    ("$1,299.99", 1299.99), ("1,299", 1299.0), ("$1,234,567.50", 1234567.5), ("$12.5", 12.5),
+    ("1.299,99 €", 1299.99), ("1.299 €", 1299.0), ("1.234.567 €", 1234567.0), ("12,99 €", 12.99),
+    ("0.999", 1.0), ("from 999", 999.0),
+])
+def bench_parse_price(benchmark, text, price):
+    """US and European separators, including a lone thousands separator."""
+    from structured_data import parse_price
+
+    assert benchmark(parse_price, text) == price
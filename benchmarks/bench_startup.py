@@ -0,0 +1,65 @@
+"""
+Startup benchmarks: how long a new worker or CLI process takes before it's useful.
+
+Imports are timed in a fresh interpreter with `python -X importtime`, the same
+report you get by running it by hand:
+
+    python -X importtime -c "import app" 2> importtime.log
+"""
+
+import itertools
+import os
+import subprocess
+import sys
+import database
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported on first use only; loading them at import time is a startup regression
+DEFERRED_MODULES = {"requests", "bs4", "PIL"}
+
+
+def _import_report(module):
+    """Run `import module` in a new interpreter and parse the -X importtime report.
+
+    Returns {module name: cumulative microseconds}.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    report = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            report[name.strip()] = int(cumulative)
+    return report
+
+
+def _bench_import(benchmark, module):
+    report = benchmark.pedantic(_import_report, args=(module,), rounds=5, iterations=1)
+    benchmark.extra_info["import_ms"] = report[module] / 1000
+    loaded = {name.split(".")[0] for name in report}
+    assert not loaded & DEFERRED_MODULES, f"{module} imports {sorted(loaded & DEFERRED_MODULES)}"
+
+
+def bench_import_app(benchmark):
+    _bench_import(benchmark, "app")
+
+
+def bench_import_scraper(benchmark):
+    _bench_import(benchmark, "scraper")
+
+
+def bench_init_db_new_database(benchmark, tmp_path, catalogue_db):
+    """Full schema creation plus migrations; the warm path is bench_database.bench_init_db."""
+    counter = itertools.count()
+
+    def fresh_path():
+        database.DATABASE = str(tmp_path / f"startup-{next(counter)}.db")
+
+    try:
+        benchmark.pedantic(database.init_db, setup=fresh_path, rounds=5)
+    finally:
+        database.DATABASE = str(catalogue_db)
+        database.init_db()
@@ -0,0 +1,162 @@
+"""
+Synthetic product catalogue generator for benchmarks and load tests.
+
+Produces a deterministic stream of product dicts (same shape as
+scraper.generate_dummy_data) with skewed store shares, per-category
+log-normal prices and the same product listed by several stores under
+slightly different titles. Scales to tens of millions of rows because
+nothing is held in memory.
+
+    python -m benchmarks.catalogue --products 1000000 --db bench.db
+"""
+
+import argparse
+import math
+import random
+import time
+import database
+
+# (store, share of listings, base URL)
+STORES = [
+    ("Amazon", 0.34, "https://www.amazon.com/dp/"),
+    ("BestBuy", 0.16, "https://www.bestbuy.com/site/"),
+    ("Walmart", 0.14, "https://www.walmart.com/ip/"),
+    ("Target", 0.08, "https://www.target.com/p/"),
+    ("Newegg", 0.08, "https://www.newegg.com/p/"),
+    ("Apple", 0.06, "https://www.apple.com/shop/product/"),
+    ("Dell", 0.05, "https://www.dell.com/en-us/shop/"),
+    ("Lenovo", 0.04, "https://www.lenovo.com/us/en/p/"),
+    ("Google Store", 0.03, "https://store.google.com/product/"),
+    ("Microsoft Store", 0.02, "https://www.microsoft.com/store/"),
+]
+
+# category: (share, median price, price spread (sigma of log), brands, model words)
+CATEGORIES = {
+    "Phones": (0.32, 700.0, 0.45,
+               ["Apple iPhone", "Samsung Galaxy", "Google Pixel", "OnePlus", "Motorola Moto", "Xiaomi"],
+               ["Pro", "Ultra", "Plus", "Lite", "Max", "Mini", "FE"]),
+    "Laptops": (0.28, 1300.0, 0.5,
+                ["MacBook", "Dell XPS", "Lenovo ThinkPad", "HP Spectre", "ASUS ROG", "Acer Swift"],
+                ["Pro", "Air", "Carbon", "x360", "Zephyrus", "Go", "Studio"]),
+    "Tablets": (0.18, 600.0, 0.5,
+                ["Apple iPad", "Samsung Galaxy Tab", "Microsoft Surface", "Lenovo Tab", "Amazon Fire"],
+                ["Pro", "Air", "Mini", "Ultra", "Plus", "HD"]),
+    "Smartwatches": (0.12, 350.0, 0.55,
+                     ["Apple Watch", "Samsung Galaxy Watch", "Garmin Fenix", "Fitbit Sense", "Google Pixel Watch"],
+                     ["Series", "Classic", "Ultra", "Active", "Sport"]),
+    "Headphones": (0.10, 180.0, 0.7,
+                   ["Sony WH", "Bose QuietComfort", "Apple AirPods", "Sennheiser Momentum", "JBL Tune"],
+                   ["Pro", "Max", "Wireless", "ANC", "Studio"]),
+}
+
+STORAGE_OPTIONS = ["64GB", "128GB", "256GB", "512GB", "1TB"]
+COLORS = ["Black", "Silver", "Blue", "Graphite", "White", "Green"]
+AVAILABILITY = [("in_stock", 0.88), ("out_of_stock", 0.09), ("preorder", 0.03)]
+
+
+def _weighted(rng, items, weights):
+    return rng.choices(items, weights=weights, k=1)[0]
+
+
+def _title_variant(rng, base_title, color):
+    """Return the way a particular store might spell the same product."""
+    style = rng.random()
+    if style < 0.4:
+        return base_title
+    if style < 0.6:
+        return f"{base_title} - {color}"
+    if style < 0.75:
+        return f"{base_title} ({color})"
+    if style < 0.9:
+        return base_title.replace(" ", "  ", 1).replace("GB", " GB")
+    return f"NEW {base_title}, Unlocked"
+
+
+def generate_catalogue(count: int, seed: int = 42, stores_per_product: float = 2.5):
+    """Yield `count` product dicts.
+
+    Each underlying product is listed by about `stores_per_product` stores
+    (geometric distribution), with per-store price offsets and title variants,
+    so the result has the duplicate-heavy shape of a real comparison catalogue.
+    """
+    rng = random.Random(seed)
+    store_names = [store[0] for store in STORES]
+    store_weights = [store[1] for store in STORES]
+    store_urls = {store[0]: store[2] for store in STORES}
+    category_names = list(CATEGORIES)
+    category_weights = [CATEGORIES[name][0] for name in category_names]
+    availability_values = [value for value, _ in AVAILABILITY]
+    availability_weights = [weight for _, weight in AVAILABILITY]
+    listing_probability = 1.0 / max(stores_per_product, 1.0)
+
+    produced = 0
+    product_number = 0
+    while produced < count:
+        product_number += 1
+        category = _weighted(rng, category_names, category_weights)
+        _, median, sigma, brands, models = CATEGORIES[category]
+        brand = rng.choice(brands)
+        generation = rng.randint(1, 16)
+        base_title = f"{brand} {generation} {rng.choice(models)}"
+        if category in ("Phones", "Tablets", "Laptops"):
+            base_title += f" {rng.choice(STORAGE_OPTIONS)}"
+        color = rng.choice(COLORS)
+        base_price = round(median * math.exp(rng.gauss(0, sigma)), 2)
+        description = f"{brand} {category.lower()}, generation {generation}"
+
+        listings = 1
+        while rng.random() > listing_probability and listings < len(store_names):
+            listings += 1
+        used_stores = set()
+        for _ in range(listings):
+            if produced >= count:
+                break
+            store = _weighted(rng, store_names, store_weights)
+            if store in used_stores:
+                continue
+            used_stores.add(store)
+
+            price = round(base_price * rng.uniform(0.9, 1.08), 2)
+            original_price = None
+            if rng.random() < 0.3:
+                original_price = round(price * rng.uniform(1.05, 1.4), 2)
+
+            produced += 1
+            yield {
+                "name": _title_variant(rng, base_title, color),
+                "price": price,
+                "original_price": original_price,
+                "store": store,
+                "link": f"{store_urls[store]}{product_number:08d}-{produced}",
+                "image": f"https://via.placeholder.com/300x300?text=P{product_number}",
+                "category": category,
+                "description": description,
+                "rating": round(min(5.0, max(1.0, rng.gauss(4.2, 0.5))), 1),
+                "availability": _weighted(rng, availability_values, availability_weights)
+            }
+
+
+def load_catalogue(count: int, seed: int = 42, chunk_size: int = 5000):
+    """Generate and bulk insert `count` products into the configured database."""
+    return database.insert_products(generate_catalogue(count, seed=seed), chunk_size=chunk_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic product catalogue")
+    parser.add_argument("--products", type=int, default=10000, help="number of listings to generate")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default=database.DATABASE, help="SQLite file to fill")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    database.DATABASE = args.db
+    database.init_db()
+    start = time.perf_counter()
+    inserted = load_catalogue(args.products, seed=args.seed, chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - start
+    print(f"Inserted {inserted} of {args.products} products into {args.db} "
+          f"in {elapsed:.1f}s ({inserted / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Shared fixtures for the benchmark suite.
+
+The catalogue size is set with BENCH_PRODUCTS (default 10000), e.g.
+
+    BENCH_PRODUCTS=1000000 pytest benchmarks
+"""
+
+import os
+import random
+import pytest
+import database
+from benchmarks.catalogue import load_catalogue
+
+BENCH_PRODUCTS = int(os.environ.get("BENCH_PRODUCTS", "10000"))
+
+
+@pytest.fixture(scope="session")
+def catalogue_db(tmp_path_factory):
+    """A database filled with BENCH_PRODUCTS synthetic listings."""
+    path = tmp_path_factory.mktemp("catalogue") / "products.db"
+    database.DATABASE = str(path)
+    database.init_db()
+    load_catalogue(BENCH_PRODUCTS)
+    return path
+
+
+@pytest.fixture(scope="session")
+def product_ids(catalogue_db):
+    """A fixed random sample of existing product IDs."""
+    with database.get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT MAX(id) FROM products")
+        max_id = c.fetchone()[0]
+    rng = random.Random(7)
+    return [rng.randint(1, max_id) for _ in range(500)]
+
+
+@pytest.fixture(scope="session")
+def client(catalogue_db):
+    """Flask test client bound to the benchmark catalogue."""
+    import app
+    flask_app = app.create_app()
+    flask_app.testing = True
+    # Every request comes from one address; measure the handlers, not the rate limiter
+    app.rate_limiter = None
+    return flask_app.test_client()
+
+
+@pytest.fixture
+def cold_cache():
+    """Clear in-process caches so lookups hit SQLite."""
+    database.product_cache.clear()
+    yield
+    database.product_cache.clear()
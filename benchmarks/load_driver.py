@@ -0,0 +1,226 @@
+"""
+Load driver for the PriceCompare API and the store scrapers.
+
+API mode replays a weighted mix of search, filter, compare and detail
+requests against a running server from many threads and reports
+throughput and tail latency per request type:
+
+    python -m benchmarks.load_driver api --base-url http://localhost:5000 --concurrency 32 --duration 30
+
+Scraper mode runs AmazonScraper and BestBuyScraper against the local store
+stub (started in-process unless --stub-url is given) and reports pages/sec
+and items/sec:
+
+    python -m benchmarks.load_driver scraper --concurrency 8 --duration 20 --latency-ms 50 --error-rate 0.05
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# Request mix: (kind, weight)
+API_MIX = [
+    ("search", 30),
+    ("suggest", 10),
+    ("filter", 25),
+    ("detail", 25),
+    ("compare", 10),
+]
+
+SEARCH_TERMS = ["iphone", "galaxy", "pixel", "macbook", "thinkpad", "ipad", "watch", "pro", "ultra", "airpods"]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LoadStats:
+    """Latencies and status counts per request kind, shared across worker threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.statuses = {}
+        self.bytes = 0
+
+    def record(self, kind, status, elapsed, size=0):
+        with self._lock:
+            self.latencies.setdefault(kind, []).append(elapsed)
+            key = (kind, status)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+            self.bytes += size
+
+    def report(self, duration):
+        lines = []
+        total = sum(len(values) for values in self.latencies.values())
+        lines.append(f"{total} requests in {duration:.1f}s = {total / duration:,.1f} req/s, "
+                     f"{self.bytes / duration / 1024:,.1f} KiB/s")
+        lines.append(f"{'kind':<10} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}  statuses")
+        for kind in sorted(self.latencies):
+            values = sorted(self.latencies[kind])
+            statuses = ", ".join(f"{status}: {count}" for (k, status), count in sorted(self.statuses.items())
+                                 if k == kind)
+            lines.append(f"{kind:<10} {len(values):>7} {percentile(values, 0.5) * 1000:>8.1f} "
+                         f"{percentile(values, 0.95) * 1000:>8.1f} {percentile(values, 0.99) * 1000:>8.1f} "
+                         f"{values[-1] * 1000:>8.1f}  {statuses}")
+        return "\n".join(lines)
+
+
+def _get(url, timeout=30):
+    """GET a URL; returns (status, body bytes)."""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+    except (urllib.error.URLError, OSError):
+        return 0, b""
+
+
+def _discover(base_url):
+    """Fetch categories, stores and a sample of product IDs to build realistic requests."""
+    _, body = _get(f"{base_url}/categories")
+    categories = json.loads(body or b"{}").get("categories") or ["Phones"]
+    _, body = _get(f"{base_url}/stores")
+    stores = json.loads(body or b"{}").get("stores") or ["Amazon"]
+    _, body = _get(f"{base_url}/products?limit=500")
+    product_ids = [product["id"] for product in json.loads(body or b"{}").get("data", [])] or [1]
+    return categories, stores, product_ids
+
+
+def _build_request(kind, rng, base_url, categories, stores, product_ids):
+    if kind == "search":
+        return f"{base_url}/products/search?q={urllib.parse.quote(rng.choice(SEARCH_TERMS))}"
+    if kind == "suggest":
+        term = rng.choice(SEARCH_TERMS)
+        return f"{base_url}/products/suggest?q={urllib.parse.quote(term[:rng.randint(1, len(term))])}"
+    if kind == "filter":
+        params = {"category": rng.choice(categories)}
+        if rng.random() < 0.5:
+            params["store"] = rng.choice(stores)
+        if rng.random() < 0.6:
+            low = rng.choice([0, 100, 250, 500, 1000])
+            params["min_price"] = low
+            params["max_price"] = low + rng.choice([200, 500, 1000])
+        if rng.random() < 0.3:
+            params["min_rating"] = 4
+        return f"{base_url}/products/filter?{urllib.parse.urlencode(params)}"
+    if kind == "detail":
+        return f"{base_url}/products/{rng.choice(product_ids)}"
+    ids = rng.sample(product_ids, k=min(len(product_ids), rng.randint(2, 5)))
+    return f"{base_url}/products/compare?ids={','.join(str(i) for i in ids)}"
+
+
+def run_api_load(base_url, concurrency=16, duration=30.0, seed=1):
+    """Drive the API from `concurrency` threads for `duration` seconds."""
+    categories, stores, product_ids = _discover(base_url)
+    kinds = [kind for kind, _ in API_MIX]
+    weights = [weight for _, weight in API_MIX]
+    stats = LoadStats()
+    deadline = time.monotonic() + duration
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        while time.monotonic() < deadline:
+            kind = rng.choices(kinds, weights=weights, k=1)[0]
+            url = _build_request(kind, rng, base_url, categories, stores, product_ids)
+            start = time.perf_counter()
+            status, body = _get(url)
+            stats.record(kind, status, time.perf_counter() - start, len(body))
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats, time.monotonic() - started
+
+
+def run_scraper_load(stub_url=None, concurrency=4, duration=20.0, stub_config=None):
+    """Run the store scrapers against the stub from `concurrency` threads."""
+    from scraper import AmazonScraper, BestBuyScraper
+    from benchmarks.store_stub import start_stub
+
+    server = None
+    if stub_url is None:
+        server, stub_url = start_stub(config=stub_config)
+
+    stats = LoadStats()
+    items = {"count": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(worker_id):
+        rng = random.Random(worker_id)
+        amazon = AmazonScraper(base_url=stub_url)
+        bestbuy = BestBuyScraper(base_url=stub_url)
+        while time.monotonic() < deadline:
+            term = rng.choice(SEARCH_TERMS)
+            start = time.perf_counter()
+            if rng.random() < 0.5:
+                kind = "amazon"
+                products = amazon.scrape_search_results(term, "Phones")
+            else:
+                kind = "bestbuy"
+                products = bestbuy.scrape_category(f"{stub_url}/site/searchpage.jsp?st={term}", "Phones")
+            stats.record(kind, "ok" if products else "empty", time.perf_counter() - start)
+            with lock:
+                items["count"] += len(products)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    if server is not None:
+        stats.bytes = server.config.counts["bytes"]
+        server.shutdown()
+    return stats, elapsed, items["count"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the API or the scrapers")
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    api = sub.add_parser("api", help="replay a request mix against a running API")
+    api.add_argument("--base-url", default="http://localhost:5000")
+    api.add_argument("--concurrency", type=int, default=16)
+    api.add_argument("--duration", type=float, default=30.0)
+    api.add_argument("--seed", type=int, default=1)
+
+    scrape = sub.add_parser("scraper", help="run the scrapers against the store stub")
+    scrape.add_argument("--stub-url", help="use an already running stub instead of starting one")
+    scrape.add_argument("--concurrency", type=int, default=4)
+    scrape.add_argument("--duration", type=float, default=20.0)
+    scrape.add_argument("--latency-ms", type=float, default=0.0)
+    scrape.add_argument("--error-rate", type=float, default=0.0)
+    scrape.add_argument("--throttle-rate", type=float, default=0.0)
+
+    args = parser.parse_args()
+    if args.mode == "api":
+        stats, elapsed = run_api_load(args.base_url, args.concurrency, args.duration, args.seed)
+        print(stats.report(elapsed))
+    else:
+        from benchmarks.store_stub import StubConfig
+        config = StubConfig(latency_ms=args.latency_ms, error_rate=args.error_rate,
+                            throttle_rate=args.throttle_rate)
+        stats, elapsed, item_count = run_scraper_load(args.stub_url, args.concurrency, args.duration, config)
+        pages = sum(len(values) for values in stats.latencies.values())
+        print(stats.report(elapsed))
+        print(f"{pages / elapsed:,.1f} pages/s, {item_count / elapsed:,.1f} items/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Local stand-in for store websites, for load-testing the scrapers.
+
+Serves Amazon-like search pages (/s?k=...) and BestBuy-like search pages
+(/site/searchpage.jsp?st=...) whose markup matches the selectors used by
+AmazonScraper and BestBuyScraper. Latency, 5xx errors and 429 responses
+can be injected to exercise retry and backoff behaviour. /images/<name>.png
+serves a generated PNG (?w=&h=) for the image proxy.
+
+With --structured-rate, that fraction of pages also embeds the listings as
+structured data: schema.org JSON-LD on Amazon pages and a
+window.__INITIAL_STATE__ blob on BestBuy pages.
+
+With --pages N, every search has N result pages (?page= on Amazon, ?cp= on
+BestBuy). Each page links to every other page, with click-tracking
+parameters on the Amazon links, so a crawler sees each page many times.
+
+    python -m benchmarks.store_stub --port 8081 --latency-ms 80 --error-rate 0.05 --throttle-rate 0.02
+    python -m benchmarks.store_stub --structured-rate 0.8
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from benchmarks.catalogue import generate_catalogue
+
+
+class StubConfig:
+    """Fault-injection settings shared by all request handlers."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: int = 1, items_per_page: int = 24,
+                 structured_rate: float = 0.0, pages_per_query: int = 1, seed: int = 1):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.items_per_page = items_per_page
+        self.structured_rate = structured_rate
+        self.pages_per_query = pages_per_query
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "ok": 0, "errors": 0, "throttled": 0, "bytes": 0}
+
+    def roll(self):
+        with self.lock:
+            return self.rng.random()
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.counts[key] += amount
+
+
+def _products_for(query, count):
+    """Deterministic products for a search term, so repeated fetches return the same page."""
+    seed = int(hashlib.md5(query.encode()).hexdigest()[:8], 16)
+    return list(generate_catalogue(count, seed=seed))
+
+
+SCHEMA_AVAILABILITY = {"in_stock": "https://schema.org/InStock",
+                       "out_of_stock": "https://schema.org/OutOfStock",
+                       "preorder": "https://schema.org/PreOrder"}
+
+
+def _script_json(data):
+    """JSON safe to embed in a <script> element."""
+    return json.dumps(data).replace("</", "<\\/")
+
+
+def render_amazon_json_ld(query, products):
+    listing = {
+        "@context": "https://schema.org",
+        "@type": "ItemList",
+        "name": f"Results for {query}",
+        "itemListElement": [{
+            "@type": "ListItem",
+            "position": i + 1,
+            "item": {
+                "@type": "Product",
+                "name": product["name"],
+                "sku": f"B{i:09d}",
+                "url": f"/dp/B{i:09d}?q={query}",
+                "image": product["image"],
+                "aggregateRating": {"@type": "AggregateRating", "ratingValue": product["rating"]},
+                "offers": {"@type": "Offer", "price": f"{product['price']:.2f}", "priceCurrency": "USD",
+                           "availability": SCHEMA_AVAILABILITY[product["availability"]]},
+            },
+        } for i, product in enumerate(products)],
+    }
+    return f'<script type="application/ld+json">{_script_json(listing)}</script>'
+
+
+def render_bestbuy_state(query, products):
+    state = {"search": {"query": query, "results": [{
+        "skuId": str(6500000 + i),
+        "name": product["name"],
+        "price": round(product["price"], 2),
+        "currency": "USD",
+        "availability": product["availability"],
+        "url": f"/site/{6500000 + i}.p",
+        "image": product["image"],
+    } for i, product in enumerate(products)]}}
+    return f"<script>window.__INITIAL_STATE__ = {_script_json(state)};</script>"
+
+
+def _page_products(query, page, count):
+    # Page 1 keeps the products it had before pagination existed
+    return _products_for(query if page == 1 else f"{query}#{page}", count)
+
+
+def render_amazon_pagination(query, page, pages):
+    if pages <= 1:
+        return ""
+    links = [f'<a href="/s?k={html.escape(query)}&amp;page={n}&amp;qid={page}{n}&amp;ref=sr_pg_{n}" '
+             f'class="s-pagination-item s-pagination-button">{n}</a>'
+             for n in range(1, pages + 1) if n != page]
+    if page < pages:
+        links.append(f'<a href="/s?k={html.escape(query)}&amp;page={page + 1}&amp;ref=sr_pg_{page}" '
+                     f'class="s-pagination-item s-pagination-next">Next</a>')
+    return f'<span class="s-pagination-strip">{"".join(links)}</span>'
+
+
+def render_bestbuy_pagination(query, page, pages):
+    if pages <= 1:
+        return ""
+    links = []
+    if page > 1:
+        links.append(f'<a class="sku-list-page-prev" href="/site/searchpage.jsp?st={html.escape(query)}'
+                     f'&amp;cp={page - 1}">Previous</a>')
+    if page < pages:
+        links.append(f'<a class="sku-list-page-next" href="/site/searchpage.jsp?st={html.escape(query)}'
+                     f'&amp;cp={page + 1}">Next</a>')
+    return f'<div class="footer-pagination">{"".join(links)}</div>'
+
+
+def render_amazon_page(query, products, structured=False, page=1, pages=1):
+    items = []
+    for i, product in enumerate(products):
+        items.append(f'''
+<div data-component-type="s-search-result" data-asin="B{i:09d}" class="s-result-item">
+  <a class="a-link-normal s-no-outline" href="/dp/B{i:09d}?q={html.escape(query)}">
+    <img class="s-image" src="{html.escape(product["image"])}">
+  </a>
+  <h2 class="a-size-mini s-size-mini"><span>{html.escape(product["name"])}</span></h2>
+  <span class="a-price"><span class="a-price-whole">{product["price"]:,.2f}</span></span>
+</div>''')
+    head = render_amazon_json_ld(query, products) if structured else ""
+    return f'''<!DOCTYPE html><html><head><title>Amazon.com : {html.escape(query)}</title>{head}</head>
+<body><div class="s-main-slot">{"".join(items)}</div>{render_amazon_pagination(query, page, pages)}</body></html>'''
+
+
+def render_bestbuy_page(query, products, structured=False, page=1, pages=1):
+    items = []
+    for i, product in enumerate(products):
+        items.append(f'''
+<li class="sku-item-list"><div class="sku-item" data-sku-id="{6500000 + i}">
+  <img class="product-image" src="{html.escape(product["image"])}">
+  <h4 class="sku-title"><a class="sku-title" href="/site/{6500000 + i}.p">{html.escape(product["name"])}</a></h4>
+  <div class="priceView">${product["price"]:,.2f} Your price for this item is ${product["price"]:,.2f}</div>
+</div></li>''')
+    head = render_bestbuy_state(query, products) if structured else ""
+    return f'''<!DOCTYPE html><html><head><title>{html.escape(query)} - Best Buy</title>{head}</head>
+<body><ol class="sku-item-list">{"".join(items)}</ol>{render_bestbuy_pagination(query, page, pages)}</body></html>'''
+
+
+def render_png(name, width: int = 800, height: int = 800):
+    """An RGB gradient PNG whose colours depend on `name`, built without an imaging library."""
+    seed = hashlib.md5(name.encode()).digest()
+    rows = []
+    for y in range(height):
+        row = bytearray(b"\x00")  # filter type: none
+        for x in range(width):
+            row += bytes(((seed[0] + x * 255 // width) & 255,
+                          (seed[1] + y * 255 // height) & 255,
+                          seed[2]))
+        rows.append(bytes(row))
+
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data
+                + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(b"".join(rows), 6)) + chunk(b"IEND", b""))
+
+
+class StoreStubHandler(BaseHTTPRequestHandler):
+    """Request handler; the server's `config` attribute holds the StubConfig."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        config = self.server.config
+        config.count("requests")
+
+        delay = config.latency_ms + (config.roll() * 2 - 1) * config.jitter_ms
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        roll = config.roll()
+        if roll < config.throttle_rate:
+            config.count("throttled")
+            return self._send(429, "Too Many Requests", {"Retry-After": str(config.retry_after)})
+        if roll < config.throttle_rate + config.error_rate:
+            config.count("errors")
+            return self._send(503, "Service Unavailable")
+
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        structured = config.structured_rate > 0 and config.roll() < config.structured_rate
+        pages = config.pages_per_query
+        if url.path == "/s":
+            query = params.get("k", [""])[0]
+            page = int(params.get("page", ["1"])[0])
+            if page > pages:
+                return self._send(404, "Not Found")
+            body = render_amazon_page(query, _page_products(query, page, config.items_per_page),
+                                      structured, page, pages)
+        elif url.path == "/site/searchpage.jsp":
+            query = params.get("st", [""])[0]
+            page = int(params.get("cp", ["1"])[0])
+            if page > pages:
+                return self._send(404, "Not Found")
+            body = render_bestbuy_page(query, _page_products(query, page, config.items_per_page),
+                                       structured, page, pages)
+        elif url.path.startswith("/images/") and url.path.endswith(".png"):
+            width = min(int(params.get("w", ["800"])[0]), 4000)
+            height = min(int(params.get("h", ["800"])[0]), 4000)
+            config.count("ok")
+            return self._send(200, render_png(url.path, width, height), {"Content-Type": "image/png"})
+        else:
+            return self._send(404, "Not Found")
+
+        config.count("ok")
+        self._send(200, body, {"Content-Type": "text/html; charset=utf-8"})
+
+    def _send(self, status, body, headers=None):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.config.count("bytes", len(data))
+
+
+def start_stub(host: str = "127.0.0.1", port: int = 0, config: StubConfig = None):
+    """Start the stub in a background thread. Returns (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), StoreStubHandler)
+    server.daemon_threads = True
+    server.config = config or StubConfig()
+    thread = threading.Thread(target=server.serve_forever, name="store-stub", daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fake Amazon/BestBuy search pages")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 503 responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--items", type=int, default=24, help="results per page")
+    parser.add_argument("--structured-rate", type=float, default=0.0,
+                        help="fraction of pages that embed JSON-LD / state blobs")
+    parser.add_argument("--pages", type=int, default=1, help="result pages per search")
+    args = parser.parse_args()
+
+    config = StubConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                        error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                        retry_after=args.retry_after, items_per_page=args.items,
+                        structured_rate=args.structured_rate, pages_per_query=args.pages)
+    server = ThreadingHTTPServer((args.host, args.port), StoreStubHandler)
+    server.config = config
+    print(f"Store stub listening on http://{args.host}:{args.port} "
+          f"(Amazon: /s?k=..., BestBuy: /site/searchpage.jsp?st=...)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nServed: {config.counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Change-data-capture feed over the products table.
+
+Triggers append every insert, update and delete to product_changes with a
+monotonic sequence number. Consumers read the log in order from their last
+checkpoint, so derived views (caches, the suggestion index, statistics)
+update in O(changes) instead of rescanning the catalogue.
+
+Persistent consumers store their checkpoint in change_checkpoints and resume
+after a restart. In-memory consumers rebuild their state on start and begin
+from the sequence number their build was consistent with.
+"""
+
+import logging
+import threading
+import time
+from database import (
+    changes_since, latest_change_seq, get_change_checkpoint, save_change_checkpoint,
+    prune_changes, product_cache, store_codes, category_codes, read_catalogue,
+    relay_partition_changes, get_price_range
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeConsumer:
+    """Base class for a projection kept up to date from the change feed."""
+
+    # Unique name; used as the checkpoint key for persistent consumers
+    name = "consumer"
+
+    # Persistent consumers resume from their stored checkpoint after a restart
+    persistent = False
+
+    def start(self) -> int:
+        """Prepare the projection and return the sequence number to read after."""
+        return latest_change_seq()
+
+    def apply(self, changes):
+        """Apply a batch of change rows (dicts from product_changes), oldest first."""
+        raise NotImplementedError
+
+
+class ChangeFeed:
+    """Poll the change log and hand new changes to each registered consumer."""
+
+    def __init__(self, consumers=(), poll_interval: float = 1.0, batch_size: int = 1000,
+                 retention_days: int = 7, prune_interval: float = 3600.0):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.retention_days = retention_days
+        self.prune_interval = prune_interval
+        self._consumers = []
+        self._positions = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_prune = time.monotonic()
+        for consumer in consumers:
+            self.register(consumer)
+
+    def register(self, consumer):
+        """Add a consumer, positioning it at its checkpoint or its start() sequence."""
+        if consumer.persistent:
+            seq = get_change_checkpoint(consumer.name)
+        else:
+            seq = consumer.start()
+        with self._lock:
+            self._consumers.append(consumer)
+            self._positions[consumer.name] = seq
+        return consumer
+
+    def position(self, consumer) -> int:
+        """Return the last sequence number delivered to a consumer."""
+        return self._positions[consumer.name]
+
+    def poll_once(self) -> int:
+        """Deliver all pending changes to every consumer. Returns the number of changes applied."""
+        applied = 0
+        with self._lock:
+            # A partitioned catalogue logs changes per partition file until they are relayed here
+            relay_partition_changes()
+            for consumer in self._consumers:
+                applied += self._catch_up(consumer)
+        return applied
+
+    def _catch_up(self, consumer) -> int:
+        applied = 0
+        while True:
+            seq = self._positions[consumer.name]
+            changes = changes_since(seq, self.batch_size)
+            if not changes:
+                return applied
+            try:
+                consumer.apply(changes)
+            except Exception as e:
+                logger.error(f"Change consumer {consumer.name} failed at seq {seq}: {str(e)}")
+                return applied
+            last_seq = changes[-1]['seq']
+            self._positions[consumer.name] = last_seq
+            if consumer.persistent:
+                save_change_checkpoint(consumer.name, last_seq)
+            applied += len(changes)
+            if len(changes) < self.batch_size:
+                return applied
+
+    def start(self):
+        """Poll in a background thread (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="change-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll_once()
+                if time.monotonic() - self._last_prune >= self.prune_interval:
+                    self._last_prune = time.monotonic()
+                    prune_changes(self.retention_days)
+            except Exception as e:
+                logger.error(f"Change feed poll failed: {str(e)}")
+
+
+class ProductCacheInvalidator(ChangeConsumer):
+    """Drop cached products changed by any process, not just this one."""
+
+    name = "product_cache"
+
+    def apply(self, changes):
+        for change in changes:
+            if change['op'] != 'insert':
+                product_cache.invalidate(change['product_id'])
+
+
+class CatalogueStatistics(ChangeConsumer):
+    """Incrementally maintained version of database.get_statistics()."""
+
+    name = "catalogue_statistics"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total_products = 0
+        self.price_sum = 0.0
+        self.min_price = None
+        self.max_price = None
+        self.store_counts = {}
+        self.category_counts = {}
+        self._bounds_stale = False
+
+    def start(self) -> int:
+        """Load totals and per-store/category counts in one read transaction."""
+        seq, (totals, stores, categories) = read_catalogue([
+            '''SELECT COUNT(*), COALESCE(SUM(price_cents), 0) / 100.0,
+                      MIN(price_cents) / 100.0, MAX(price_cents) / 100.0
+               FROM product_records''',
+            "SELECT store_id, COUNT(*) FROM product_records GROUP BY store_id",
+            "SELECT category_id, COUNT(*) FROM product_records GROUP BY category_id",
+        ])
+        # One row per partition (just one unless the catalogue is partitioned)
+        total = sum(row[0] for row in totals)
+        price_sum = sum(row[1] for row in totals)
+        min_price = min((row[2] for row in totals if row[2] is not None), default=None)
+        max_price = max((row[3] for row in totals if row[3] is not None), default=None)
+        store_counts = {}
+        for store_id, count in stores:
+            self._count(store_counts, store_codes.name(store_id), count)
+        category_counts = {}
+        for category_id, count in categories:
+            self._count(category_counts, category_codes.name(category_id), count)
+
+        with self._lock:
+            self.total_products = total
+            self.price_sum = price_sum
+            self.min_price = min_price
+            self.max_price = max_price
+            self.store_counts = store_counts
+            self.category_counts = category_counts
+            self._bounds_stale = False
+        return seq
+
+    def apply(self, changes):
+        with self._lock:
+            for change in changes:
+                op = change['op']
+                if op == 'insert':
+                    self.total_products += 1
+                    self.price_sum += change['new_price']
+                    self._count(self.store_counts, change['store'], 1)
+                    self._count(self.category_counts, change['category'], 1)
+                    self._widen(change['new_price'])
+                elif op == 'delete':
+                    self.total_products -= 1
+                    self.price_sum -= change['old_price']
+                    self._count(self.store_counts, change['store'], -1)
+                    self._count(self.category_counts, change['category'], -1)
+                    self._narrow(change['old_price'])
+                elif change['old_price'] != change['new_price']:
+                    self.price_sum += change['new_price'] - change['old_price']
+                    self._narrow(change['old_price'])
+                    self._widen(change['new_price'])
+
+    @staticmethod
+    def _count(counts, key, delta):
+        counts[key] = counts.get(key, 0) + delta
+        if counts[key] <= 0:
+            del counts[key]
+
+    def _widen(self, price):
+        if self.min_price is None or price < self.min_price:
+            self.min_price = price
+        if self.max_price is None or price > self.max_price:
+            self.max_price = price
+
+    def _narrow(self, price):
+        # Removing the current minimum or maximum needs a query to find the next one
+        if price == self.min_price or price == self.max_price:
+            self._bounds_stale = True
+
+    def snapshot(self):
+        """Return statistics in the same shape as database.get_statistics()."""
+        with self._lock:
+            if self._bounds_stale:
+                self.min_price, self.max_price = get_price_range()
+                self._bounds_stale = False
+            average = self.price_sum / self.total_products if self.total_products else 0
+            return {
+                "total_products": self.total_products,
+                "total_stores": len(self.store_counts),
+                "total_categories": len(self.category_counts),
+                "average_price": round(average, 2) if average else 0,
+                "min_price": self.min_price,
+                "max_price": self.max_price
+            }
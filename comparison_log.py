@@ -0,0 +1,62 @@
+"""
+Buffered, non-blocking logging of product comparisons.
+
+Requests only enqueue the compared IDs; a background thread writes them to
+the comparisons table in batches and periodically rolls them up into
+"frequently compared together" pairs.
+"""
+
+import atexit
+import logging
+import queue
+import time
+from batching import BatchWriter
+from database import record_comparisons, rollup_comparison_pairs
+
+logger = logging.getLogger(__name__)
+
+
+class ComparisonLogger(BatchWriter):
+    """Queue comparison events in memory and flush them from a background thread."""
+
+    thread_name = "comparison-log"
+    stop_timeout = 5
+
+    def __init__(self, batch_size: int = 200, flush_interval: float = 2.0,
+                 rollup_interval: float = 300.0, max_queue: int = 10000):
+        super().__init__(batch_size, flush_interval, max_queue)
+        self.rollup_interval = rollup_interval
+        self.dropped = 0
+        self._last_rollup = time.monotonic()
+
+    def start(self):
+        """Start the background writer thread (idempotent); it is stopped at exit."""
+        if super().start():
+            atexit.register(self.stop)
+
+    def record(self, product_ids):
+        """Enqueue a comparison without blocking; drops the event if the buffer is full."""
+        try:
+            self._queue.put_nowait(list(product_ids))
+        except queue.Full:
+            self.dropped += 1
+
+    def rollup(self):
+        """Fold logged comparisons into the pair counts."""
+        self._last_rollup = time.monotonic()
+        try:
+            return rollup_comparison_pairs()
+        except Exception as e:
+            logger.error(f"Comparison rollup failed: {str(e)}")
+            return 0
+
+    def _write(self, batch):
+        try:
+            return record_comparisons(batch)
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} comparison events: {str(e)}")
+            return 0
+
+    def _tick(self):
+        if time.monotonic() - self._last_rollup >= self.rollup_interval:
+            self.rollup()
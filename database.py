@@ -1,268 +1,1388 @@
 import sqlite3
+import heapq
 import json
+import time
 from datetime import datetime
 from contextlib import contextmanager
+from itertools import chain, combinations, islice
+from cache import LRUCache
 
 DATABASE = "products.db"
 
+# Largest IN (...) list sent in one statement; older SQLite builds cap variables at 999
+MAX_IN_PARAMS = 500
+
+# Stamped into PRAGMA user_version once the schema and all migrations are in place.
+# Bump it together with every new migration in migrations.py.
+SCHEMA_VERSION = 3
+
+# Read-through cache for product lookups by ID (detail pages, comparisons, admin checks)
+product_cache = LRUCache(maxsize=4096)
+
+# Callbacks run as callback(sql, params, elapsed_seconds, rows) after each statement
+_query_observers = []
+
+def add_query_observer(callback):
+    """Register a callback that sees every statement executed through get_db()."""
+    if callback not in _query_observers:
+        _query_observers.append(callback)
+
+def remove_query_observer(callback):
+    """Unregister a callback added with add_query_observer."""
+    if callback in _query_observers:
+        _query_observers.remove(callback)
+
+# Callbacks run as callback(conn) on every connection get_db() opens
+_connection_hooks = []
+
+def add_connection_hook(callback):
+    """Register a callback to configure each new connection (e.g. tracing)."""
+    if callback not in _connection_hooks:
+        _connection_hooks.append(callback)
+
+def _notify_query_observers(sql, params, elapsed, rows):
+    for callback in list(_query_observers):
+        callback(sql, params, elapsed, rows)
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times statements and reports them to query observers.
+    
+    SELECTs are reported on the first fetch so the time includes stepping
+    through the result rows, not just preparing the statement.
+    """
+    
+    _pending = None
+    
+    def execute(self, sql, parameters=()):
+        if not _query_observers:
+            return super().execute(sql, parameters)
+        self._flush_pending()
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        elapsed = time.perf_counter() - start
+        if self.description is None:
+            _notify_query_observers(sql, parameters, elapsed, max(self.rowcount, 0))
+        else:
+            self._pending = (sql, parameters, elapsed)
+        return self
+    
+    def executemany(self, sql, seq_of_parameters):
+        if not _query_observers:
+            return super().executemany(sql, seq_of_parameters)
+        self._flush_pending()
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        _notify_query_observers(sql, None, time.perf_counter() - start, max(self.rowcount, 0))
+        return self
+    
+    def fetchone(self):
+        if self._pending is None:
+            return super().fetchone()
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._flush_pending(time.perf_counter() - start, 1 if row is not None else 0)
+        return row
+    
+    def fetchmany(self, size=None):
+        if self._pending is None:
+            return super().fetchmany(size) if size is not None else super().fetchmany()
+        start = time.perf_counter()
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        self._flush_pending(time.perf_counter() - start, len(rows))
+        return rows
+    
+    def fetchall(self):
+        if self._pending is None:
+            return super().fetchall()
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._flush_pending(time.perf_counter() - start, len(rows))
+        return rows
+    
+    def close(self):
+        self._flush_pending()
+        super().close()
+    
+    def _flush_pending(self, extra_elapsed=0.0, rows=0):
+        if self._pending is None:
+            return
+        sql, params, elapsed = self._pending
+        self._pending = None
+        _notify_query_observers(sql, params, elapsed + extra_elapsed, rows)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors report to query observers."""
+    
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+def open_connection(database, uri=False, **kwargs):
+    """Open an instrumented connection with the row factory and connection hooks applied."""
+    conn = sqlite3.connect(database, uri=uri, factory=InstrumentedConnection, **kwargs)
+    conn.row_factory = sqlite3.Row
+    for hook in _connection_hooks:
+        hook(conn)
+    return conn
+
 @contextmanager
 def get_db():
     """Context manager for database connections."""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
+    conn = open_connection(DATABASE)
     try:
         yield conn
     finally:
         conn.close()
 
-def init_db():
-    """Initialize database with enhanced schema."""
+# Optional source of read-only connections (e.g. a published snapshot) for API reads
+_read_source = None
+
+def set_read_source(source):
+    """Route read-only queries to `source()`, which returns an open connection it owns,
+    or None to use the primary database. Pass None to read from the primary again."""
+    global _read_source
+    _read_source = source
+
+@contextmanager
+def get_read_db():
+    """Context manager for read-only queries; may lag the primary when a read source is set."""
+    conn = _read_source() if _read_source is not None else None
+    if conn is not None:
+        yield conn
+        return
+    with get_db() as conn:
+        yield conn
+
+# Optional partitioned catalogue (see partitions.py); None keeps every product row in DATABASE
+_partitions = None
+
+def set_partitions(catalogue):
+    """Store product rows in `catalogue`'s partition files instead of DATABASE, or in DATABASE
+    again when None. Lookup tables, the change log and everything else stay in DATABASE."""
+    global _partitions
+    _partitions = catalogue
+
+def release_partition_connections():
+    """Close the calling thread's partition connections; a no-op unless partitioned."""
+    if _partitions is not None:
+        _partitions.release()
+
+class CodeTable:
+    """Interned name <-> integer code mapping for a small lookup table.
+    
+    Codes are never reused or renumbered, so cached entries stay valid when
+    another process adds names; a miss reloads the whole table.
+    """
+    
+    def __init__(self, table):
+        self.table = table
+        self._codes = {}
+        self._names = {}
+    
+    def code(self, name, create=False):
+        """Return the code for `name`; unknown names give None unless `create` is set."""
+        if name is None:
+            return None
+        code = self._codes.get(name)
+        if code is None:
+            code = self._reload().get(name)
+        if code is None and create:
+            # Committed on its own connection so a failed product insert can't leave a dangling code
+            with get_db() as conn:
+                c = conn.cursor()
+                c.execute(f"INSERT OR IGNORE INTO {self.table} (name) VALUES (?)", (name,))
+                conn.commit()
+            code = self._reload().get(name)
+        return code
+    
+    def name(self, code):
+        """Return the name for a code."""
+        name = self._names.get(code)
+        if name is None and code is not None:
+            self._reload()
+            name = self._names.get(code)
+        return name
+    
+    def items(self):
+        """Return every (code, name) pair."""
+        if not self._names:
+            self._reload()
+        return list(self._names.items())
+    
+    def clear(self):
+        self._codes = {}
+        self._names = {}
+    
+    def _reload(self):
+        with get_db() as conn:
+            c = conn.cursor()
+            c.execute(f"SELECT id, name FROM {self.table}")
+            rows = c.fetchall()
+        self._names = {row[0]: row[1] for row in rows}
+        self._codes = {row[1]: row[0] for row in rows}
+        return self._codes
+
+store_codes = CodeTable("stores")
+category_codes = CodeTable("categories")
+availability_codes = CodeTable("availability")
+
+# product_records decoded to the original products columns, REAL prices included
+_PRODUCTS_VIEW = '''SELECT r.id, r.name, r.description, c.name AS category,
+                           r.price_cents / 100.0 AS price,
+                           r.original_price_cents / 100.0 AS original_price,
+                           r.discount_percentage, s.name AS store, r.link, r.image, r.rating,
+                           a.name AS availability, r.created_at, r.updated_at
+                    FROM product_records r
+                    JOIN categories c ON c.id = r.category_id
+                    JOIN stores s ON s.id = r.store_id
+                    JOIN availability a ON a.id = r.availability_id'''
+
+# Columns read by the Python read paths, which decode codes with the interned tables instead of joining
+_RECORD_COLUMNS = '''id, name, description, category_id, price_cents, original_price_cents,
+                     discount_percentage, store_id, link, image, rating, availability_id,
+                     created_at, updated_at'''
+
+def _to_cents(price):
+    return None if price is None else int(round(float(price) * 100))
+
+def _product_from_record(row):
+    """Build a product dict (same shape as a products view row) from a product_records row."""
+    original_price_cents = row['original_price_cents']
+    return {
+        "id": row['id'],
+        "name": row['name'],
+        "description": row['description'],
+        "category": category_codes.name(row['category_id']),
+        "price": row['price_cents'] / 100,
+        "original_price": original_price_cents / 100 if original_price_cents is not None else None,
+        "discount_percentage": row['discount_percentage'],
+        "store": store_codes.name(row['store_id']),
+        "link": row['link'],
+        "image": row['image'],
+        "rating": row['rating'],
+        "availability": availability_codes.name(row['availability_id']),
+        "created_at": row['created_at'],
+        "updated_at": row['updated_at']
+    }
+
+def create_product_views(c):
+    """Create the products view over product_records and the triggers that log its changes."""
+    # The products view keeps the original column names and REAL prices for readers
+    c.execute(f"CREATE VIEW IF NOT EXISTS products AS {_PRODUCTS_VIEW}")
+    
+    # Writes through the view (other tools, hand-written SQL) land in product_records
+    c.execute('''CREATE TRIGGER IF NOT EXISTS products_view_insert INSTEAD OF INSERT ON products
+                 BEGIN
+                     INSERT OR IGNORE INTO stores (name) VALUES (NEW.store);
+                     INSERT OR IGNORE INTO categories (name)
+                     VALUES (COALESCE(NEW.category, 'Electronics'));
+                     INSERT OR IGNORE INTO availability (name)
+                     VALUES (COALESCE(NEW.availability, 'in_stock'));
+                     INSERT INTO product_records
+                         (id, name, description, category_id, price_cents, original_price_cents,
+                          discount_percentage, store_id, link, image, rating, availability_id,
+                          created_at, updated_at)
+                     VALUES (NEW.id, NEW.name, NEW.description,
+                             (SELECT id FROM categories
+                              WHERE name = COALESCE(NEW.category, 'Electronics')),
+                             CAST(ROUND(NEW.price * 100) AS INTEGER),
+                             CAST(ROUND(NEW.original_price * 100) AS INTEGER),
+                             COALESCE(NEW.discount_percentage, 0),
+                             (SELECT id FROM stores WHERE name = NEW.store),
+                             NEW.link, NEW.image, COALESCE(NEW.rating, 0),
+                             (SELECT id FROM availability
+                              WHERE name = COALESCE(NEW.availability, 'in_stock')),
+                             COALESCE(NEW.created_at, CURRENT_TIMESTAMP),
+                             COALESCE(NEW.updated_at, CURRENT_TIMESTAMP));
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS products_view_update INSTEAD OF UPDATE ON products
+                 BEGIN
+                     INSERT OR IGNORE INTO stores (name) VALUES (NEW.store);
+                     INSERT OR IGNORE INTO categories (name) VALUES (NEW.category);
+                     INSERT OR IGNORE INTO availability (name) VALUES (NEW.availability);
+                     UPDATE product_records
+                     SET name = NEW.name,
+                         description = NEW.description,
+                         category_id = (SELECT id FROM categories WHERE name = NEW.category),
+                         price_cents = CAST(ROUND(NEW.price * 100) AS INTEGER),
+                         original_price_cents = CAST(ROUND(NEW.original_price * 100) AS INTEGER),
+                         discount_percentage = NEW.discount_percentage,
+                         store_id = (SELECT id FROM stores WHERE name = NEW.store),
+                         link = NEW.link,
+                         image = NEW.image,
+                         rating = NEW.rating,
+                         availability_id = (SELECT id FROM availability WHERE name = NEW.availability),
+                         updated_at = NEW.updated_at
+                     WHERE id = OLD.id;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS products_view_delete INSTEAD OF DELETE ON products
+                 BEGIN
+                     DELETE FROM product_records WHERE id = OLD.id;
+                 END''')
+    
+    # Change-log triggers; name, store and category are logged decoded so consumers need no lookups
+    c.execute('''CREATE TRIGGER IF NOT EXISTS product_records_log_insert
+                 AFTER INSERT ON product_records
+                 BEGIN
+                     INSERT INTO product_changes (product_id, op, name, store, category, new_price)
+                     VALUES (NEW.id, 'insert', NEW.name,
+                             (SELECT name FROM stores WHERE id = NEW.store_id),
+                             (SELECT name FROM categories WHERE id = NEW.category_id),
+                             NEW.price_cents / 100.0);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS product_records_log_update
+                 AFTER UPDATE ON product_records
+                 BEGIN
+                     INSERT INTO product_changes
+                         (product_id, op, name, old_name, store, category, old_price, new_price)
+                     VALUES (NEW.id, 'update', NEW.name, OLD.name,
+                             (SELECT name FROM stores WHERE id = NEW.store_id),
+                             (SELECT name FROM categories WHERE id = NEW.category_id),
+                             OLD.price_cents / 100.0, NEW.price_cents / 100.0);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS product_records_log_delete
+                 AFTER DELETE ON product_records
+                 BEGIN
+                     INSERT INTO product_changes (product_id, op, name, store, category, old_price)
+                     VALUES (OLD.id, 'delete', OLD.name,
+                             (SELECT name FROM stores WHERE id = OLD.store_id),
+                             (SELECT name FROM categories WHERE id = OLD.category_id),
+                             OLD.price_cents / 100.0);
+                 END''')
+
+def _table_type(c, name):
+    c.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,))
+    row = c.fetchone()
+    return row[0] if row else None
+
+def create_catalogue_tables(c):
+    """Create the lookup tables, product_records and the product change log.
+    
+    Every partition file of a partitioned catalogue has these too.
+    """
+    # Stores table
+    c.execute('''CREATE TABLE IF NOT EXISTS stores
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT UNIQUE NOT NULL,
+                  url TEXT,
+                  logo TEXT)''')
+    
+    # Categories table
+    c.execute('''CREATE TABLE IF NOT EXISTS categories
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT UNIQUE NOT NULL,
+                  description TEXT)''')
+    
+    # Availability states (in_stock, out_of_stock, ...)
+    c.execute('''CREATE TABLE IF NOT EXISTS availability
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT UNIQUE NOT NULL)''')
+    
+    # Product storage: store, category and availability as integer codes, prices in cents
+    c.execute('''CREATE TABLE IF NOT EXISTS product_records
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT NOT NULL,
+                  description TEXT,
+                  category_id INTEGER NOT NULL REFERENCES categories(id),
+                  price_cents INTEGER NOT NULL,
+                  original_price_cents INTEGER,
+                  discount_percentage REAL DEFAULT 0,
+                  store_id INTEGER NOT NULL REFERENCES stores(id),
+                  link TEXT NOT NULL,
+                  image TEXT,
+                  rating REAL DEFAULT 0,
+                  availability_id INTEGER NOT NULL REFERENCES availability(id),
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  UNIQUE(name, store_id, price_cents))''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_product_records_store
+                 ON product_records (store_id, price_cents)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_product_records_category
+                 ON product_records (category_id, price_cents)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_product_records_created
+                 ON product_records (created_at)''')
+    
+    # Change log for incremental consumers, filled by triggers so every writer is captured.
+    # name is the new name (old name for deletes); old_name is set on updates.
+    c.execute('''CREATE TABLE IF NOT EXISTS product_changes
+                 (seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                  product_id INTEGER NOT NULL,
+                  op TEXT NOT NULL,
+                  name TEXT,
+                  old_name TEXT,
+                  store TEXT,
+                  category TEXT,
+                  old_price REAL,
+                  new_price REAL,
+                  changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+def init_db(run_migrations=True):
+    """Create the current schema if missing, then apply pending migrations.
+    
+    A database stamped with SCHEMA_VERSION is left alone after a single PRAGMA read.
+    """
     with get_db() as conn:
         c = conn.cursor()
-        
-        # Products table with enhanced fields
-        c.execute('''CREATE TABLE IF NOT EXISTS products
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      name TEXT NOT NULL,
-                      description TEXT,
-                      category TEXT NOT NULL,
-                      price REAL NOT NULL,
-                      original_price REAL,
-                      discount_percentage REAL DEFAULT 0,
-                      store TEXT NOT NULL,
-                      link TEXT NOT NULL,
-                      image TEXT,
-                      rating REAL DEFAULT 0,
-                      availability TEXT DEFAULT 'in_stock',
-                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                      updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                      UNIQUE(name, store, price))''')
-        
-        # Stores table
-        c.execute('''CREATE TABLE IF NOT EXISTS stores
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      name TEXT UNIQUE NOT NULL,
-                      url TEXT,
-                      logo TEXT)''')
-        
-        # Categories table
-        c.execute('''CREATE TABLE IF NOT EXISTS categories
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      name TEXT UNIQUE NOT NULL,
-                      description TEXT)''')
-        
-        # Comparison history table (for tracking user comparisons)
-        c.execute('''CREATE TABLE IF NOT EXISTS comparisons
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      product_ids TEXT NOT NULL,
-                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-        
-        conn.commit()
+        c.execute("PRAGMA user_version")
+        current = c.fetchone()[0] == SCHEMA_VERSION
+        if not current:
+            _create_schema(conn)
+    
+    # Codes cached from a previously opened database are meaningless for this one
+    for codes in (store_codes, category_codes, availability_codes):
+        codes.clear()
+    
+    if run_migrations and not current:
+        from migrations import migrate
+        migrate()
+        # Stamped only once every migration has finished, so an interrupted backfill resumes
+        with get_db() as conn:
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+
+def _create_schema(conn):
+    """Create every table, index and view the current code expects."""
+    c = conn.cursor()
+    
+    # WAL lets readers continue while a writer (or a migration batch) holds the lock
+    c.execute("PRAGMA journal_mode=WAL")
+    
+    create_catalogue_tables(c)
+    
+    # Comparison history table (for tracking user comparisons)
+    c.execute('''CREATE TABLE IF NOT EXISTS comparisons
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  product_ids TEXT NOT NULL,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    
+    # Rolled-up "frequently compared together" pairs (product_a < product_b)
+    c.execute('''CREATE TABLE IF NOT EXISTS comparison_pairs
+                 (product_a INTEGER NOT NULL,
+                  product_b INTEGER NOT NULL,
+                  times_compared INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (product_a, product_b))''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_comparison_pairs_count
+                 ON comparison_pairs (times_compared DESC)''')
+    
+    # High-water marks for incremental rollups, and write counters of derived tables
+    c.execute('''CREATE TABLE IF NOT EXISTS rollup_state
+                 (name TEXT PRIMARY KEY,
+                  last_id INTEGER NOT NULL DEFAULT 0)''')
+    
+    # Last change sequence number processed by each persistent consumer
+    c.execute('''CREATE TABLE IF NOT EXISTS change_checkpoints
+                 (consumer TEXT PRIMARY KEY,
+                  seq INTEGER NOT NULL DEFAULT 0,
+                  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    
+    # Price-drop watches on one listing (product_id) or on every store's listing of a
+    # product (product_name). created_seq keeps older changes from firing new watches.
+    c.execute('''CREATE TABLE IF NOT EXISTS price_watches
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  user_id TEXT NOT NULL,
+                  product_id INTEGER,
+                  product_name TEXT,
+                  threshold REAL NOT NULL,
+                  active INTEGER NOT NULL DEFAULT 1,
+                  created_seq INTEGER NOT NULL DEFAULT 0,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  CHECK (product_id IS NOT NULL OR product_name IS NOT NULL))''')
+    # Partial indexes ordered by threshold: a price change range-scans only the watches it crosses
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_price_watches_product
+                 ON price_watches (product_id, threshold)
+                 WHERE active = 1 AND product_id IS NOT NULL''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_price_watches_name
+                 ON price_watches (product_name, threshold)
+                 WHERE active = 1 AND product_name IS NOT NULL''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_price_watches_user
+                 ON price_watches (user_id)''')
+    
+    # Triggered alerts waiting for delivery; one row per watch per price change
+    c.execute('''CREATE TABLE IF NOT EXISTS alert_outbox
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  watch_id INTEGER NOT NULL,
+                  user_id TEXT NOT NULL,
+                  product_id INTEGER NOT NULL,
+                  change_seq INTEGER NOT NULL,
+                  price REAL NOT NULL,
+                  threshold REAL NOT NULL,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  delivered_at TIMESTAMP,
+                  UNIQUE (watch_id, change_seq))''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_alert_outbox_pending
+                 ON alert_outbox (id) WHERE delivered_at IS NULL''')
+    
+    create_similar_products_table(c)
+    
+    # A plain products table from before product_records is copied over by migration 2,
+    # which creates the view in its place when it finishes
+    if _table_type(c, 'products') != 'table':
+        create_product_views(c)
+    
+    conn.commit()
+
+def create_similar_products_table(c):
+    """Nearest-neighbour lists written by similar.py, read by /products/<id>/similar."""
+    c.execute('''CREATE TABLE IF NOT EXISTS similar_products
+                 (product_id INTEGER NOT NULL,
+                  rank INTEGER NOT NULL,
+                  similar_id INTEGER NOT NULL,
+                  score REAL NOT NULL,
+                  PRIMARY KEY (product_id, rank)) WITHOUT ROWID''')
 
 def insert_product(name, price, store, link, image, category="Electronics", 
                    description="", original_price=None, rating=0, availability="in_stock"):
     """Insert a product into the database."""
     try:
-        with get_db() as conn:
+        row = _product_record_values(name, price, store, link, image, category, description,
+                                     original_price, rating, availability)
+        with _catalogue_writer(row) as conn:
             c = conn.cursor()
-            discount = 0
-            if original_price and original_price > price:
-                discount = round(((original_price - price) / original_price) * 100, 2)
-            
-            c.execute('''INSERT INTO products 
-                        (name, price, store, link, image, category, description, 
-                         original_price, discount_percentage, rating, availability)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                     (name, price, store, link, image, category, description,
-                      original_price, discount, rating, availability))
+            c.execute('''INSERT INTO product_records 
+                        (name, price_cents, store_id, link, image, category_id, description, 
+                         original_price_cents, discount_percentage, rating, availability_id)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', row)
             conn.commit()
             return c.lastrowid
     except sqlite3.IntegrityError:
         # Product already exists
         return None
 
-def get_all_products(limit=None, offset=0):
-    """Get all products with pagination."""
+def _product_record_values(name, price, store, link, image, category, description,
+                           original_price, rating, availability):
+    """Encode product fields as a product_records row (integer codes and cents)."""
+    discount = 0
+    if original_price and original_price > price:
+        discount = round(((original_price - price) / original_price) * 100, 2)
+    return (name, _to_cents(price), store_codes.code(store, create=True), link, image,
+            category_codes.code(category, create=True), description, _to_cents(original_price),
+            discount, rating, availability_codes.code(availability, create=True))
+
+def insert_products(products, chunk_size=1000):
+    """Bulk insert products, one transaction per chunk. Duplicates are skipped.
+    
+    Products are dicts or records with a record_fields() method (ingest.Product).
+    On a partitioned catalogue each chunk holds rows for a single partition.
+    Returns the number of rows actually inserted.
+    """
+    inserted = 0
+    batches = {}
+    for product in products:
+        if isinstance(product, dict):
+            row = _product_record_values(
+                product['name'], product['price'], product['store'], product['link'],
+                product.get('image', ''), product.get('category', 'Electronics'),
+                product.get('description', ''), product.get('original_price'),
+                product.get('rating', 0), product.get('availability', 'in_stock'))
+        else:
+            row = _product_record_values(*product.record_fields())
+        partition = _partition_of(row)
+        batch = batches.setdefault(partition, [])
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            inserted += _insert_product_rows(batch)
+            batches[partition] = []
+    for batch in batches.values():
+        if batch:
+            inserted += _insert_product_rows(batch)
+    return inserted
+
+def _insert_product_rows(rows):
+    with _catalogue_writer(rows[0]) as conn:
+        c = conn.cursor()
+        c.executemany('''INSERT OR IGNORE INTO product_records
+                         (name, price_cents, store_id, link, image, category_id, description,
+                          original_price_cents, discount_percentage, rating, availability_id)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+        conn.commit()
+        # rowcount excludes the change-log rows written by the insert trigger
+        return max(c.rowcount, 0)
+
+def _partition_of(row):
+    """The partition a product_records row (as built by _product_record_values) belongs in."""
+    if _partitions is None:
+        return None
+    return _partitions.partition_for(store_id=row[2], category_id=row[5])
+
+@contextmanager
+def _catalogue_writer(row):
+    """Connection for writing `row` to product_records: DATABASE, or the row's partition."""
+    if _partitions is None:
+        with get_db() as conn:
+            yield conn
+    else:
+        with _partitions.writer(_partition_of(row)) as conn:
+            yield conn
+
+def _query_catalogue(sql, params=(), sort_key=None, reverse=False, limit=None, offset=0,
+                     store_id=None, category_id=None, product_ids=None):
+    """Run a read-only query over product_records and return its rows.
+    
+    `sql` ends with its ORDER BY, if any; LIMIT and OFFSET are added here. On a
+    partitioned catalogue the query runs in parallel on every partition that
+    can hold matching rows (one file when store_id, category_id or product_ids
+    pin the partition), each returning its first offset + limit rows. The
+    sorted results are combined with a k-way heap merge on `sort_key` (which
+    must match the ORDER BY; `reverse` for DESC) before OFFSET and LIMIT apply.
+    Queries without a sort_key get the partitions' rows concatenated.
+    """
+    if _partitions is None:
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params = (*params, limit, offset)
+        with get_read_db() as conn:
+            c = conn.cursor()
+            c.execute(sql, params)
+            return c.fetchall()
+    
+    if limit is not None:
+        sql += " LIMIT ?"
+        params = (*params, offset + limit)
+    partitions = _partitions.route(store_id=store_id, category_id=category_id,
+                                   product_ids=product_ids)
+    results = _partitions.scatter(sql, params, partitions)
+    if sort_key is None or len(results) == 1:
+        rows = chain.from_iterable(results)
+    else:
+        rows = heapq.merge(*results, key=sort_key, reverse=reverse)
+    return list(islice(rows, offset, None if limit is None else offset + limit))
+
+def read_catalogue(queries):
+    """Run read-only queries over product_records as of one change-log position.
+    
+    Returns (seq, results), where results[i] holds the rows of queries[i] from
+    every partition and seq is the last change they reflect, so a consumer can
+    bootstrap from the rows and follow the change feed from seq.
+    """
+    if _partitions is not None:
+        return _partitions.read_consistent(queries)
     with get_db() as conn:
         c = conn.cursor()
-        if limit:
-            c.execute("SELECT * FROM products ORDER BY created_at DESC LIMIT ? OFFSET ?", 
-                     (limit, offset))
-        else:
-            c.execute("SELECT * FROM products ORDER BY created_at DESC")
-        rows = c.fetchall()
-    return [dict(row) for row in rows]
+        c.execute("BEGIN")
+        seq = latest_change_seq(conn)
+        results = []
+        for sql in queries:
+            c.execute(sql)
+            results.append(c.fetchall())
+        conn.commit()
+    return seq, results
+
+def relay_partition_changes():
+    """Copy partition change logs into DATABASE's log; a no-op unless partitioned."""
+    if _partitions is None:
+        return 0
+    return _partitions.relay_changes()
+
+def _newest_first(row):
+    return row['created_at']
+
+def _best_rated_first(row):
+    return (row['rating'] or 0, row['created_at'])
+
+def _cheapest_first(row):
+    return row['price_cents']
+
+def get_all_products(limit=None, offset=0):
+    """Get all products with pagination."""
+    rows = _query_catalogue(f"SELECT {_RECORD_COLUMNS} FROM product_records ORDER BY created_at DESC",
+                            sort_key=_newest_first, reverse=True, limit=limit or None,
+                            offset=offset if limit else 0)
+    return [_product_from_record(row) for row in rows]
 
 def search_products(query, limit=50):
     """Search products by name or description."""
-    with get_db() as conn:
-        c = conn.cursor()
-        search_term = f"%{query}%"
-        c.execute('''SELECT * FROM products 
-                     WHERE name LIKE ? OR description LIKE ? 
-                     ORDER BY rating DESC, created_at DESC 
-                     LIMIT ?''', (search_term, search_term, limit))
-        rows = c.fetchall()
-    return [dict(row) for row in rows]
+    search_term = f"%{query}%"
+    rows = _query_catalogue(f'''SELECT {_RECORD_COLUMNS} FROM product_records 
+                                WHERE name LIKE ? OR description LIKE ? 
+                                ORDER BY rating DESC, created_at DESC''',
+                            (search_term, search_term), sort_key=_best_rated_first, reverse=True,
+                            limit=limit)
+    return [_product_from_record(row) for row in rows]
 
 def filter_products(category=None, min_price=None, max_price=None, 
-                   store=None, min_rating=None, availability=None):
-    """Filter products by various criteria."""
-    with get_db() as conn:
-        c = conn.cursor()
-        query = "SELECT * FROM products WHERE 1=1"
-        params = []
-        
-        if category:
-            query += " AND category = ?"
-            params.append(category)
-        
-        if min_price is not None:
-            query += " AND price >= ?"
-            params.append(min_price)
-        
-        if max_price is not None:
-            query += " AND price <= ?"
-            params.append(max_price)
-        
-        if store:
-            query += " AND store = ?"
-            params.append(store)
-        
-        if min_rating is not None:
-            query += " AND rating >= ?"
-            params.append(min_rating)
-        
-        if availability:
-            query += " AND availability = ?"
-            params.append(availability)
-        
-        query += " ORDER BY price ASC"
-        c.execute(query, params)
-        rows = c.fetchall()
+                   store=None, min_rating=None, availability=None, limit=None, offset=0):
+    """Filter products by various criteria, cheapest first. limit=None returns every match."""
+    query = f"SELECT {_RECORD_COLUMNS} FROM product_records WHERE 1=1"
+    params = []
     
-    return [dict(row) for row in rows]
+    # Names are resolved to codes up front; an unknown name can't match anything
+    if category:
+        category_id = category_codes.code(category)
+        if category_id is None:
+            return []
+        query += " AND category_id = ?"
+        params.append(category_id)
+    
+    if min_price is not None:
+        query += " AND price_cents >= ?"
+        params.append(_to_cents(min_price))
+    
+    if max_price is not None:
+        query += " AND price_cents <= ?"
+        params.append(_to_cents(max_price))
+    
+    if store:
+        store_id = store_codes.code(store)
+        if store_id is None:
+            return []
+        query += " AND store_id = ?"
+        params.append(store_id)
+    
+    if min_rating is not None:
+        query += " AND rating >= ?"
+        params.append(min_rating)
+    
+    if availability:
+        availability_id = availability_codes.code(availability)
+        if availability_id is None:
+            return []
+        query += " AND availability_id = ?"
+        params.append(availability_id)
+    
+    query += " ORDER BY price_cents ASC"
+    rows = _query_catalogue(query, params, sort_key=_cheapest_first, limit=limit, offset=offset,
+                            store_id=store_id if store else None,
+                            category_id=category_id if category else None)
+    
+    return [_product_from_record(row) for row in rows]
 
 def get_product_by_id(product_id):
     """Get a single product by ID."""
-    with get_db() as conn:
-        c = conn.cursor()
-        c.execute("SELECT * FROM products WHERE id = ?", (product_id,))
-        row = c.fetchone()
-    return dict(row) if row else None
+    cached = product_cache.get(product_id)
+    if cached is not None:
+        return dict(cached)
+    
+    rows = _query_catalogue(f"SELECT {_RECORD_COLUMNS} FROM product_records WHERE id = ?",
+                            (product_id,), product_ids=[product_id])
+    
+    if not rows:
+        return None
+    product = _product_from_record(rows[0])
+    product_cache.put(product_id, product)
+    return dict(product)
 
 def get_products_by_ids(product_ids):
-    """Get multiple products by IDs for comparison."""
+    """Get multiple products by IDs, in the order requested. Unknown IDs are skipped."""
     if not product_ids:
         return []
     
+    found = {}
+    missing = []
+    for product_id in dict.fromkeys(product_ids):
+        cached = product_cache.get(product_id)
+        if cached is not None:
+            found[product_id] = cached
+        else:
+            missing.append(product_id)
+    
+    for start in range(0, len(missing), MAX_IN_PARAMS):
+        chunk = missing[start:start + MAX_IN_PARAMS]
+        placeholders = ','.join('?' * len(chunk))
+        rows = _query_catalogue(f"SELECT {_RECORD_COLUMNS} FROM product_records WHERE id IN ({placeholders})",
+                                chunk, product_ids=chunk)
+        for row in rows:
+            product = _product_from_record(row)
+            found[product['id']] = product
+            product_cache.put(product['id'], product)
+    
+    return [dict(found[product_id]) for product_id in dict.fromkeys(product_ids)
+            if product_id in found]
+
+def get_all_stores():
+    """Get all stores that have at least one product."""
+    rows = _query_catalogue('''SELECT name FROM stores s
+                               WHERE EXISTS (SELECT 1 FROM product_records WHERE store_id = s.id)''')
+    return sorted({row[0] for row in rows})
+
+def get_all_categories():
+    """Get all categories that have at least one product."""
+    rows = _query_catalogue('''SELECT name FROM categories cat
+                               WHERE EXISTS (SELECT 1 FROM product_records WHERE category_id = cat.id)''')
+    return sorted({row[0] for row in rows})
+
+def get_products_by_store(store):
+    """Get all products from a specific store."""
+    store_id = store_codes.code(store)
+    if store_id is None:
+        return []
+    rows = _query_catalogue(f"SELECT {_RECORD_COLUMNS} FROM product_records WHERE store_id = ? ORDER BY price_cents ASC",
+                            (store_id,), sort_key=_cheapest_first, store_id=store_id)
+    return [_product_from_record(row) for row in rows]
+
+def get_products_by_category(category):
+    """Get all products in a specific category."""
+    category_id = category_codes.code(category)
+    if category_id is None:
+        return []
+    rows = _query_catalogue(f"SELECT {_RECORD_COLUMNS} FROM product_records WHERE category_id = ? ORDER BY rating DESC",
+                            (category_id,), sort_key=lambda row: row['rating'] or 0, reverse=True,
+                            category_id=category_id)
+    return [_product_from_record(row) for row in rows]
+
+def get_price_comparison(product_name, limit=None):
+    """Get price comparison for a specific product across all stores, cheapest first.
+    limit=None returns every match."""
+    rows = _query_catalogue('''SELECT store_id, price_cents, link FROM product_records 
+                               WHERE name LIKE ? 
+                               ORDER BY price_cents ASC''', (f"%{product_name}%",),
+                            sort_key=_cheapest_first, limit=limit)
+    return [{"store": store_codes.name(row['store_id']), "price": row['price_cents'] / 100,
+             "link": row['link']} for row in rows]
+
+# Fields update_product() and batch updates may change
+UPDATABLE_FIELDS = {'name', 'description', 'price', 'original_price',
+                    'discount_percentage', 'rating', 'availability', 'image'}
+
+def update_product(product_id, **kwargs):
+    """Update product fields."""
+    fields_to_update = _record_updates(kwargs)
+    
+    if not fields_to_update:
+        return False
+    
+    set_clause = ', '.join([f"{k} = ?" for k in fields_to_update.keys()])
+    values = list(fields_to_update.values()) + [product_id]
+    updated = _write_by_id(product_id, f"UPDATE product_records SET {set_clause} WHERE id = ?", values)
+    product_cache.invalidate(product_id)
+    return updated
+
+def _record_updates(fields):
+    """Map API fields onto the encoded product_records columns, plus updated_at.
+    
+    Returns {} when none of `fields` is updatable.
+    """
+    record = {k: v for k, v in fields.items() if k in UPDATABLE_FIELDS}
+    if not record:
+        return {}
+    if 'price' in record:
+        record['price_cents'] = _to_cents(record.pop('price'))
+    if 'original_price' in record:
+        record['original_price_cents'] = _to_cents(record.pop('original_price'))
+    if 'availability' in record:
+        record['availability_id'] = availability_codes.code(record.pop('availability'), create=True)
+    record['updated_at'] = datetime.now().isoformat()
+    return record
+
+def delete_product(product_id):
+    """Delete a product by ID."""
+    deleted = _write_by_id(product_id, "DELETE FROM product_records WHERE id = ?", (product_id,))
+    product_cache.invalidate(product_id)
+    return deleted
+
+def _write_by_id(product_id, sql, params):
+    """Run an UPDATE or DELETE of one product_records row; returns True if it matched."""
+    if _partitions is None:
+        with get_db() as conn:
+            c = conn.cursor()
+            c.execute(sql, params)
+            conn.commit()
+            return c.rowcount > 0
+    for partition in _partitions.route(product_ids=[product_id]):
+        with _partitions.writer(partition) as conn:
+            c = conn.cursor()
+            c.execute(sql, params)
+            conn.commit()
+            if c.rowcount > 0:
+                return True
+    return False
+
+def apply_product_batch(operations, chunk_size=1000):
+    """Apply validated create/update/delete operations in bulk.
+    
+    Each operation is {"op": "create", "product": {...}} (insert_product's
+    fields), {"op": "update", "id": ..., "fields": {...}} or {"op": "delete",
+    "id": ...}. They are applied chunk_size at a time, each chunk in one
+    transaction per database file, with one executemany per statement shape.
+    Within a chunk creates run first, then updates, then deletes.
+    
+    Returns one (status, product_id) per operation, in order. Status is
+    "created", "duplicate", "updated", "deleted" or "not_found"; a duplicate
+    create reports the id of the product it collided with.
+    """
+    results = [None] * len(operations)
+    for start in range(0, len(operations), chunk_size):
+        chunk = list(enumerate(operations[start:start + chunk_size], start))
+        creates = [(i, op['product']) for i, op in chunk if op['op'] == 'create']
+        updates = [(i, op) for i, op in chunk if op['op'] == 'update']
+        deletes = [(i, op['id']) for i, op in chunk if op['op'] == 'delete']
+        if creates:
+            _batch_create(creates, results)
+        if updates:
+            _batch_update(updates, results)
+        if deletes:
+            _batch_delete(deletes, results)
+    return results
+
+def _batch_create(creates, results):
+    batches = {}
+    for index, product in creates:
+        row = _product_record_values(
+            product['name'], product['price'], product['store'], product['link'],
+            product.get('image', ''), product.get('category', 'Electronics'),
+            product.get('description', ''), product.get('original_price'),
+            product.get('rating', 0), product.get('availability', 'in_stock'))
+        batches.setdefault(_partition_of(row), []).append((index, row))
+    
+    for batch in batches.values():
+        # Rows are identified by their UNIQUE(name, store_id, price_cents) key
+        keys = [(row[0], row[2], row[1]) for _, row in batch]
+        with _catalogue_writer(batch[0][1]) as conn:
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            # AUTOINCREMENT ids only grow, so the rows this insert adds are those above the current max
+            c.execute("SELECT COALESCE(MAX(id), -1) FROM product_records")
+            last_id = c.fetchone()[0]
+            c.executemany('''INSERT OR IGNORE INTO product_records
+                             (name, price_cents, store_id, link, image, category_id, description,
+                              original_price_cents, discount_percentage, rating, availability_id)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', [row for _, row in batch])
+            c.execute("SELECT id, name, store_id, price_cents FROM product_records WHERE id > ?",
+                      (last_id,))
+            created = {tuple(row[1:]): row[0] for row in c.fetchall()}
+            existing = _ids_by_key(c, [key for key in keys if key not in created])
+            conn.commit()
+        
+        for (index, _), key in zip(batch, keys):
+            if key in created:
+                # A later copy of the same row in this batch is a duplicate of this one
+                existing[key] = created.pop(key)
+                results[index] = ("created", existing[key])
+            else:
+                results[index] = ("duplicate", existing.get(key))
+
+def _ids_by_key(c, keys, chunk_size=300):
+    """{(name, store_id, price_cents): id} for the keys that exist in c's database."""
+    found = {}
+    keys = list(set(keys))
+    for start in range(0, len(keys), chunk_size):
+        chunk = keys[start:start + chunk_size]
+        where = ' OR '.join(['(name = ? AND store_id = ? AND price_cents = ?)'] * len(chunk))
+        c.execute(f"SELECT id, name, store_id, price_cents FROM product_records WHERE {where}",
+                  [value for key in chunk for value in key])
+        found.update({tuple(row[1:]): row[0] for row in c.fetchall()})
+    return found
+
+def _batch_update(updates, results):
+    # One executemany per set of changed columns
+    shapes = {}
+    for index, op in updates:
+        record = _record_updates(op['fields'])
+        shapes.setdefault(tuple(record), []).append((op['id'], tuple(record.values())))
+    
+    def write(c, found):
+        for columns, items in shapes.items():
+            set_clause = ', '.join(f"{column} = ?" for column in columns)
+            c.executemany(f"UPDATE product_records SET {set_clause} WHERE id = ?",
+                          [values + (product_id,) for product_id, values in items
+                           if product_id in found])
+    
+    found = _write_by_ids([op['id'] for _, op in updates], write)
+    for index, op in updates:
+        results[index] = ("updated" if op['id'] in found else "not_found", op['id'])
+        product_cache.invalidate(op['id'])
+
+def _batch_delete(deletes, results):
+    def write(c, found):
+        c.executemany("DELETE FROM product_records WHERE id = ?", [(product_id,) for product_id in found])
+    
+    found = _write_by_ids([product_id for _, product_id in deletes], write)
+    deleted = set()
+    for index, product_id in deletes:
+        # Deleting the same id twice in one chunk finds it gone the second time
+        status = "deleted" if product_id in found and product_id not in deleted else "not_found"
+        deleted.add(product_id)
+        results[index] = (status, product_id)
+        product_cache.invalidate(product_id)
+
+def _write_by_ids(product_ids, write, chunk_size=500):
+    """Bulk _write_by_id(): call write(cursor, ids) once per database file.
+    
+    `ids` is the subset of product_ids stored in that file, looked up in the
+    same transaction as the write. Returns the set of ids that were found.
+    """
+    remaining = set(product_ids)
+    partitions = [None] if _partitions is None else _partitions.route(product_ids=list(remaining))
+    for partition in partitions:
+        if not remaining:
+            break
+        with (get_db() if partition is None else _partitions.writer(partition)) as conn:
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                found = set()
+                ids = list(remaining)
+                for start in range(0, len(ids), chunk_size):
+                    chunk = ids[start:start + chunk_size]
+                    c.execute(f"SELECT id FROM product_records WHERE id IN ({','.join('?' * len(chunk))})",
+                              chunk)
+                    found.update(row[0] for row in c.fetchall())
+                if found:
+                    write(c, found)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        remaining -= found
+    return set(product_ids) - remaining
+
+def record_comparisons(comparisons):
+    """Insert a batch of comparison events, each a list of product IDs."""
+    if not comparisons:
+        return 0
+    
     with get_db() as conn:
         c = conn.cursor()
-        placeholders = ','.join('?' * len(product_ids))
-        c.execute(f"SELECT * FROM products WHERE id IN ({placeholders})", product_ids)
+        c.executemany("INSERT INTO comparisons (product_ids) VALUES (?)",
+                      [(json.dumps(product_ids),) for product_ids in comparisons])
+        conn.commit()
+    return len(comparisons)
+
+def rollup_comparison_pairs():
+    """Fold comparisons logged since the last rollup into comparison_pairs."""
+    with get_db() as conn:
+        c = conn.cursor()
+        # Read the watermark under the write lock so concurrent rollups can't both fold the same range
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("SELECT last_id FROM rollup_state WHERE name = 'comparison_pairs'")
+        row = c.fetchone()
+        last_id = row[0] if row else 0
+        
+        c.execute("SELECT id, product_ids FROM comparisons WHERE id > ? ORDER BY id",
+                  (last_id,))
+        rows = c.fetchall()
+        if not rows:
+            conn.rollback()
+            return 0
+        
+        pair_counts = {}
+        for row in rows:
+            product_ids = sorted(set(json.loads(row['product_ids'])))
+            for pair in combinations(product_ids, 2):
+                pair_counts[pair] = pair_counts.get(pair, 0) + 1
+        
+        c.executemany('''INSERT INTO comparison_pairs (product_a, product_b, times_compared)
+                         VALUES (?, ?, ?)
+                         ON CONFLICT(product_a, product_b)
+                         DO UPDATE SET times_compared = times_compared + excluded.times_compared''',
+                      [(a, b, count) for (a, b), count in pair_counts.items()])
+        c.execute('''INSERT INTO rollup_state (name, last_id) VALUES ('comparison_pairs', ?)
+                     ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id''',
+                  (rows[-1]['id'],))
+        conn.commit()
+    return len(rows)
+
+def get_frequently_compared(limit=10):
+    """Get the product pairs most often compared together."""
+    with get_read_db() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT product_a, product_b, times_compared FROM comparison_pairs
+                     ORDER BY times_compared DESC LIMIT ?''', (limit,))
         rows = c.fetchall()
     return [dict(row) for row in rows]
 
-def get_all_stores():
-    """Get all unique stores."""
+def get_similarity_corpus(category_id):
+    """Get (id, name, description, price_cents) for every product in a category."""
+    return _query_catalogue('''SELECT id, name, description, price_cents FROM product_records
+                               WHERE category_id = ?''', (category_id,), category_id=category_id)
+
+def get_category_product_ids(category_id):
+    """Get the ID of every product in a category."""
+    return [row[0] for row in _query_catalogue('''SELECT id FROM product_records WHERE category_id = ?''',
+                                               (category_id,), category_id=category_id)]
+
+def get_similar_thresholds(product_ids, top_k):
+    """{id: score a new neighbour must beat} for the given products that have a list:
+    the top_k-th score, or -1 for lists shorter than top_k."""
+    thresholds = {}
     with get_db() as conn:
         c = conn.cursor()
-        c.execute("SELECT DISTINCT store FROM products ORDER BY store")
-        rows = c.fetchall()
-    return [row[0] for row in rows]
+        for start in range(0, len(product_ids), MAX_IN_PARAMS):
+            chunk = product_ids[start:start + MAX_IN_PARAMS]
+            placeholders = ','.join('?' * len(chunk))
+            c.execute(f'''SELECT product_id, COUNT(*), MIN(score) FROM similar_products
+                          WHERE product_id IN ({placeholders}) GROUP BY product_id''', chunk)
+            for product_id, count, lowest in c.fetchall():
+                thresholds[product_id] = lowest if count >= top_k else -1.0
+    return thresholds
 
-def get_all_categories():
-    """Get all unique categories."""
+def get_renamed_or_repriced(since_seq):
+    """IDs of products whose name or price changed after change `since_seq`."""
     with get_db() as conn:
         c = conn.cursor()
-        c.execute("SELECT DISTINCT category FROM products ORDER BY category")
-        rows = c.fetchall()
-    return [row[0] for row in rows]
+        c.execute('''SELECT DISTINCT product_id FROM product_changes
+                     WHERE seq > ? AND op = 'update'
+                       AND (name IS NOT old_name OR new_price IS NOT old_price)''', (since_seq,))
+        return {row[0] for row in c.fetchall()}
 
-def get_products_by_store(store):
-    """Get all products from a specific store."""
+def get_lists_referencing(similar_ids):
+    """IDs of products whose stored neighbour list includes any of the given products."""
+    referencing = set()
+    similar_ids = list(similar_ids)
+    with get_read_db() as conn:
+        c = conn.cursor()
+        for start in range(0, len(similar_ids), MAX_IN_PARAMS):
+            chunk = similar_ids[start:start + MAX_IN_PARAMS]
+            placeholders = ','.join('?' * len(chunk))
+            c.execute(f'''SELECT DISTINCT product_id FROM similar_products
+                          WHERE similar_id IN ({placeholders})''', chunk)
+            referencing.update(row[0] for row in c.fetchall())
+    return referencing
+
+def get_similar_lists(product_ids):
+    """Get the stored neighbour lists of the given products as {id: [(similar_id, score), ...]}."""
+    lists = {}
+    with get_read_db() as conn:
+        c = conn.cursor()
+        for start in range(0, len(product_ids), MAX_IN_PARAMS):
+            chunk = product_ids[start:start + MAX_IN_PARAMS]
+            placeholders = ','.join('?' * len(chunk))
+            c.execute(f'''SELECT product_id, similar_id, score FROM similar_products
+                          WHERE product_id IN ({placeholders}) ORDER BY product_id, rank''', chunk)
+            for product_id, similar_id, score in c.fetchall():
+                lists.setdefault(product_id, []).append((similar_id, score))
+    return lists
+
+def save_similar_lists(lists, chunk_size=1000):
+    """Replace the neighbour lists of the products in `lists`, one transaction per chunk."""
+    items = list(lists.items())
+    for start in range(0, len(items), chunk_size):
+        chunk = items[start:start + chunk_size]
+        with get_db() as conn:
+            c = conn.cursor()
+            c.executemany("DELETE FROM similar_products WHERE product_id = ?",
+                          [(product_id,) for product_id, _ in chunk])
+            c.executemany('''INSERT INTO similar_products (product_id, rank, similar_id, score)
+                             VALUES (?, ?, ?, ?)''',
+                          [(product_id, rank, similar_id, score)
+                           for product_id, neighbours in chunk
+                           for rank, (similar_id, score) in enumerate(neighbours)])
+            _bump_generation(c, 'similar_products')
+            conn.commit()
+    return len(items)
+
+def delete_similar_lists(keep_ids):
+    """Drop the lists of products not in `keep_ids` (deleted since the last full build)."""
     with get_db() as conn:
         c = conn.cursor()
-        c.execute("SELECT * FROM products WHERE store = ? ORDER BY price ASC", (store,))
+        c.execute("SELECT DISTINCT product_id FROM similar_products")
+        stale = [(row[0],) for row in c.fetchall() if row[0] not in keep_ids]
+        c.executemany("DELETE FROM similar_products WHERE product_id = ?", stale)
+        if stale:
+            _bump_generation(c, 'similar_products')
+        conn.commit()
+    return len(stale)
+
+def _bump_generation(c, name):
+    """Count a write to a derived table, so snapshot publishing notices it."""
+    c.execute('''INSERT INTO rollup_state (name, last_id) VALUES (?, 1)
+                 ON CONFLICT(name) DO UPDATE SET last_id = last_id + 1''', (name,))
+
+def read_watermarks(conn):
+    """Positions that change whenever data served from a snapshot does: the product change
+    log, the comparison rollup and the similar_products write counter."""
+    c = conn.cursor()
+    c.execute("SELECT COALESCE(MAX(seq), 0) FROM product_changes")
+    watermarks = {'product_changes': c.fetchone()[0]}
+    c.execute("SELECT name, last_id FROM rollup_state WHERE name IN ('comparison_pairs', 'similar_products')")
+    watermarks.update({name: 0 for name in ('comparison_pairs', 'similar_products')})
+    watermarks.update(dict(c.fetchall()))
+    return watermarks
+
+def get_similar_products(product_id, limit=10):
+    """Get a product's precomputed nearest neighbours, most similar first, with their scores."""
+    with get_read_db() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT similar_id, score FROM similar_products
+                     WHERE product_id = ? ORDER BY rank LIMIT ?''', (product_id, limit))
         rows = c.fetchall()
-    return [dict(row) for row in rows]
+    scores = {row[0]: row[1] for row in rows}
+    # Neighbours deleted since the last build are skipped by get_products_by_ids
+    products = get_products_by_ids(list(scores))
+    for product in products:
+        product['similarity'] = round(scores[product['id']], 4)
+    return products
 
-def get_products_by_category(category):
-    """Get all products in a specific category."""
+def changes_since(seq, limit=1000):
+    """Get up to `limit` product changes with a sequence number greater than `seq`."""
     with get_db() as conn:
         c = conn.cursor()
-        c.execute("SELECT * FROM products WHERE category = ? ORDER BY rating DESC", (category,))
+        c.execute('''SELECT * FROM product_changes WHERE seq > ?
+                     ORDER BY seq LIMIT ?''', (seq, limit))
         rows = c.fetchall()
     return [dict(row) for row in rows]
 
-def get_price_comparison(product_name):
-    """Get price comparison for a specific product across all stores."""
+def latest_change_seq(conn=None):
+    """Get the sequence number of the most recent product change (0 if none)."""
+    if conn is not None:
+        c = conn.cursor()
+        c.execute("SELECT COALESCE(MAX(seq), 0) FROM product_changes")
+        return c.fetchone()[0]
+    with get_db() as conn:
+        return latest_change_seq(conn)
+
+def get_change_checkpoint(consumer):
+    """Get the last change sequence number a consumer has processed (0 if never run)."""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT seq FROM change_checkpoints WHERE consumer = ?", (consumer,))
+        row = c.fetchone()
+    return row[0] if row else 0
+
+def save_change_checkpoint(consumer, seq):
+    """Record that a consumer has processed every change up to `seq`."""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute('''INSERT INTO change_checkpoints (consumer, seq, updated_at)
+                     VALUES (?, ?, CURRENT_TIMESTAMP)
+                     ON CONFLICT(consumer) DO UPDATE
+                     SET seq = excluded.seq, updated_at = excluded.updated_at''',
+                  (consumer, seq))
+        conn.commit()
+
+def prune_changes(retention_days=7):
+    """Delete changes older than the retention window that every persistent consumer has processed."""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute('''DELETE FROM product_changes
+                     WHERE changed_at < datetime('now', ?)
+                       AND seq <= COALESCE((SELECT MIN(seq) FROM change_checkpoints),
+                                           (SELECT MAX(seq) FROM product_changes))''',
+                  (f"-{int(retention_days)} days",))
+        conn.commit()
+        return c.rowcount
+
+def add_price_watch(user_id, threshold, product_id=None, product_name=None):
+    """Watch a listing or a product name for a price at or below `threshold`."""
     with get_db() as conn:
         c = conn.cursor()
-        c.execute('''SELECT store, price, link FROM products 
-                     WHERE name LIKE ? 
-                     ORDER BY price ASC''', (f"%{product_name}%",))
+        c.execute('''INSERT INTO price_watches (user_id, product_id, product_name, threshold, created_seq)
+                     VALUES (?, ?, ?, ?, ?)''',
+                  (user_id, product_id, product_name, threshold, latest_change_seq(conn)))
+        conn.commit()
+        return c.lastrowid
+
+def get_price_watches(user_id):
+    """Get all of a user's price watches."""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("SELECT * FROM price_watches WHERE user_id = ? ORDER BY id", (user_id,))
         rows = c.fetchall()
     return [dict(row) for row in rows]
 
-def update_product(product_id, **kwargs):
-    """Update product fields."""
-    allowed_fields = {'name', 'description', 'price', 'original_price', 
-                     'discount_percentage', 'rating', 'availability', 'image'}
-    
-    fields_to_update = {k: v for k, v in kwargs.items() if k in allowed_fields}
+def delete_price_watch(watch_id, user_id):
+    """Delete one of a user's price watches."""
+    with get_db() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM price_watches WHERE id = ? AND user_id = ?", (watch_id, user_id))
+        conn.commit()
+        return c.rowcount > 0
+
+def match_price_watches(changes):
+    """Queue alerts for watches whose threshold a batch of product changes crossed.
     
-    if not fields_to_update:
-        return False
+    A watch fires when a price moves from above its threshold to at or below it,
+    so each change reads only the index range new_price <= threshold < old_price.
+    New listings, and listings renamed into a watched name, count as coming from
+    an infinite price. Returns the number of alerts queued.
+    """
+    by_product = []
+    by_name = []
+    for change in changes:
+        new_price = change['new_price']
+        if change['op'] == 'delete' or new_price is None:
+            continue
+        old_price = change['old_price'] if change['op'] == 'update' else float('inf')
+        if new_price < old_price:
+            by_product.append((change['product_id'], change['seq'], new_price,
+                               change['product_id'], new_price, old_price, change['seq']))
+        if change['op'] == 'update' and change['old_name'] != change['name']:
+            old_price = float('inf')
+        if new_price < old_price:
+            by_name.append((change['product_id'], change['seq'], new_price,
+                            change['name'], new_price, old_price, change['seq']))
     
-    fields_to_update['updated_at'] = datetime.now().isoformat()
+    if not by_product and not by_name:
+        return 0
     
+    # UNIQUE (watch_id, change_seq) makes re-running a batch after a crash harmless
+    insert_alerts = '''INSERT OR IGNORE INTO alert_outbox
+                           (watch_id, user_id, product_id, change_seq, price, threshold)
+                       SELECT id, user_id, ?, ?, ?, threshold FROM price_watches
+                       WHERE active = 1 AND {column} = ?
+                         AND threshold >= ? AND threshold < ? AND created_seq < ?'''
     with get_db() as conn:
         c = conn.cursor()
-        set_clause = ', '.join([f"{k} = ?" for k in fields_to_update.keys()])
-        values = list(fields_to_update.values()) + [product_id]
-        
-        c.execute(f"UPDATE products SET {set_clause} WHERE id = ?", values)
+        before = conn.total_changes
+        if by_product:
+            c.executemany(insert_alerts.format(column='product_id'), by_product)
+        if by_name:
+            c.executemany(insert_alerts.format(column='product_name'), by_name)
         conn.commit()
-        return c.rowcount > 0
+        return conn.total_changes - before
 
-def delete_product(product_id):
-    """Delete a product by ID."""
+def get_pending_alerts(limit=500):
+    """Get the oldest undelivered alerts with the listing they fired for."""
     with get_db() as conn:
         c = conn.cursor()
-        c.execute("DELETE FROM products WHERE id = ?", (product_id,))
+        c.execute('''SELECT o.id, o.watch_id, o.user_id, o.product_id, o.price, o.threshold,
+                            o.created_at, r.name, s.name AS store, r.link
+                     FROM alert_outbox o
+                     LEFT JOIN product_records r ON r.id = o.product_id
+                     LEFT JOIN stores s ON s.id = r.store_id
+                     WHERE o.delivered_at IS NULL
+                     ORDER BY o.id LIMIT ?''', (limit,))
+        rows = c.fetchall()
+    alerts = [dict(row) for row in rows]
+    if _partitions is not None:
+        # Listings live in the partition files, not in DATABASE's product_records
+        products = {p['id']: p for p in get_products_by_ids([a['product_id'] for a in alerts])}
+        for alert in alerts:
+            product = products.get(alert['product_id'], {})
+            alert.update(name=product.get('name'), store=product.get('store'), link=product.get('link'))
+    return alerts
+
+def mark_alerts_delivered(alert_ids):
+    """Mark outbox rows as delivered so they leave the pending index."""
+    alert_ids = list(alert_ids)
+    with get_db() as conn:
+        c = conn.cursor()
+        for start in range(0, len(alert_ids), MAX_IN_PARAMS):
+            chunk = alert_ids[start:start + MAX_IN_PARAMS]
+            placeholders = ','.join('?' * len(chunk))
+            c.execute(f'''UPDATE alert_outbox SET delivered_at = CURRENT_TIMESTAMP
+                          WHERE id IN ({placeholders})''', chunk)
         conn.commit()
-        return c.rowcount > 0
+    return len(alert_ids)
 
 def get_statistics():
     """Get database statistics."""
-    with get_db() as conn:
-        c = conn.cursor()
-        
-        c.execute("SELECT COUNT(*) FROM products")
-        total_products = c.fetchone()[0]
-        
-        c.execute("SELECT COUNT(DISTINCT store) FROM products")
-        total_stores = c.fetchone()[0]
-        
-        c.execute("SELECT COUNT(DISTINCT category) FROM products")
-        total_categories = c.fetchone()[0]
-        
-        c.execute("SELECT AVG(price) FROM products")
-        avg_price = c.fetchone()[0]
-        
-        c.execute("SELECT MIN(price), MAX(price) FROM products")
-        min_price, max_price = c.fetchone()
+    totals = _query_catalogue('''SELECT COUNT(*), SUM(price_cents), MIN(price_cents), MAX(price_cents)
+                                 FROM product_records''')
+    total_products = sum(row[0] for row in totals)
+    price_sum = sum(row[1] or 0 for row in totals)
+    minimums = [row[2] for row in totals if row[2] is not None]
+    maximums = [row[3] for row in totals if row[3] is not None]
+    avg_price = price_sum / total_products / 100 if total_products else None
     
     return {
         "total_products": total_products,
-        "total_stores": total_stores,
-        "total_categories": total_categories,
+        "total_stores": len(get_all_stores()),
+        "total_categories": len(get_all_categories()),
         "average_price": round(avg_price, 2) if avg_price else 0,
-        "min_price": min_price,
-        "max_price": max_price
+        "min_price": min(minimums) / 100 if minimums else None,
+        "max_price": max(maximums) / 100 if maximums else None
     }
 
+def count_products():
+    """Count the listings in the catalogue (summed over partitions)."""
+    return sum(row[0] for row in _query_catalogue("SELECT COUNT(*) FROM product_records"))
+
+def get_price_range():
+    """Get the lowest and highest listed price, or (None, None) for an empty catalogue."""
+    rows = _query_catalogue("SELECT MIN(price_cents), MAX(price_cents) FROM product_records")
+    minimums = [row[0] for row in rows if row[0] is not None]
+    maximums = [row[1] for row in rows if row[1] is not None]
+    return (min(minimums) / 100 if minimums else None, max(maximums) / 100 if maximums else None)
+
 # Initialize database on import
 if __name__ == "__main__":
     init_db()
@@ -0,0 +1,366 @@
+"""
+URL frontier for the scrapers.
+
+A crawl starts from a store's pages() and follows the links each page yields
+(pagination, product pages). The frontier decides what to fetch next:
+
+- URLs are canonicalised first: host lowercased, default port and fragment
+  dropped, dot segments resolved, tracking parameters removed and the query
+  sorted. Two spellings of one page are therefore one URL.
+- Seen URLs are remembered in a Bloom filter. 10M URLs at a 0.1% false
+  positive rate take about 20 MB. A false positive means a new URL is
+  skipped, never that a page is fetched twice. It is sized for `capacity`
+  URLs; past that a filter twice as large is stacked on top (and a warning
+  logged), so the false-positive rate stays bounded however large the crawl.
+- Pending URLs wait in SQLite, one queue per host. pop() takes them in turn
+  from each host, so one slow store or one huge listing can't starve the
+  others. With host_delay set it also spaces requests to the same host.
+
+With a path, the frontier is a crawl-state file. Inserts and completions
+stay in an open transaction. checkpoint() saves the Bloom filter and commits
+them together, every `checkpoint_interval` seconds and on close(). A crawl
+that dies is resumed by opening the same file: pages finished before the
+last checkpoint are not fetched again.
+
+    frontier = URLFrontier("crawl/amazon.frontier")
+    frontier.add_many(seeds)
+    while (entry := frontier.pop()) is not None:
+        ...
+        frontier.add_many(links)
+        frontier.done(entry)
+    frontier.close()
+"""
+
+import hashlib
+import json
+import logging
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, quote
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that only track the click; dropping them doesn't change the page
+TRACKING_PARAMS = {'gclid', 'fbclid', 'msclkid', 'dclid', 'yclid', 'mc_cid', 'mc_eid',
+                   'ref', 'ref_', 'qid', 'sr', 'spm', '_encoding'}
+TRACKING_PREFIXES = ('utm_', 'pd_rd_', 'pf_rd_')
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# URLs a frontier's Bloom filter is sized for before it has to grow
+DEFAULT_CAPACITY = 1_000_000
+
+# Characters left as they are when re-quoting paths and queries
+_PATH_SAFE = "/:@!$&'()*+,;=-._~%"
+_PERCENT_ESCAPE = re.compile(r'%[0-9a-fA-F]{2}')
+
+FrontierEntry = namedtuple('FrontierEntry', 'id url context')
+
+
+def canonicalize_url(url: str) -> str:
+    """The canonical spelling of `url`, used both to fetch it and to deduplicate it."""
+    return _canonicalize(url)[0]
+
+
+# Pagination and navigation links repeat on every page of a listing
+@lru_cache(maxsize=16384)
+def _canonicalize(url: str):
+    """(canonical URL, host) for `url`."""
+    scheme, netloc, path, query, _ = urlsplit(url.strip())
+    scheme = scheme.lower()
+    host = netloc.lower()
+    default_port = DEFAULT_PORTS.get(scheme)
+    if default_port and host.endswith(f":{default_port}"):
+        host = host[:-len(str(default_port)) - 1]
+    host = host.rstrip('.')
+
+    if '/.' in path or 'ref=' in path:
+        segments = []
+        for segment in path.split('/'):
+            if segment == '..':
+                if len(segments) > 1:
+                    segments.pop()
+            elif segment != '.' and not segment.startswith('ref='):
+                segments.append(segment)
+        # '/a/b/.' and '/a/b/..' name directories; keep their trailing slash
+        if path.endswith(('/.', '/..')):
+            segments.append('')
+        path = '/'.join(segments)
+    if not path.startswith('/'):
+        path = '/' + path
+    path = quote(path, safe=_PATH_SAFE)
+    if '%' in path:
+        path = _PERCENT_ESCAPE.sub(lambda m: m.group().upper(), path)
+
+    if query:
+        params = [(key, value) for key, value in parse_qsl(query, keep_blank_values=True)
+                  if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)]
+        query = urlencode(sorted(params), quote_via=quote)
+    return urlunsplit((scheme, host, path, query, '')), host
+
+
+class BloomFilter:
+    """Set membership in a fixed bit array: no false negatives, `error_rate` false positives
+    while it holds at most `capacity` items."""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, error_rate: float = 0.001, bits: bytes = None,
+                 count: int = 0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        size = -capacity * math.log(error_rate) / math.log(2) ** 2
+        self.size = max(8, int(math.ceil(size / 8)) * 8)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(bits) if bits is not None else bytearray(self.size // 8)
+        if len(self.bits) * 8 != self.size:
+            raise ValueError("Bloom filter bits don't match its capacity and error rate")
+        self.count = count
+
+    def _positions(self, item: str):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+    def add(self, item: str) -> bool:
+        """Add `item`; returns False if it was (probably) already present."""
+        bits = self.bits
+        added = False
+        for p in self._positions(item):
+            mask = 1 << (p & 7)
+            if not bits[p >> 3] & mask:
+                bits[p >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+            if self.count == self.capacity + 1:
+                logger.warning(f"Bloom filter over capacity ({self.capacity}); "
+                               f"false positives will exceed {self.error_rate:.2%}")
+        return added
+
+    def __len__(self):
+        return self.count
+
+
+class ScalableBloomFilter:
+    """Bloom filters stacked as they fill. When the newest holds `capacity` items
+    another one GROWTH times larger is added, at a tighter error rate, so all of
+    them together stay under `error_rate` false positives."""
+
+    GROWTH = 2
+    # Each filter's error rate is this fraction of the previous one's
+    TIGHTENING = 0.5
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, error_rate: float = 0.001, layers=None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        # error_rate * (1 - TIGHTENING) * (1 + TIGHTENING + TIGHTENING**2 + ...) = error_rate
+        self.layers = layers or [BloomFilter(capacity, error_rate * (1 - self.TIGHTENING))]
+
+    @classmethod
+    def from_state(cls, state: dict):
+        """Rebuild a filter saved by state(); reads the single-filter state of older crawl files too."""
+        if 'bloom_layers' not in state:
+            return cls(state['capacity'], state['error_rate'],
+                       [BloomFilter(state['capacity'], state['error_rate'], state['bloom'], state['seen'])])
+        base_capacity, error_rate, shapes = json.loads(state['bloom_layers'])
+        layers, offset = [], 0
+        for capacity, layer_error_rate, count in shapes:
+            layer = BloomFilter(capacity, layer_error_rate, count=count)
+            layer.bits[:] = state['bloom'][offset:offset + len(layer.bits)]
+            offset += len(layer.bits)
+            layers.append(layer)
+        return cls(base_capacity, error_rate, layers)
+
+    def state(self) -> dict:
+        """frontier_state rows holding the filter."""
+        shapes = [[layer.capacity, layer.error_rate, layer.count] for layer in self.layers]
+        return {'bloom': b''.join(bytes(layer.bits) for layer in self.layers),
+                'bloom_layers': json.dumps([self.capacity, self.error_rate, shapes]),
+                'seen': len(self)}
+
+    def __contains__(self, item: str) -> bool:
+        return any(item in layer for layer in self.layers)
+
+    def add(self, item: str) -> bool:
+        """Add `item`; returns False if it was (probably) already present."""
+        if any(item in layer for layer in self.layers[:-1]):
+            return False
+        newest = self.layers[-1]
+        if newest.count >= newest.capacity:
+            newest = BloomFilter(newest.capacity * self.GROWTH, newest.error_rate * self.TIGHTENING)
+            self.layers.append(newest)
+            logger.warning(f"Seen-URL filter passed {len(self)} URLs (sized for {self.capacity}); "
+                           f"added a filter for {newest.capacity} more. Raise the frontier capacity "
+                           f"to avoid the extra lookups.")
+        return newest.add(item)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(layer.bits) for layer in self.layers)
+
+    def __len__(self):
+        return sum(layer.count for layer in self.layers)
+
+
+class URLFrontier:
+    """Per-host queues of URLs to fetch, deduplicated by a Bloom filter and
+    persisted to a SQLite crawl-state file (or kept in memory without a path)."""
+
+    def __init__(self, path: str = None, capacity: int = DEFAULT_CAPACITY, error_rate: float = 0.001,
+                 host_delay: float = 0.0, checkpoint_interval: float = 30.0, batch_size: int = 256):
+        self.path = path
+        self.host_delay = host_delay
+        self.checkpoint_interval = checkpoint_interval
+        self.batch_size = batch_size
+        self._conn = sqlite3.connect(path or ':memory:', check_same_thread=False)
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS frontier
+                              (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                               host TEXT NOT NULL,
+                               url TEXT NOT NULL,
+                               context TEXT)''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_frontier_host ON frontier (host, id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS frontier_state (key TEXT PRIMARY KEY, value)")
+        self._conn.commit()
+
+        state = dict(self._conn.execute("SELECT key, value FROM frontier_state"))
+        if 'bloom' in state:
+            self.seen = ScalableBloomFilter.from_state(state)
+        else:
+            self.seen = ScalableBloomFilter(capacity, error_rate)
+
+        self._lock = threading.Condition()
+        # Pending rows per host, the rows loaded for it, and the last id loaded
+        self._queued = dict(self._conn.execute("SELECT host, COUNT(*) FROM frontier GROUP BY host"))
+        self._buffers = {}
+        self._loaded = {}
+        self._rotation = deque(self._queued)
+        self._next_allowed = {}
+        self._in_flight = 0
+        self._last_checkpoint = time.monotonic()
+        self.resumed = bool(self._queued)
+        self.stats = {"added": 0, "duplicates": 0, "fetched": 0, "checkpoints": 0}
+        if self.resumed:
+            logger.info(f"Resuming crawl from {path}: {self.pending()} URLs pending")
+
+    def add(self, url: str, context=None) -> bool:
+        """Queue `url` unless it has been seen before. Returns True if it was queued."""
+        return self.add_many([(url, context)]) == 1
+
+    def add_many(self, links) -> int:
+        """Queue the unseen ones of some (url, context) pairs; returns how many were queued."""
+        rows = []
+        with self._lock:
+            for url, context in links:
+                url, host = _canonicalize(url)
+                if not self.seen.add(url):
+                    self.stats["duplicates"] += 1
+                    continue
+                rows.append((host, url, json.dumps(context)))
+            if not rows:
+                return 0
+            self._conn.executemany("INSERT INTO frontier (host, url, context) VALUES (?, ?, ?)", rows)
+            for host, _, _ in rows:
+                if not self._queued.get(host):
+                    self._rotation.append(host)
+                self._queued[host] = self._queued.get(host, 0) + 1
+            self.stats["added"] += len(rows)
+            self._lock.notify_all()
+        return len(rows)
+
+    def pop(self, timeout: float = None):
+        """The next FrontierEntry, taking hosts in turn, or None once the crawl is finished.
+
+        Waits while every pending host is inside its host_delay, or while nothing
+        is pending but fetches still in flight may add links. Returns None early
+        if `timeout` seconds pass first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                wait = None
+                for _ in range(len(self._rotation)):
+                    host = self._rotation.popleft()
+                    ready_at = self._next_allowed.get(host, 0.0)
+                    if ready_at > now:
+                        self._rotation.append(host)
+                        wait = ready_at - now if wait is None else min(wait, ready_at - now)
+                        continue
+                    entry = self._take(host)
+                    if self._queued[host]:
+                        self._rotation.append(host)
+                    self._next_allowed[host] = now + self.host_delay
+                    self._in_flight += 1
+                    self.stats["fetched"] += 1
+                    return entry
+
+                if wait is None and not self._in_flight:
+                    return None
+                if deadline is not None:
+                    if now >= deadline:
+                        return None
+                    wait = min(wait if wait is not None else deadline - now, deadline - now)
+                self._lock.wait(wait)
+
+    def _take(self, host):
+        buffer = self._buffers.get(host)
+        if not buffer:
+            rows = self._conn.execute(
+                "SELECT id, url, context FROM frontier WHERE host = ? AND id > ? ORDER BY id LIMIT ?",
+                (host, self._loaded.get(host, 0), self.batch_size)).fetchall()
+            buffer = self._buffers[host] = deque(
+                FrontierEntry(row_id, url, json.loads(context)) for row_id, url, context in rows)
+            self._loaded[host] = rows[-1][0]
+        self._queued[host] -= 1
+        return buffer.popleft()
+
+    def done(self, entry: FrontierEntry):
+        """Mark a popped entry as fetched; it won't be fetched again after a resume."""
+        with self._lock:
+            self._conn.execute("DELETE FROM frontier WHERE id = ?", (entry.id,))
+            self._in_flight -= 1
+            self._lock.notify_all()
+            if self.path and time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+                self._checkpoint()
+
+    def pending(self) -> int:
+        """URLs queued and not yet popped."""
+        return sum(self._queued.values())
+
+    def checkpoint(self):
+        """Save the Bloom filter and commit queued and finished URLs together."""
+        with self._lock:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        self._conn.executemany("INSERT OR REPLACE INTO frontier_state (key, value) VALUES (?, ?)",
+                               self.seen.state().items())
+        self._conn.commit()
+        self._last_checkpoint = time.monotonic()
+        self.stats["checkpoints"] += 1
+
+    def clear(self):
+        """Forget every URL, seen or pending, so the next crawl starts from its seeds again."""
+        with self._lock:
+            self._conn.execute("DELETE FROM frontier")
+            self._conn.execute("DELETE FROM frontier_state")
+            self._conn.commit()
+            self.seen = ScalableBloomFilter(self.seen.capacity, self.seen.error_rate)
+            self._queued, self._buffers, self._loaded = {}, {}, {}
+            self._rotation.clear()
+
+    def close(self):
+        if self.path:
+            self.checkpoint()
+        self._conn.close()
@@ -0,0 +1,116 @@
+"""
+Batching sink for scraped products.
+
+Scrapers produce Product records: slotted objects whose store, category
+and availability strings are interned, so every listing from one store
+shares a single copy of them. Scraper threads hand the records to a
+ProductSink instead of writing them row by row. One background thread drains
+the queue and writes batches through insert_products, one transaction each,
+so a dozen stores scraping at once never contend for the SQLite write lock.
+The queue holds a few batches at most: if the writer falls behind, producers
+block. Scraper memory is therefore bounded by the batch size, not by the size
+of the crawl. A producer that finds the queue full and no writer thread
+running (never started, or died) writes a batch itself rather than waiting
+forever.
+"""
+
+import logging
+import queue
+import sys
+import threading
+from batching import BatchWriter
+from database import insert_products
+
+logger = logging.getLogger(__name__)
+
+# Batches the sink's queue holds before producers block
+QUEUED_BATCHES = 4
+
+# Seconds a producer waits on a full queue before checking that the writer is alive
+PUT_TIMEOUT = 1.0
+
+
+class Product:
+    """One scraped listing, in the field order insert_products() encodes."""
+
+    __slots__ = ('name', 'price', 'store', 'link', 'image', 'category', 'description',
+                 'original_price', 'rating', 'availability', 'sku')
+
+    def __init__(self, name: str, price: float, store: str, link: str, image: str = '',
+                 category: str = 'Electronics', description: str = '', original_price: float = None,
+                 rating: float = 0, availability: str = 'in_stock', sku: str = None):
+        self.name = name
+        self.price = price
+        self.store = sys.intern(store)
+        self.link = link
+        self.image = image or ''
+        self.category = sys.intern(category)
+        self.description = description or ''
+        self.original_price = original_price
+        self.rating = rating or 0
+        self.availability = sys.intern(availability)
+        self.sku = sku
+
+    @classmethod
+    def from_dict(cls, product):
+        return cls(product['name'], product['price'], product['store'], product['link'],
+                   product.get('image', ''), product.get('category', 'Electronics'),
+                   product.get('description', ''), product.get('original_price'),
+                   product.get('rating', 0), product.get('availability', 'in_stock'), product.get('sku'))
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def record_fields(self):
+        """Arguments for database._product_record_values(), in order."""
+        return (self.name, self.price, self.store, self.link, self.image, self.category,
+                self.description, self.original_price, self.rating, self.availability)
+
+    def __repr__(self):
+        return f"Product({self.name!r}, {self.price!r}, {self.store!r})"
+
+
+class ProductSink(BatchWriter):
+    """Queue Product records (or product dicts) from any thread and insert them in batches
+    from one writer thread."""
+
+    thread_name = "product-sink"
+
+    def __init__(self, batch_size: int = 500, flush_interval: float = 1.0, max_queue: int = None):
+        super().__init__(batch_size, flush_interval, max_queue or QUEUED_BATCHES * batch_size)
+        self.stats = {"received": 0, "inserted": 0, "batches": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._inline = False
+
+    def add(self, products):
+        """Queue products (any iterable, e.g. a generator) for insertion, blocking while the
+        queue is full. Returns how many were queued."""
+        count = 0
+        for product in products:
+            while True:
+                try:
+                    self._queue.put(product, timeout=PUT_TIMEOUT)
+                    break
+                except queue.Full:
+                    if not self.running():
+                        if not self._inline:
+                            logger.warning("Product sink has no writer thread; writing batches inline")
+                            self._inline = True
+                        self._write(self._drain(self.batch_size))
+            count += 1
+        with self._lock:
+            self.stats["received"] += count
+        return count
+
+    def _write(self, batch):
+        try:
+            inserted = insert_products(batch, chunk_size=self.batch_size)
+        except Exception as e:
+            logger.error(f"Failed to insert {len(batch)} scraped products: {str(e)}")
+            with self._lock:
+                self.stats["failed"] += len(batch)
+            return 0
+        with self._lock:
+            self.stats["inserted"] += inserted
+            self.stats["batches"] += 1
+        return inserted
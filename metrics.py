@@ -0,0 +1,195 @@
+"""
+Request and query instrumentation exported in Prometheus text format.
+
+Per-request totals (SQL statements, SQL time, rows fetched) are collected in
+a thread-local while a request is active and folded into histograms when it
+finishes.
+"""
+
+import threading
+
+# Latency buckets in seconds, shared by request and SQL time histograms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 500, 1000, 5000)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter keyed by label values."""
+
+    def __init__(self, name: str, help_text: str, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            labels = _format_labels(zip(self.label_names, label_values))
+            lines.append(f"{self.name}{labels} {_format_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values."""
+
+    def __init__(self, name: str, help_text: str, buckets, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        for label_values, (counts, count, total) in items:
+            base = list(zip(self.label_names, label_values))
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts + [count]):
+                labels = _format_labels(base + [('le', _format_number(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(base)
+            lines.append(f"{self.name}_sum{labels} {_format_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together at /metrics."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+requests_total = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route, method and status.",
+    ("route", "method", "status")))
+request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Request latency by route.",
+    LATENCY_BUCKETS, ("route", "method")))
+request_sql_queries = registry.register(Histogram(
+    "http_request_sql_queries", "SQL statements executed per request.",
+    COUNT_BUCKETS, ("route",)))
+request_sql_seconds = registry.register(Histogram(
+    "http_request_sql_seconds", "Time spent in SQLite per request.",
+    LATENCY_BUCKETS, ("route",)))
+request_rows = registry.register(Histogram(
+    "http_request_rows", "Rows fetched from SQLite per request.",
+    COUNT_BUCKETS, ("route",)))
+response_bytes = registry.register(Histogram(
+    "http_response_bytes", "Serialized response body size.",
+    BYTES_BUCKETS, ("route",)))
+sql_queries_total = registry.register(Counter(
+    "sql_queries_total", "SQL statements executed, including outside requests."))
+coalesced_requests = registry.register(Counter(
+    "http_coalesced_requests_total",
+    "Requests by single-flight role: leader (computed), follower (shared) or timeout.",
+    ("route", "role")))
+admission_rejections = registry.register(Counter(
+    "http_admission_rejections_total",
+    "Requests turned away: rate_limited (429) or overloaded (503).",
+    ("route", "reason")))
+
+_local = threading.local()
+
+
+class RequestStats:
+    """Totals accumulated while a single request is being handled."""
+
+    __slots__ = ('queries', 'sql_seconds', 'rows')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+
+
+def begin_request():
+    """Start collecting query totals for the request on this thread."""
+    _local.stats = RequestStats()
+    return _local.stats
+
+
+def current_request():
+    """Return the RequestStats for this thread, or None outside a request."""
+    return getattr(_local, 'stats', None)
+
+
+def end_request(route, method, status, elapsed, body_size=None):
+    """Record a finished request and stop collecting for this thread."""
+    stats = current_request()
+    _local.stats = None
+
+    requests_total.inc(route, method, str(status))
+    request_duration.observe(elapsed, route, method)
+    if stats is not None:
+        request_sql_queries.observe(stats.queries, route)
+        request_sql_seconds.observe(stats.sql_seconds, route)
+        request_rows.observe(stats.rows, route)
+    if body_size is not None:
+        response_bytes.observe(body_size, route)
+
+
+def record_query(sql, params, elapsed, rows):
+    """Query observer for database.add_query_observer."""
+    sql_queries_total.inc()
+    stats = current_request()
+    if stats is not None:
+        stats.queries += 1
+        stats.sql_seconds += elapsed
+        stats.rows += max(rows, 0)
@@ -0,0 +1,342 @@
+"""
+Versioned schema migrations.
+
+init_db() creates the current schema when it is missing and then calls
+migrate(), which applies every migration not yet recorded in schema_version,
+in order. On a new database the migrations find nothing to do and are just
+recorded. Once they have all finished, init_db() stamps PRAGMA user_version
+with database.SCHEMA_VERSION and later starts skip the schema work entirely.
+A new migration must bump SCHEMA_VERSION, or existing databases never see it.
+
+Data rewrites run as a backfill. Each small batch gets its own short write
+transaction and saves its position in migration_progress. An interrupted
+migration resumes where it stopped. The database runs in WAL mode, so the API
+keeps reading between batches and other writers get the lock back.
+
+A migration that replaces a table copies the rows in batches into the new
+table. Its indexes already exist, so SQLite never builds them in one long
+transaction. Rows changed during the copy are replayed from the product
+change log, so only the final swap blocks writers.
+
+    python migrations.py --status
+    python migrations.py --batch-size 2000 --pause 0.05
+"""
+
+import argparse
+import logging
+import time
+from database import (get_db, init_db, latest_change_seq, create_product_views,
+                      create_similar_products_table, MAX_IN_PARAMS)
+
+logger = logging.getLogger(__name__)
+
+
+def _is_table(c, name):
+    c.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,))
+    row = c.fetchone()
+    return row is not None and row[0] == 'table'
+
+
+class Migration:
+    """One schema change, identified by an increasing version number."""
+
+    version = 0
+    description = ""
+
+    def schema(self, c):
+        """Quick, idempotent DDL run in one transaction before any backfill."""
+
+    def backfill(self, c, last_id, batch_size):
+        """Rewrite one batch of rows after `last_id`. Returns the new position, or None when done."""
+        return None
+
+    def catch_up(self, c, since_seq, limit):
+        """Re-apply up to `limit` product changes after `since_seq`. Returns the seq reached."""
+        return since_seq
+
+    def finish(self, c, since_seq):
+        """Last step, run while holding the write lock once the backfill has caught up."""
+
+
+# Columns the original products table has that the backend/ prototype's table lacks
+LEGACY_PRODUCT_COLUMNS = [
+    ("description", "TEXT"),
+    ("category", "TEXT NOT NULL DEFAULT 'Electronics'"),
+    ("original_price", "REAL"),
+    ("discount_percentage", "REAL DEFAULT 0"),
+    ("rating", "REAL DEFAULT 0"),
+    ("availability", "TEXT DEFAULT 'in_stock'"),
+    ("created_at", "TIMESTAMP"),
+    ("updated_at", "TIMESTAMP"),
+]
+
+
+class LegacyProductsTable(Migration):
+    """Bring a plain products table (including backend/database.py's) to the original
+    column set and log its changes, so migration 2 can copy it while it is in use."""
+
+    version = 1
+    description = "align legacy products table and log its changes"
+
+    def schema(self, c):
+        if not _is_table(c, 'products'):
+            return
+        c.execute("PRAGMA table_info(products)")
+        existing = {row[1] for row in c.fetchall()}
+        # ADD COLUMN only rewrites the schema, not the rows
+        for name, definition in LEGACY_PRODUCT_COLUMNS:
+            if name not in existing:
+                c.execute(f"ALTER TABLE products ADD COLUMN {name} {definition}")
+
+        c.execute('''CREATE TRIGGER IF NOT EXISTS products_log_insert AFTER INSERT ON products
+                     BEGIN
+                         INSERT INTO product_changes (product_id, op, name, store, category, new_price)
+                         VALUES (NEW.id, 'insert', NEW.name, NEW.store, NEW.category, NEW.price);
+                     END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS products_log_update AFTER UPDATE ON products
+                     BEGIN
+                         INSERT INTO product_changes
+                             (product_id, op, name, old_name, store, category, old_price, new_price)
+                         VALUES (NEW.id, 'update', NEW.name, OLD.name, NEW.store, NEW.category,
+                                 OLD.price, NEW.price);
+                     END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS products_log_delete AFTER DELETE ON products
+                     BEGIN
+                         INSERT INTO product_changes (product_id, op, name, store, category, old_price)
+                         VALUES (OLD.id, 'delete', OLD.name, OLD.store, OLD.category, OLD.price);
+                     END''')
+
+
+class ProductRecordsCopy(Migration):
+    """Copy a plain products table into product_records (integer codes, cents), then
+    replace it with the products view."""
+
+    version = 2
+    description = "move products into product_records"
+
+    def backfill(self, c, last_id, batch_size):
+        if not _is_table(c, 'products'):
+            return None
+        c.execute('''SELECT MAX(id) FROM
+                         (SELECT id FROM products WHERE id > ? ORDER BY id LIMIT ?)''',
+                  (last_id, batch_size))
+        upto = c.fetchone()[0]
+        if upto is None:
+            return None
+        self._copy(c, "p.id > ? AND p.id <= ?", (last_id, upto))
+        return upto
+
+    def catch_up(self, c, since_seq, limit):
+        if not _is_table(c, 'products'):
+            return since_seq
+        c.execute('''SELECT seq, product_id FROM product_changes WHERE seq > ?
+                     ORDER BY seq LIMIT ?''', (since_seq, limit))
+        rows = c.fetchall()
+        if not rows:
+            return since_seq
+        # Re-copy each changed row from its current state; deleted rows simply aren't found
+        product_ids = list({row['product_id'] for row in rows})
+        for start in range(0, len(product_ids), MAX_IN_PARAMS):
+            chunk = product_ids[start:start + MAX_IN_PARAMS]
+            placeholders = ','.join('?' * len(chunk))
+            c.execute(f"DELETE FROM product_records WHERE id IN ({placeholders})", chunk)
+            self._copy(c, f"p.id IN ({placeholders})", chunk)
+        return rows[-1]['seq']
+
+    def finish(self, c, since_seq):
+        if _is_table(c, 'products'):
+            seq = since_seq
+            while True:
+                reached = self.catch_up(c, seq, 1000)
+                if reached == seq:
+                    break
+                seq = reached
+            c.execute("DROP TABLE products")
+        create_product_views(c)
+
+    @staticmethod
+    def _copy(c, where, params):
+        for table, column, default in (("stores", "store", "Unknown"),
+                                       ("categories", "category", "Electronics"),
+                                       ("availability", "availability", "in_stock")):
+            c.execute(f'''INSERT OR IGNORE INTO {table} (name)
+                          SELECT DISTINCT COALESCE(p.{column}, '{default}') FROM products p
+                          WHERE {where}''', params)
+        # Rows without a name or price can't be listed; prices that only differed
+        # below a cent collapse into one listing
+        c.execute(f'''INSERT OR IGNORE INTO product_records
+                          (id, name, description, category_id, price_cents, original_price_cents,
+                           discount_percentage, store_id, link, image, rating, availability_id,
+                           created_at, updated_at)
+                      SELECT p.id, p.name, p.description, cat.id,
+                             CAST(ROUND(p.price * 100) AS INTEGER),
+                             CAST(ROUND(p.original_price * 100) AS INTEGER),
+                             COALESCE(p.discount_percentage, 0), s.id, COALESCE(p.link, ''),
+                             p.image, COALESCE(p.rating, 0), a.id,
+                             COALESCE(p.created_at, CURRENT_TIMESTAMP),
+                             COALESCE(p.updated_at, CURRENT_TIMESTAMP)
+                      FROM products p
+                      JOIN stores s ON s.name = COALESCE(p.store, 'Unknown')
+                      JOIN categories cat ON cat.name = COALESCE(p.category, 'Electronics')
+                      JOIN availability a ON a.name = COALESCE(p.availability, 'in_stock')
+                      WHERE {where} AND p.name IS NOT NULL AND p.price IS NOT NULL''', params)
+        c.execute(f'''SELECT p.id FROM products p
+                      WHERE {where} AND p.name IS NOT NULL AND p.price IS NOT NULL
+                        AND NOT EXISTS (SELECT 1 FROM product_records r WHERE r.id = p.id)''', params)
+        dropped = [row[0] for row in c.fetchall()]
+        if dropped:
+            logger.warning(f"Dropped {len(dropped)} products that duplicate another listing once "
+                           f"prices are rounded to cents: ids {dropped[:50]}"
+                           + (" ..." if len(dropped) > 50 else ""))
+
+
+class SimilarProductsTable(Migration):
+    """Add the similar_products table filled by similar.py."""
+
+    version = 3
+    description = "add similar_products neighbour lists"
+
+    def schema(self, c):
+        create_similar_products_table(c)
+
+
+# The last version here must equal database.SCHEMA_VERSION
+MIGRATIONS = [
+    LegacyProductsTable(),
+    ProductRecordsCopy(),
+    SimilarProductsTable(),
+]
+
+
+def _ensure_version_tables(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                 (version INTEGER PRIMARY KEY,
+                  description TEXT,
+                  applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    # Position of an unfinished backfill and the change seq it started replaying from
+    c.execute('''CREATE TABLE IF NOT EXISTS migration_progress
+                 (version INTEGER PRIMARY KEY,
+                  last_id INTEGER NOT NULL DEFAULT 0,
+                  change_seq INTEGER NOT NULL DEFAULT 0)''')
+
+
+def applied_versions():
+    """Get the set of migration versions recorded in schema_version."""
+    with get_db() as conn:
+        c = conn.cursor()
+        _ensure_version_tables(c)
+        conn.commit()
+        c.execute("SELECT version FROM schema_version")
+        return {row[0] for row in c.fetchall()}
+
+
+def migrate(batch_size: int = 1000, pause: float = 0.05, migrations=None):
+    """Apply pending migrations in version order. Returns the versions applied."""
+    applied = applied_versions()
+    pending = [m for m in sorted(migrations or MIGRATIONS, key=lambda m: m.version)
+               if m.version not in applied]
+    done = []
+    for migration in pending:
+        logger.info(f"Applying migration {migration.version}: {migration.description}")
+        started = time.monotonic()
+        if _apply(migration, batch_size, pause):
+            done.append(migration.version)
+            logger.info(f"Migration {migration.version} done in {time.monotonic() - started:.1f}s")
+        else:
+            logger.info(f"Migration {migration.version} was applied by another process")
+    return done
+
+
+def _is_applied(c, version):
+    c.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,))
+    return c.fetchone() is not None
+
+
+def _apply(migration, batch_size, pause):
+    """Run one migration; returns False if another process recorded it first.
+
+    The applied check and the schema_version INSERT run under the write lock,
+    so processes starting at the same time never record a version twice. Two
+    of them may share the backfill, which is idempotent and resumes from the
+    same saved position.
+    """
+    with get_db() as conn:
+        c = conn.cursor()
+
+        c.execute("BEGIN IMMEDIATE")
+        if _is_applied(c, migration.version):
+            conn.rollback()
+            return False
+        migration.schema(c)
+        # Changes after this point are replayed once the backfill has passed them
+        c.execute('''INSERT OR IGNORE INTO migration_progress (version, last_id, change_seq)
+                     VALUES (?, 0, ?)''', (migration.version, latest_change_seq(conn)))
+        conn.commit()
+
+        c.execute("SELECT last_id, change_seq FROM migration_progress WHERE version = ?",
+                  (migration.version,))
+        last_id, change_seq = c.fetchone()
+
+        while True:
+            c.execute("BEGIN IMMEDIATE")
+            position = migration.backfill(c, last_id, batch_size)
+            if position is None:
+                conn.commit()
+                break
+            c.execute("UPDATE migration_progress SET last_id = ? WHERE version = ?",
+                      (position, migration.version))
+            conn.commit()
+            last_id = position
+            if pause:
+                time.sleep(pause)
+
+        # Replay changes in batches until a pass comes up short, leaving little for finish()
+        while True:
+            c.execute("BEGIN IMMEDIATE")
+            reached = migration.catch_up(c, change_seq, batch_size)
+            c.execute("UPDATE migration_progress SET change_seq = ? WHERE version = ?",
+                      (reached, migration.version))
+            conn.commit()
+            replayed = reached - change_seq
+            change_seq = reached
+            if replayed < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+
+        c.execute("BEGIN IMMEDIATE")
+        if _is_applied(c, migration.version):
+            conn.rollback()
+            return False
+        migration.finish(c, change_seq)
+        c.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                  (migration.version, migration.description))
+        c.execute("DELETE FROM migration_progress WHERE version = ?", (migration.version,))
+        conn.commit()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations")
+    parser.add_argument("--status", action="store_true", help="list migrations and exit")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per backfill transaction")
+    parser.add_argument("--pause", type=float, default=0.05,
+                        help="seconds to sleep between batches so other writers get the lock")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_db(run_migrations=False)
+
+    if args.status:
+        applied = applied_versions()
+        for migration in MIGRATIONS:
+            state = "applied" if migration.version in applied else "pending"
+            print(f"{migration.version:>4}  {state:<8} {migration.description}")
+        return
+
+    applied = migrate(args.batch_size, args.pause)
+    print(f"Applied migrations: {applied or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
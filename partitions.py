@@ -0,0 +1,417 @@
+"""
+Partitioned product catalogue: one SQLite file per store (or per category).
+
+All of a catalogue's product rows share one writer lock in products.db, so
+ingest for every store serializes and maintenance touches everything at once.
+With a PartitionedCatalogue installed through database.set_partitions(),
+product_records rows live in `<dir>/store-<code>.db` files. Each file has its
+own write lock, so writers for different stores run concurrently.
+products.db keeps the lookup tables, the change log, alerts, comparisons and
+migrations.
+
+- Routing. Queries pinned to the partition key (get_products_by_store,
+  filter_products with a store) open one file. Other queries fan out to
+  every partition in parallel, and database.py merges their sorted results
+  with a k-way heap merge that keeps ORDER BY and LIMIT.
+- IDs. Partition N allocates product IDs from N << ID_BITS, so an ID names
+  its partition. Rows from before partitioning keep their IDs and are found
+  by fanning out.
+- Connections. Each thread keeps one connection per partition file it has
+  touched. Request threads give theirs back with release() at the end of
+  every request; the fan-out workers are a fixed pool that keeps its own.
+- Change log. Each partition has its own change log. relay_changes(), called
+  by the change feed on every poll, copies that log into products.db in
+  batches. The per-partition position is stored in partition_relay, so every
+  consumer keeps working unchanged, one poll behind the write.
+
+Rows already in products.db stay readable as partition 0. `--split` moves
+them into their partitions without going through the change log:
+
+    python partitions.py --dir partitions --split
+    PRICECOMPARE_PARTITION_DIR=partitions python app.py
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import database
+from database import (
+    get_db, open_connection, create_catalogue_tables, create_product_views, latest_change_seq,
+    store_codes, category_codes, availability_codes, MAX_IN_PARAMS
+)
+
+logger = logging.getLogger(__name__)
+
+# Product IDs in partition N start at N << ID_BITS; IDs stay below 2**53 for JavaScript clients
+ID_BITS = 40
+
+# Partition number of the rows still in products.db
+ROOT = 0
+
+PARTITION_KEYS = {"store": "store_id", "category": "category_id"}
+
+_CHANGE_COLUMNS = "product_id, op, name, old_name, store, category, old_price, new_price, changed_at"
+
+_COPY_COLUMNS = '''id, name, description, category_id, price_cents, original_price_cents,
+                   discount_percentage, store_id, link, image, rating, availability_id,
+                   created_at, updated_at'''
+
+
+class PartitionedCatalogue:
+    """Product rows spread over one SQLite file per store or category code."""
+
+    def __init__(self, directory, key: str = "store", max_workers: int = 8,
+                 check_interval: float = 1.0):
+        if key not in PARTITION_KEYS:
+            raise ValueError(f"Partition key must be one of {', '.join(PARTITION_KEYS)}")
+        self.directory = directory
+        self.key = key
+        self.check_interval = check_interval
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="partition")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._known = set()
+        self._root_has_rows = True
+        self._checked_at = 0.0
+        # (path, lookup table) -> number of codes mirrored into that partition
+        self._mirrored = {}
+        os.makedirs(directory, exist_ok=True)
+        with get_db() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS partition_relay
+                            (partition INTEGER PRIMARY KEY,
+                             seq INTEGER NOT NULL DEFAULT 0)''')
+            conn.commit()
+
+    def path(self, partition):
+        if partition == ROOT:
+            return database.DATABASE
+        return os.path.join(self.directory, f"{self.key}-{partition:04d}.db")
+
+    def partition_for(self, store_id=None, category_id=None):
+        """The partition that holds rows with this store (or category) code."""
+        return store_id if self.key == "store" else category_id
+
+    def partitions(self):
+        """Partition numbers to scan, rechecking the directory every check_interval seconds."""
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                prefix = f"{self.key}-"
+                for name in os.listdir(self.directory):
+                    if name.startswith(prefix) and name.endswith(".db"):
+                        try:
+                            self._known.add(int(name[len(prefix):-3]))
+                        except ValueError:
+                            continue
+                # products.db drops out of fan-outs once --split has emptied it
+                with get_db() as conn:
+                    c = conn.cursor()
+                    c.execute("SELECT EXISTS (SELECT 1 FROM product_records)")
+                    self._root_has_rows = bool(c.fetchone()[0])
+                self._checked_at = now
+        partitions = sorted(self._known)
+        return [ROOT] + partitions if self._root_has_rows else partitions
+
+    def route(self, store_id=None, category_id=None, product_ids=None):
+        """The partitions a query restricted to these codes or IDs needs to read."""
+        partitions = self.partitions()
+        code = self.partition_for(store_id=store_id, category_id=category_id)
+        if code is not None:
+            return [p for p in partitions if p in (ROOT, code)]
+        if product_ids:
+            owners = {product_id >> ID_BITS for product_id in product_ids}
+            if ROOT not in owners:
+                return [p for p in partitions if p in owners]
+        return partitions
+
+    def _connection(self, partition, create=False):
+        """This thread's connection to a partition, or None if the file doesn't exist."""
+        path = self.path(partition)
+        connections = self._local.__dict__.setdefault("connections", {})
+        conn = connections.get(path)
+        if conn is None:
+            if partition != ROOT and not os.path.exists(path):
+                if not create:
+                    return None
+                self._create(partition)
+            conn = open_connection(path)
+            connections[path] = conn
+        return conn
+
+    def release(self):
+        """Close this thread's partition connections; the next query reopens them."""
+        for conn in self._local.__dict__.pop("connections", {}).values():
+            conn.close()
+
+    def close(self):
+        """Close this thread's connections and stop the fan-out workers (and with them theirs)."""
+        self.release()
+        self._pool.shutdown(wait=True)
+
+    def _create(self, partition):
+        with self._lock:
+            conn = open_connection(self.path(partition))
+            try:
+                c = conn.cursor()
+                c.execute("PRAGMA journal_mode=WAL")
+                create_catalogue_tables(c)
+                create_product_views(c)
+                c.execute('''INSERT INTO sqlite_sequence (name, seq)
+                             SELECT 'product_records', ? WHERE NOT EXISTS
+                                 (SELECT 1 FROM sqlite_sequence WHERE name = 'product_records')''',
+                          (partition << ID_BITS,))
+                conn.commit()
+            finally:
+                conn.close()
+            self._known.add(partition)
+        logger.info(f"Created partition {self.path(partition)}")
+
+    @contextmanager
+    def writer(self, partition):
+        """Connection for writing product_records rows in `partition`, created on first use."""
+        conn = self._connection(partition, create=True)
+        try:
+            if partition != ROOT:
+                self._mirror_codes(conn, partition)
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _mirror_codes(self, conn, partition):
+        # The partition's change-log triggers decode names from its own lookup tables,
+        # so they hold copies of products.db's codes (never codes of their own)
+        path = self.path(partition)
+        for table, codes in (("stores", store_codes), ("categories", category_codes),
+                             ("availability", availability_codes)):
+            items = codes.items()
+            key = (path, table)
+            if self._mirrored.get(key, 0) < len(items):
+                conn.executemany(f"INSERT OR IGNORE INTO {table} (id, name) VALUES (?, ?)", items)
+                conn.commit()
+                self._mirrored[key] = len(items)
+
+    def scatter(self, sql, params=(), partitions=None):
+        """Run a read query on each partition in parallel; returns one row list per partition."""
+        if partitions is None:
+            partitions = self.partitions()
+        if len(partitions) <= 1:
+            return [self._read(partition, sql, params) for partition in partitions]
+        futures = [self._pool.submit(self._read, partition, sql, params) for partition in partitions]
+        return [future.result() for future in futures]
+
+    def _read(self, partition, sql, params):
+        conn = self._connection(partition)
+        if conn is None:
+            return []
+        c = conn.cursor()
+        c.execute(sql, params)
+        return c.fetchall()
+
+    def relay_changes(self, batch_size: int = 1000) -> int:
+        """Copy new change-log rows from every partition into products.db. Returns the count."""
+        relayed = 0
+        for partition in self.partitions():
+            if partition == ROOT:
+                continue
+            while True:
+                # Check without the write lock first: most polls find nothing to relay
+                if not self._has_unrelayed(partition):
+                    break
+                with get_db() as root:
+                    c = root.cursor()
+                    c.execute("BEGIN IMMEDIATE")
+                    count, position = self._relay(c, partition, batch_size)
+                    root.commit()
+                self._trim_log(partition, position)
+                relayed += count
+                if count < batch_size:
+                    break
+        return relayed
+
+    def _has_unrelayed(self, partition):
+        """Whether a partition's change log has rows past its relay checkpoint."""
+        conn = self._connection(partition)
+        if conn is None:
+            return False
+        latest = conn.execute("SELECT MAX(seq) FROM product_changes").fetchone()[0]
+        if latest is None:
+            return False
+        with get_db() as root:
+            row = root.execute("SELECT seq FROM partition_relay WHERE partition = ?",
+                               (partition,)).fetchone()
+        return latest > (row[0] if row else 0)
+
+    def _relay(self, c, partition, limit=None, upto=None):
+        """Append a partition's unrelayed changes to the root log inside the caller's
+        write transaction. Returns (changes copied, partition seq reached)."""
+        c.execute("SELECT seq FROM partition_relay WHERE partition = ?", (partition,))
+        row = c.fetchone()
+        position = row[0] if row else 0
+        conn = self._connection(partition)
+        if conn is None:
+            return 0, position
+
+        query = f"SELECT seq, {_CHANGE_COLUMNS} FROM product_changes WHERE seq > ?"
+        params = [position]
+        if upto is not None:
+            query += " AND seq <= ?"
+            params.append(upto)
+        query += " ORDER BY seq"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        pc = conn.cursor()
+        pc.execute(query, params)
+        rows = pc.fetchall()
+        if not rows:
+            return 0, position
+
+        c.executemany(f"INSERT INTO product_changes ({_CHANGE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                      [tuple(row)[1:] for row in rows])
+        position = rows[-1]['seq']
+        c.execute('''INSERT INTO partition_relay (partition, seq) VALUES (?, ?)
+                     ON CONFLICT(partition) DO UPDATE SET seq = excluded.seq''', (partition, position))
+        return len(rows), position
+
+    def _trim_log(self, partition, position):
+        # Relayed rows are only needed in products.db; keep partition logs short
+        if not position:
+            return
+        conn = self._connection(partition)
+        conn.execute("DELETE FROM product_changes WHERE seq <= ?", (position,))
+        conn.commit()
+
+    def read_consistent(self, queries):
+        """database.read_catalogue() for a partitioned catalogue.
+
+        Holds the products.db write lock so nothing else relays meanwhile. Reads
+        each partition in its own read transaction and relays exactly the
+        changes that read saw. The returned seq then covers every row read and
+        nothing later.
+        """
+        results = [[] for _ in queries]
+        trims = []
+        with get_db() as root:
+            c = root.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            for i, sql in enumerate(queries):
+                c.execute(sql)
+                results[i].extend(c.fetchall())
+            for partition in self.partitions():
+                if partition == ROOT:
+                    continue
+                conn = self._connection(partition)
+                if conn is None:
+                    continue
+                pc = conn.cursor()
+                pc.execute("BEGIN")
+                for i, sql in enumerate(queries):
+                    pc.execute(sql)
+                    results[i].extend(pc.fetchall())
+                pc.execute("SELECT COALESCE(MAX(seq), 0) FROM product_changes")
+                cut = pc.fetchone()[0]
+                conn.commit()
+                _, position = self._relay(c, partition, upto=cut)
+                trims.append((partition, position))
+            seq = latest_change_seq(root)
+            root.commit()
+        for partition, position in trims:
+            self._trim_log(partition, position)
+        return seq, results
+
+    def split(self, batch_size: int = 1000) -> int:
+        """Move rows from products.db into their partitions, keeping their IDs.
+
+        The catalogue doesn't change, so the change-log rows the move writes
+        are deleted in the same transactions. Safe to interrupt and rerun.
+        Returns the number of rows moved.
+        """
+        moved = 0
+        while True:
+            with get_db() as root:
+                c = root.cursor()
+                c.execute("BEGIN IMMEDIATE")
+                c.execute(f"SELECT {_COPY_COLUMNS} FROM product_records ORDER BY id LIMIT ?", (batch_size,))
+                rows = c.fetchall()
+                if not rows:
+                    root.commit()
+                    break
+                before = latest_change_seq(root)
+
+                groups = {}
+                for row in rows:
+                    partition = self.partition_for(store_id=row['store_id'], category_id=row['category_id'])
+                    groups.setdefault(partition, []).append(tuple(row))
+                for partition, group in groups.items():
+                    with self.writer(partition) as conn:
+                        pc = conn.cursor()
+                        pc.execute("BEGIN IMMEDIATE")
+                        partition_before = latest_change_seq(conn)
+                        pc.executemany(f'''INSERT OR IGNORE INTO product_records ({_COPY_COLUMNS})
+                                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', group)
+                        pc.execute("DELETE FROM product_changes WHERE seq > ?", (partition_before,))
+                        conn.commit()
+
+                ids = [row['id'] for row in rows]
+                for start in range(0, len(ids), MAX_IN_PARAMS):
+                    chunk = ids[start:start + MAX_IN_PARAMS]
+                    c.execute(f"DELETE FROM product_records WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+                c.execute("DELETE FROM product_changes WHERE seq > ?", (before,))
+                root.commit()
+            moved += len(rows)
+            logger.info(f"Moved {moved} products into partitions")
+        self._checked_at = 0.0
+        return moved
+
+    def status(self):
+        """Row counts and file sizes per partition."""
+        report = []
+        partitions = self.partitions()
+        for partition, rows in zip(partitions,
+                                   self.scatter("SELECT COUNT(*) FROM product_records", (), partitions)):
+            path = self.path(partition)
+            report.append({"partition": partition, "path": path, "products": rows[0][0],
+                           "bytes": os.path.getsize(path)})
+        return report
+
+
+def configure_from_env():
+    """Install a PartitionedCatalogue from PRICECOMPARE_PARTITION_DIR (and
+    PRICECOMPARE_PARTITION_KEY, default "store"); returns it, or None when unset."""
+    directory = os.environ.get('PRICECOMPARE_PARTITION_DIR')
+    if not directory:
+        return None
+    catalogue = PartitionedCatalogue(directory, key=os.environ.get('PRICECOMPARE_PARTITION_KEY', 'store'))
+    database.set_partitions(catalogue)
+    return catalogue
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage a partitioned product catalogue")
+    parser.add_argument("--dir", default="partitions", help="partition directory")
+    parser.add_argument("--db", default=database.DATABASE, help="main database")
+    parser.add_argument("--key", default="store", choices=sorted(PARTITION_KEYS))
+    parser.add_argument("--split", action="store_true",
+                        help="move products from the main database into partitions")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per move transaction")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    database.DATABASE = args.db
+    database.init_db()
+    catalogue = PartitionedCatalogue(args.dir, key=args.key)
+    if args.split:
+        moved = catalogue.split(args.batch_size)
+        print(f"Moved {moved} products")
+    for entry in catalogue.status():
+        print(f"{entry['partition']:>6}  {entry['products']:>9} products  "
+              f"{entry['bytes'] / 1e6:>8.1f} MB  {entry['path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Live price updates for open product pages.
+
+PriceBroadcaster is a change-feed consumer. Every write that changes a
+price goes through the product_changes triggers, so update_product, the
+admin batch endpoint and the scraper's sink all publish here. That includes
+scrapers running in another process, without any of them calling it
+directly. Each change is handed only to the streams watching that product,
+found through a product id -> subscriptions map, so fan-out costs O(watchers
+of the product), not O(connected clients).
+
+Every stream has a bounded buffer. A client that falls buffer_size events
+behind is dropped rather than buffered without limit: its stream ends with a
+`dropped` event. The client reopens the stream and re-reads current prices
+(usePriceStream.js posts its ids to /products/batch), since missed events
+are not replayed. Inserts are never published.
+"""
+
+import threading
+from collections import deque
+from changefeed import ChangeConsumer
+
+
+class Subscription:
+    """One client's stream: the product ids it watches and its pending events."""
+
+    def __init__(self, product_ids, buffer_size: int):
+        self.product_ids = frozenset(product_ids)
+        self.buffer_size = buffer_size
+        self.dropped = False
+        self.closed = False
+        self._events = deque()
+        self._ready = threading.Condition()
+
+    def push(self, event) -> bool:
+        """Queue an event; returns False (and marks the stream dropped) if the buffer is full."""
+        with self._ready:
+            if self.closed:
+                return True
+            if len(self._events) >= self.buffer_size:
+                self.dropped = True
+                self._ready.notify_all()
+                return False
+            self._events.append(event)
+            self._ready.notify_all()
+            return True
+
+    def wait(self, timeout: float):
+        """Pending events, oldest first, waiting up to `timeout` for one. [] on timeout."""
+        with self._ready:
+            if not self._events and not self.dropped and not self.closed:
+                self._ready.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+    def close(self):
+        with self._ready:
+            self.closed = True
+            self._ready.notify_all()
+
+
+class PriceBroadcaster(ChangeConsumer):
+    """Fan price changes out to the Subscriptions watching each product."""
+
+    name = "price_stream"
+
+    def __init__(self, buffer_size: int = 64, max_subscribers: int = 1000):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._watchers = {}
+        self._active = set()
+        self.stats = {"published": 0, "delivered": 0, "dropped": 0}
+
+    def subscribe(self, product_ids):
+        """A new Subscription for `product_ids`, or None if max_subscribers are connected."""
+        subscription = Subscription(product_ids, self.buffer_size)
+        with self._lock:
+            if len(self._active) >= self.max_subscribers:
+                return None
+            self._active.add(subscription)
+            for product_id in subscription.product_ids:
+                self._watchers.setdefault(product_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Stop delivering to `subscription` and wake its reader. Safe to call twice."""
+        subscription.close()
+        with self._lock:
+            if subscription not in self._active:
+                return
+            self._active.discard(subscription)
+            for product_id in subscription.product_ids:
+                watchers = self._watchers.get(product_id)
+                if watchers is not None:
+                    watchers.discard(subscription)
+                    if not watchers:
+                        del self._watchers[product_id]
+
+    def apply(self, changes):
+        for change in changes:
+            if change['op'] == 'delete':
+                event = {"id": change['product_id'], "deleted": True}
+            elif change['op'] == 'update' and change['new_price'] != change['old_price']:
+                event = {"id": change['product_id'], "price": change['new_price'],
+                         "old_price": change['old_price']}
+            else:
+                # Nobody can be watching a product that was just inserted
+                continue
+            self.publish(event)
+
+    def publish(self, event):
+        """Hand `event` to every stream watching event["id"]."""
+        with self._lock:
+            watchers = list(self._watchers.get(event["id"], ()))
+        delivered = 0
+        lagging = []
+        for subscription in watchers:
+            if subscription.push(event):
+                delivered += 1
+            else:
+                lagging.append(subscription)
+        for subscription in lagging:
+            self.unsubscribe(subscription)
+        # Publishers run on several threads; counters only change under the fan-out lock
+        with self._lock:
+            self.stats["published"] += 1
+            self.stats["delivered"] += delivered
+            self.stats["dropped"] += len(lagging)
+
+    def subscribers(self) -> int:
+        return len(self._active)
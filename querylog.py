@@ -0,0 +1,156 @@
+"""
+Slow-query log and per-statement statistics for the database layer.
+
+A QueryTracer hooks every connection opened by get_db(): SQLite's trace
+callback captures the statements as executed (parameters bound), and the
+timing from the instrumented cursor feeds a fingerprint table of count,
+total time, p50 and p99. Statements slower than the threshold are logged
+together with their EXPLAIN QUERY PLAN output.
+"""
+
+import logging
+import re
+import threading
+from collections import deque
+from database import get_db, add_query_observer, add_connection_hook
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\(\s*\?(\s*,\s*\?)*\s*\)')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(\.\d+)?\b')
+
+
+def fingerprint(sql: str) -> str:
+    """Normalize a statement so calls differing only in literals or IN-list length group together."""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class _StatementStats:
+    __slots__ = ('count', 'total', 'max', 'rows', 'samples')
+
+    def __init__(self, sample_size):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.samples = deque(maxlen=sample_size)
+
+
+class QueryTracer:
+    """Collect per-statement timings and log statements slower than a threshold."""
+
+    def __init__(self, slow_ms: float = 100.0, explain: bool = True, sample_size: int = 1000):
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self.sample_size = sample_size
+        self._stats = {}
+        self._plans = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def install(self):
+        """Attach to every connection get_db() opens from now on."""
+        add_connection_hook(self.attach)
+        add_query_observer(self.observe)
+        return self
+
+    def attach(self, conn):
+        """Connection hook: remember the expanded text of each statement SQLite runs."""
+        conn.set_trace_callback(self._on_trace)
+
+    def _on_trace(self, statement):
+        self._local.last_statement = statement
+
+    def observe(self, sql, params, elapsed, rows):
+        """Query observer: fold one statement into the stats and log it if slow."""
+        if getattr(self._local, 'explaining', False):
+            return
+
+        key = fingerprint(sql)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _StatementStats(self.sample_size)
+            stats.count += 1
+            stats.total += elapsed
+            stats.max = max(stats.max, elapsed)
+            stats.rows += rows
+            stats.samples.append(elapsed)
+
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms >= self.slow_ms:
+            executed = getattr(self._local, 'last_statement', None) or sql
+            plan = self._explain(key, sql, params) if self.explain else None
+            logger.warning(
+                f"Slow query ({elapsed_ms:.1f} ms, {rows} rows): {_WHITESPACE.sub(' ', executed).strip()}"
+                f" | params={params!r}"
+                + ("\n  plan:\n    " + "\n    ".join(plan) if plan else "")
+            )
+
+    def _explain(self, key, sql, params):
+        """Return EXPLAIN QUERY PLAN lines for a statement, cached per fingerprint."""
+        if key in self._plans:
+            return self._plans[key]
+        if params is None or not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH')):
+            return None
+
+        self._local.explaining = True
+        try:
+            with get_db() as conn:
+                c = conn.cursor()
+                c.execute("EXPLAIN QUERY PLAN " + sql, params)
+                plan = [row[-1] for row in c.fetchall()]
+        except Exception as e:
+            plan = [f"(plan unavailable: {str(e)})"]
+        finally:
+            self._local.explaining = False
+
+        self._plans[key] = plan
+        return plan
+
+    def dump(self, order_by: str = 'total_ms'):
+        """Return one dict per statement fingerprint, slowest first."""
+        with self._lock:
+            items = [(key, stats.count, stats.total, stats.max, stats.rows, sorted(stats.samples))
+                     for key, stats in self._stats.items()]
+
+        table = []
+        for key, count, total, maximum, rows, samples in items:
+            table.append({
+                "statement": key,
+                "count": count,
+                "total_ms": round(total * 1000, 3),
+                "p50_ms": round(_percentile(samples, 0.50) * 1000, 3),
+                "p99_ms": round(_percentile(samples, 0.99) * 1000, 3),
+                "max_ms": round(maximum * 1000, 3),
+                "rows": rows,
+                "plan": self._plans.get(key)
+            })
+        table.sort(key=lambda entry: entry[order_by], reverse=True)
+        return table
+
+    def format_table(self, limit: int = 20) -> str:
+        """Render the fingerprint table as fixed-width text."""
+        lines = [f"{'count':>8} {'total ms':>10} {'p50 ms':>8} {'p99 ms':>8}  statement"]
+        for entry in self.dump()[:limit]:
+            lines.append(f"{entry['count']:>8} {entry['total_ms']:>10.1f} {entry['p50_ms']:>8.2f} "
+                         f"{entry['p99_ms']:>8.2f}  {entry['statement'][:120]}")
+        return '\n'.join(lines)
+
+    def reset(self):
+        """Forget all collected statistics and cached plans."""
+        with self._lock:
+            self._stats.clear()
+            self._plans.clear()
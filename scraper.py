@@ -1,18 +1,40 @@
 """
 Comprehensive Web Scraper for Price Comparison
 Supports: Amazon, BestBuy, and dummy data generation
+
+Store adapters register themselves by subclassing BaseScraper with a `name`.
+run_scrapers() crawls each store from its pages() on its own worker pool,
+following the links() of every page through a URL frontier, and writes the
+results through one batching ProductSink:
+
+    python scraper.py --list
+    python scraper.py --stores amazon,bestbuy --base-url http://127.0.0.1:8081 --no-delay
+    python scraper.py --stores amazon --crawl-state crawl/    # resumable
 """
 
-import requests
-from bs4 import BeautifulSoup
+import argparse
+import importlib
 import logging
-from database import insert_product, init_db, get_all_products
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from database import insert_product, init_db, count_products
+from alerts import match_pending_alerts
+from ingest import Product, ProductSink
+from structured_data import extract_products, parse_price
+from frontier import URLFrontier, DEFAULT_CAPACITY
+from partitions import configure_from_env as configure_partitions_from_env
+import threading
 import time
 import random
-from typing import List, Dict
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from html import unescape
+from urllib.parse import urljoin, urlparse, parse_qsl, urlencode
+from typing import Iterator, List, Dict, Optional
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# requests and BeautifulSoup are imported where they're used, so the registry,
+# plugins and --list load without them
 logger = logging.getLogger(__name__)
 
 # Headers to avoid blocking
@@ -20,51 +42,424 @@ HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
 }
 
+# Transient statuses worth retrying; anything else (404, 410, ...) fails immediately
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Statuses that mean the store is refusing us; they count against the host's circuit breaker
+BLOCKING_STATUSES = {403, 429, 500, 502, 503, 504}
+
+# Enough of an <a> tag to follow pagination links without building a DOM
+_ANCHOR_TAG = re.compile(r'<a\s[^>]*>', re.I)
+_CLASS_ATTR = re.compile(r'\bclass\s*=\s*["\']([^"\']*)', re.I)
+_HREF_ATTR = re.compile(r'\bhref\s*=\s*["\']([^"\']*)', re.I)
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP date) into seconds."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+class CircuitBreaker:
+    """Per-host circuit breaker.
+    
+    Opens after `failure_threshold` consecutive failures so we stop hammering a
+    store that is blocking us, then lets a single probe through after
+    `reset_timeout` seconds (half-open) to find out whether it has recovered.
+    """
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+    
+    def allow_request(self) -> bool:
+        """Return True if a request to this host may be sent now."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._probing:
+                    logger.warning(f"Circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+# Circuit breakers shared by every scraper instance, keyed by host
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(host: str) -> CircuitBreaker:
+    """Return the shared circuit breaker for a host."""
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker()
+        return _breakers[host]
+
+# Store adapters by registry name, filled in as BaseScraper subclasses are defined
+SCRAPERS = {}
+
 class BaseScraper:
-    """Base class for all scrapers."""
+    """Base class for all scrapers.
     
-    def __init__(self, store_name: str):
+    A subclass that sets `name` is registered in SCRAPERS and picked up by
+    run_scrapers(). Page-based stores implement pages() and parse(); stores
+    that produce their listings some other way override scrape() instead,
+    as a generator. Listings are ingest.Product records.
+    """
+    
+    # Registry key; None keeps a class (e.g. a shared base) out of the registry
+    name = None
+    # Whether run_scrapers() includes the store when no stores are named
+    enabled = True
+    # Pages fetched at once for this store
+    concurrency = 4
+    # Seconds (min, max) each worker waits between pages, to stay under the store's rate limits
+    request_delay = (0.0, 0.0)
+    # Read JSON-LD / embedded state before falling back to parse()
+    structured_data = True
+    # Structured-data listings priced in another currency are dropped
+    currency = "USD"
+    # Text occurring once per result in the DOM listing grid; None trusts structured data alone
+    listing_marker = None
+    # Deepest results page links() follows; None for no limit
+    max_pages = None
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.__dict__.get('name'):
+            SCRAPERS[cls.name] = cls
+    
+    def __init__(self, store_name: str, concurrency: Optional[int] = None, backoff_base: float = 1.0,
+                 backoff_cap: float = 30.0, request_delay: Optional[tuple] = None):
         self.store_name = store_name
+        self.concurrency = concurrency or type(self).concurrency
+        self.request_delay = request_delay if request_delay is not None else type(self).request_delay
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        import requests
+        from requests.adapters import HTTPAdapter
         self.session = requests.Session()
         self.session.headers.update(HEADERS)
+        
+        # Keep-alive pool sized to the number of threads sharing this session;
+        # retries are handled in fetch_page, not by urllib3
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.concurrency, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
+        self.stats = {"requests": 0, "retries": 0, "failures": 0,
+                      "short_circuited": 0, "sleep_seconds": 0.0,
+                      "pages": 0, "empty_pages": 0, "items": 0, "parse_failures": 0,
+                      "structured_pages": 0, "dom_pages": 0, "merged_pages": 0, "links": 0, "duplicate_links": 0,
+                      "bytes": 0, "elapsed": 0.0}
+        self._stats_lock = threading.Lock()
+    
+    def _count(self, key: str, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+    
+    def _backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
     
     def fetch_page(self, url: str, retries: int = 3):
-        """Fetch a page with retry logic."""
+        """Fetch a page, retrying transient failures with jittered backoff.
+        
+        Returns the page text, or None if the page is missing, the store keeps
+        failing, or the host's circuit breaker is open.
+        """
+        import requests
+        host = urlparse(url).netloc
+        breaker = get_circuit_breaker(host)
+        
         for attempt in range(retries):
+            if not breaker.allow_request():
+                self._count("short_circuited")
+                logger.warning(f"Circuit open for {host}; skipping {url}")
+                return None
+            
+            retry_after = None
+            self._count("requests")
             try:
                 response = self.session.get(url, timeout=10)
-                response.raise_for_status()
-                return response.text
             except requests.RequestException as e:
+                breaker.record_failure()
                 logger.warning(f"Attempt {attempt + 1} failed for {url}: {str(e)}")
-                if attempt < retries - 1:
-                    time.sleep(2 ** attempt)  # Exponential backoff
+            else:
+                self._count("bytes", len(response.content))
+                status = response.status_code
+                if status < 400:
+                    breaker.record_success()
+                    return response.text
+                
+                if status in BLOCKING_STATUSES:
+                    breaker.record_failure()
                 else:
-                    logger.error(f"Failed to fetch {url} after {retries} attempts")
+                    breaker.record_success()
+                
+                if status not in RETRYABLE_STATUSES:
+                    logger.warning(f"Not retrying {url}: HTTP {status}")
+                    self._count("failures")
                     return None
+                
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                logger.warning(f"Attempt {attempt + 1} failed for {url}: HTTP {status}")
+                if retry_after is not None and retry_after > self.backoff_cap:
+                    logger.error(f"Giving up on {url}: Retry-After {retry_after:.0f}s exceeds backoff cap")
+                    self._count("failures")
+                    return None
+            
+            if attempt < retries - 1:
+                delay = self._backoff_delay(attempt, retry_after)
+                self._count("retries")
+                self._count("sleep_seconds", delay)
+                time.sleep(delay)
+        
+        logger.error(f"Failed to fetch {url} after {retries} attempts")
+        self._count("failures")
+        return None
+    
+    def pages(self):
+        """Yield (url, context) for every page to scrape; context is passed to parse()."""
+        return []
     
-    def scrape(self) -> List[Dict]:
-        """Override in subclasses."""
+    def parse(self, html: str, context) -> List[Product]:
+        """Extract products from a fetched page. Override in page-based subclasses."""
         raise NotImplementedError
+    
+    def parse_structured(self, html: str, url: str, context) -> List[Product]:
+        """Products from the page's JSON-LD or embedded state, or [] if it has none."""
+        products = []
+        for item in extract_products(html):
+            product = self.structured_product(item, url, context) if item else None
+            if product:
+                products.append(product)
+            else:
+                self._count("parse_failures")
+        return products
+    
+    def structured_product(self, item: Dict, url: str, context) -> Optional[Product]:
+        """Turn an extracted structured-data item into a Product, or None to drop it.
+        
+        The default treats `context` as the category, as the built-in adapters do.
+        """
+        if item['currency'] and item['currency'].upper() != self.currency:
+            return None
+        if item['url']:
+            link = urljoin(url, item['url'])
+        elif item['sku']:
+            link = f"{url}#sku={item['sku']}"
+        else:
+            return None
+        return Product(item['name'], item['price'], self.store_name, link,
+                       image=urljoin(url, item['image']) if item['image'] else '',
+                       category=context if isinstance(context, str) else 'Electronics',
+                       description=item['description'], rating=item['rating'] or 0,
+                       availability=item['availability'], sku=item['sku'])
+    
+    def links(self, html: str, url: str, context) -> List:
+        """(url, context) pairs to crawl next from a fetched page, e.g. its pagination.
+        
+        Contexts are stored in the crawl state, so they must be JSON-serialisable.
+        The frontier drops URLs that were already seen.
+        """
+        return []
+    
+    def scrape_page(self, url: str, context) -> List[Product]:
+        """Fetch and parse one page, recording page, item and byte counts."""
+        return self.crawl_page(url, context)[0]
+    
+    def crawl_page(self, url: str, context):
+        """Fetch and parse one page; returns (products, links to follow).
+        
+        Structured data is tried first. parse() runs on pages without it, and on
+        pages whose structured data lists fewer items than the listing grid (say, one
+        sponsored JSON-LD product); its extra listings are then merged in.
+        """
+        html = self.fetch_page(url)
+        if not html:
+            return [], []
+        self._count("pages")
+        products = self.parse_structured(html, url, context) if self.structured_data else []
+        if products:
+            self._count("structured_pages")
+            if len(products) < self.listing_size(html):
+                self._count("merged_pages")
+                products = self._merge(products, self.parse(html, context))
+        else:
+            self._count("dom_pages")
+            products = self.parse(html, context)
+        self._count("items", len(products))
+        if not products:
+            self._count("empty_pages")
+        links = self.links(html, url, context)
+        self._count("links", len(links))
+        return products, links
+    
+    def listing_size(self, html: str) -> int:
+        """Results in the page's DOM listing grid, counted by listing_marker (0 without one)."""
+        return html.count(self.listing_marker) if self.listing_marker else 0
+    
+    @staticmethod
+    def _merge(structured: List[Product], parsed: List[Product]) -> List[Product]:
+        """Structured listings plus the DOM-parsed ones they don't already cover."""
+        seen = {product.link or (product.name, product.price) for product in structured}
+        return structured + [product for product in parsed
+                             if (product.link or (product.name, product.price)) not in seen]
+    
+    def _pagination_links(self, html: str, url: str, context, marker: str, page_param: str) -> List:
+        """Links from <a> tags whose class contains `marker`, up to max_pages by `page_param`."""
+        links = []
+        for tag in _ANCHOR_TAG.findall(html):
+            classes = _CLASS_ATTR.search(tag)
+            href = _HREF_ATTR.search(tag)
+            if not (classes and href and marker in classes.group(1)):
+                continue
+            link = urlparse(urljoin(url, unescape(href.group(1))))
+            params = parse_qsl(link.query, keep_blank_values=True)
+            page = dict(params).get(page_param, '1')
+            if not page.isdigit() or (self.max_pages is not None and int(page) > self.max_pages):
+                continue
+            if page == '1':
+                # The first page is the seed URL, which has no page parameter
+                link = link._replace(query=urlencode([(k, v) for k, v in params if k != page_param]))
+            links.append((link.geturl(), context))
+        return links
+    
+    def _pause(self):
+        low, high = self.request_delay
+        if high > 0:
+            time.sleep(random.uniform(low, high))
+    
+    def scrape(self) -> Iterator[Product]:
+        """Scrape every page one at a time, yielding products as each page is parsed."""
+        for url, context in self.pages():
+            yield from self.scrape_page(url, context)
+            self._pause()
+    
+    def run(self, sink, frontier: Optional[URLFrontier] = None) -> Dict:
+        """Crawl from pages() with `concurrency` workers, handing products to `sink` as each
+        page is parsed. Returns the store's stats.
+        
+        Pages come from `frontier` (an in-memory one by default), seeded with
+        pages() and fed with the links() of every fetched page. A frontier
+        with a crawl-state file resumes an interrupted crawl. It is cleared
+        once the crawl finishes, so the next run starts from the seeds.
+        """
+        started = time.monotonic()
+        pages = list(self.pages())
+        if not pages:
+            # Streamed straight into the sink's bounded queue
+            sink.add(self.scrape())
+        else:
+            owns_frontier = frontier is None
+            if owns_frontier:
+                frontier = URLFrontier()
+            frontier.add_many(pages)
+            
+            def work():
+                while True:
+                    entry = frontier.pop()
+                    if entry is None:
+                        return
+                    try:
+                        products, links = self.crawl_page(entry.url, entry.context)
+                        if products:
+                            sink.add(products)
+                        frontier.add_many(links)
+                    except Exception as e:
+                        logger.error(f"{self.store_name} page {entry.url} failed: {str(e)}")
+                    finally:
+                        frontier.done(entry)
+                    self._pause()
+            
+            with ThreadPoolExecutor(max_workers=self.concurrency,
+                                    thread_name_prefix=f"scrape-{self.name}") as pool:
+                for future in [pool.submit(work) for _ in range(self.concurrency)]:
+                    future.result()
+            self.stats["duplicate_links"] = frontier.stats["duplicates"]
+            if owns_frontier:
+                frontier.close()
+            else:
+                frontier.clear()
+        self.stats["elapsed"] = time.monotonic() - started
+        return self.stats
 
 class AmazonScraper(BaseScraper):
     """Scraper for Amazon products."""
     
-    def __init__(self):
-        super().__init__("Amazon")
-        self.base_url = "https://www.amazon.com"
+    name = "amazon"
+    # Amazon blocks scrapers; enable explicitly (e.g. against benchmarks/store_stub.py)
+    enabled = False
+    concurrency = 2
+    request_delay = (2.0, 5.0)
+    max_pages = 5
+    listing_marker = 'data-component-type="s-search-result"'
+    
+    # Search queries by category
+    SEARCHES = {
+        'Phones': 'smartphone',
+        'Laptops': 'laptop computer',
+        'Tablets': 'tablet',
+        'Smartwatches': 'smartwatch'
+    }
+    
+    def __init__(self, base_url: str = "https://www.amazon.com", **kwargs):
+        super().__init__("Amazon", **kwargs)
+        self.base_url = base_url
     
-    def scrape_search_results(self, search_query: str, category: str) -> List[Dict]:
+    def pages(self):
+        for category, query in self.SEARCHES.items():
+            yield f"{self.base_url}/s?k={query}", category
+    
+    def links(self, html: str, url: str, category) -> List:
+        return self._pagination_links(html, url, category, 's-pagination-', 'page')
+    
+    def scrape_search_results(self, search_query: str, category: str) -> List[Product]:
         """Scrape Amazon search results."""
-        products = []
-        search_url = f"{self.base_url}/s?k={search_query}"
-        
         logger.info(f"Scraping Amazon for: {search_query}")
-        html = self.fetch_page(search_url)
-        
-        if not html:
-            return products
-        
+        return self.scrape_page(f"{self.base_url}/s?k={search_query}", category)
+    
+    def parse(self, html: str, category) -> List[Product]:
+        from bs4 import BeautifulSoup
+        products = []
         soup = BeautifulSoup(html, 'html.parser')
         
         # Note: Amazon actively blocks scrapers. This is a template for educational purposes.
@@ -81,28 +476,23 @@ class AmazonScraper(BaseScraper):
                     
                     if title_elem and price_elem and link_elem:
                         title = title_elem.get_text(strip=True)
-                        price_text = price_elem.get_text(strip=True).replace('$', '').replace(',', '')
+                        price_text = price_elem.get_text(strip=True)
                         
-                        try:
-                            price = float(price_text.split('.')[0] + '.' + price_text.split('.')[1][:2])
-                        except:
-                            price = 0
+                        price = parse_price(price_text)
+                        if price is None:
+                            self._count("parse_failures")
+                            continue
                         
                         link = link_elem.get('href', '')
                         if not link.startswith('http'):
                             link = self.base_url + link
                         
-                        products.append({
-                            'name': title,
-                            'price': price,
-                            'store': self.store_name,
-                            'link': link,
-                            'image': '',
-                            'category': category,
-                            'rating': round(random.uniform(3.5, 5.0), 1),
-                            'availability': 'in_stock'
-                        })
+                        products.append(Product(title, price, self.store_name, link, category=category,
+                                                rating=round(random.uniform(3.5, 5.0), 1)))
+                    else:
+                        self._count("parse_failures")
                 except Exception as e:
+                    self._count("parse_failures")
                     logger.debug(f"Error parsing Amazon item: {str(e)}")
                     continue
         
@@ -110,43 +500,44 @@ class AmazonScraper(BaseScraper):
             logger.error(f"Error scraping Amazon: {str(e)}")
         
         return products
-    
-    def scrape(self) -> List[Dict]:
-        """Scrape multiple categories from Amazon."""
-        all_products = []
-        
-        # Search queries by category
-        searches = {
-            'Phones': 'smartphone',
-            'Laptops': 'laptop computer',
-            'Tablets': 'tablet',
-            'Smartwatches': 'smartwatch'
-        }
-        
-        for category, query in searches.items():
-            products = self.scrape_search_results(query, category)
-            all_products.extend(products)
-            time.sleep(random.uniform(2, 5))  # Rate limiting
-        
-        return all_products
 
 class BestBuyScraper(BaseScraper):
     """Scraper for BestBuy products."""
     
-    def __init__(self):
-        super().__init__("BestBuy")
-        self.base_url = "https://www.bestbuy.com"
+    name = "bestbuy"
+    # BestBuy blocks scrapers; enable explicitly (e.g. against benchmarks/store_stub.py)
+    enabled = False
+    concurrency = 2
+    request_delay = (2.0, 5.0)
+    max_pages = 5
+    listing_marker = 'class="sku-item"'
+    
+    # BestBuy category URLs
+    CATEGORIES = {
+        'Phones': '/site/searchpage.jsp?st=phones',
+        'Laptops': '/site/searchpage.jsp?st=laptops',
+        'Tablets': '/site/searchpage.jsp?st=tablets',
+    }
+    
+    def __init__(self, base_url: str = "https://www.bestbuy.com", **kwargs):
+        super().__init__("BestBuy", **kwargs)
+        self.base_url = base_url
     
-    def scrape_category(self, category_url: str, category_name: str) -> List[Dict]:
+    def pages(self):
+        for category_name, path in self.CATEGORIES.items():
+            yield self.base_url + path, category_name
+    
+    def links(self, html: str, url: str, category_name) -> List:
+        return self._pagination_links(html, url, category_name, 'sku-list-page-', 'cp')
+    
+    def scrape_category(self, category_url: str, category_name: str) -> List[Product]:
         """Scrape a BestBuy category."""
-        products = []
-        
         logger.info(f"Scraping BestBuy for: {category_name}")
-        html = self.fetch_page(category_url)
-        
-        if not html:
-            return products
-        
+        return self.scrape_page(category_url, category_name)
+    
+    def parse(self, html: str, category_name) -> List[Product]:
+        from bs4 import BeautifulSoup
+        products = []
         soup = BeautifulSoup(html, 'html.parser')
         
         try:
@@ -160,28 +551,23 @@ class BestBuyScraper(BaseScraper):
                     
                     if title_elem and price_elem and link_elem:
                         title = title_elem.get_text(strip=True)
-                        price_text = price_elem.get_text(strip=True).replace('$', '').replace(',', '')
+                        price_text = price_elem.get_text(strip=True)
                         
-                        try:
-                            price = float(price_text.split()[0])
-                        except:
-                            price = 0
+                        price = parse_price(price_text)
+                        if price is None:
+                            self._count("parse_failures")
+                            continue
                         
                         link = link_elem.get('href', '')
                         if not link.startswith('http'):
                             link = self.base_url + link
                         
-                        products.append({
-                            'name': title,
-                            'price': price,
-                            'store': self.store_name,
-                            'link': link,
-                            'image': '',
-                            'category': category_name,
-                            'rating': round(random.uniform(3.5, 5.0), 1),
-                            'availability': 'in_stock'
-                        })
+                        products.append(Product(title, price, self.store_name, link, category=category_name,
+                                                rating=round(random.uniform(3.5, 5.0), 1)))
+                    else:
+                        self._count("parse_failures")
                 except Exception as e:
+                    self._count("parse_failures")
                     logger.debug(f"Error parsing BestBuy item: {str(e)}")
                     continue
         
@@ -189,25 +575,19 @@ class BestBuyScraper(BaseScraper):
             logger.error(f"Error scraping BestBuy: {str(e)}")
         
         return products
+
+class DummyDataScraper(BaseScraper):
+    """Built-in demo catalogue from generate_dummy_data(); needs no network."""
     
-    def scrape(self) -> List[Dict]:
-        """Scrape multiple categories from BestBuy."""
-        all_products = []
-        
-        # BestBuy category URLs
-        categories = {
-            'Phones': '/site/searchpage.jsp?st=phones',
-            'Laptops': '/site/searchpage.jsp?st=laptops',
-            'Tablets': '/site/searchpage.jsp?st=tablets',
-        }
-        
-        for category_name, path in categories.items():
-            url = self.base_url + path
-            products = self.scrape_category(url, category_name)
-            all_products.extend(products)
-            time.sleep(random.uniform(2, 5))  # Rate limiting
-        
-        return all_products
+    name = "dummy"
+    
+    def __init__(self, **kwargs):
+        super().__init__("Demo", **kwargs)
+    
+    def scrape(self) -> Iterator[Product]:
+        for product in generate_dummy_data():
+            self._count("items")
+            yield Product.from_dict(product)
 
 def generate_dummy_data() -> List[Dict]:
     """Generate comprehensive dummy data for testing."""
@@ -495,56 +875,177 @@ def scrape_and_insert_dummy_data():
             logger.debug(f"Skipped (duplicate): {product['name']} from {product['store']}")
     
     logger.info(f"Dummy data insertion complete: {inserted_count} inserted, {skipped_count} skipped")
+    
+    # New listings can satisfy price watches on their product name
+    match_pending_alerts()
+    
+    # Give the new listings their similar-product lists (and add them to existing ones)
+    from similar import update_similar_products
+    update_similar_products()
     return inserted_count, skipped_count
 
-def scrape_all_sources():
-    """Scrape all sources (currently dummy data only)."""
+def load_scraper_plugins(module_names=None):
+    """Import modules that define extra BaseScraper subclasses so they register.
+    
+    Defaults to the comma-separated PRICECOMPARE_SCRAPER_PLUGINS environment variable.
+    """
+    if module_names is None:
+        module_names = [name.strip() for name in
+                        os.environ.get('PRICECOMPARE_SCRAPER_PLUGINS', '').split(',') if name.strip()]
+    for module_name in module_names:
+        importlib.import_module(module_name)
+
+def run_scrapers(stores: Optional[List[str]] = None, settings: Optional[Dict[str, Dict]] = None,
+                 sink: Optional[ProductSink] = None, crawl_state: Optional[str] = None,
+                 frontier_capacity: int = DEFAULT_CAPACITY) -> Dict[str, Dict]:
+    """Run store adapters in parallel, each with its own worker pool, writing
+    every product through one batching sink.
+    
+    `stores` names registered adapters (default: every enabled one) and
+    `settings` maps a store name to constructor overrides such as base_url,
+    concurrency or request_delay. With `crawl_state`, each store's frontier
+    is checkpointed to <crawl_state>/<store>.frontier, and an interrupted
+    crawl picks up where it stopped. `frontier_capacity` is the number of
+    URLs per store the seen-URL filter is sized for; a crawl that outgrows
+    it still works but logs a warning. Returns per-store stats including
+    pages/sec, items/sec and the parse-failure rate.
+    """
+    settings = settings or {}
+    if stores is None:
+        stores = [name for name, cls in SCRAPERS.items() if cls.enabled]
+    unknown = [name for name in stores if name not in SCRAPERS]
+    if unknown:
+        raise ValueError(f"Unknown stores: {', '.join(unknown)} (registered: {', '.join(sorted(SCRAPERS))})")
+    
+    owns_sink = sink is None
+    if owns_sink:
+        sink = ProductSink()
+        sink.start()
+    
+    scrapers = {name: SCRAPERS[name](**settings.get(name, {})) for name in stores}
+    report = {}
+    
+    if crawl_state:
+        os.makedirs(crawl_state, exist_ok=True)
+    
+    def run_store(name, scraper):
+        path = os.path.join(crawl_state, f"{name}.frontier") if crawl_state else None
+        frontier = URLFrontier(path, capacity=frontier_capacity)
+        try:
+            scraper.run(sink, frontier)
+        except Exception as e:
+            logger.error(f"Scraper {name} failed: {str(e)}")
+        finally:
+            frontier.close()
+        report[name] = store_report(scraper.stats)
+    
+    threads = [threading.Thread(target=run_store, args=(name, scraper), name=f"store-{name}")
+               for name, scraper in scrapers.items()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    if owns_sink:
+        sink.stop()
+    return report
+
+def store_report(stats: Dict) -> Dict:
+    """Add throughput and failure rates to a scraper's raw counters."""
+    elapsed = stats["elapsed"] or 1e-9
+    parsed = stats["items"] + stats["parse_failures"]
+    parsed_pages = stats["structured_pages"] + stats["dom_pages"]
+    return dict(stats,
+                structured_hit_rate=round(stats["structured_pages"] / parsed_pages, 4) if parsed_pages else 0.0,
+                pages_per_sec=round(stats["pages"] / elapsed, 2),
+                items_per_sec=round(stats["items"] / elapsed, 2),
+                parse_failure_rate=round(stats["parse_failures"] / parsed, 4) if parsed else 0.0)
+
+def format_scrape_report(report: Dict[str, Dict]) -> str:
+    """Render run_scrapers() results as a table, slowest store first."""
+    lines = [f"{'store':<12} {'pages':>6} {'items':>7} {'pages/s':>8} {'items/s':>9} "
+             f"{'parse fail':>10} {'structured':>10} {'fetch fail':>10} {'KB':>9} {'secs':>7}"]
+    for name, stats in sorted(report.items(), key=lambda item: item[1]["pages_per_sec"]):
+        lines.append(f"{name:<12} {stats['pages']:>6} {stats['items']:>7} {stats['pages_per_sec']:>8.2f} "
+                     f"{stats['items_per_sec']:>9.1f} {stats['parse_failure_rate']:>10.1%} "
+                     f"{stats['structured_hit_rate']:>10.1%} "
+                     f"{stats['failures']:>10} {stats['bytes'] / 1024:>9.1f} {stats['elapsed']:>7.2f}")
+    return "\n".join(lines)
+
+def scrape_all_sources(stores: Optional[List[str]] = None, settings: Optional[Dict[str, Dict]] = None,
+                       crawl_state: Optional[str] = None, frontier_capacity: int = DEFAULT_CAPACITY):
+    """Scrape every enabled store (or the named ones) into the database.
+    
+    Amazon and BestBuy are registered but disabled by default because they
+    block scrapers; in production use official APIs or services like:
+    - Amazon Product Advertising API
+    - BestBuy API
+    - Newegg API
+    """
     logger.info("Starting scraping process...")
+    load_scraper_plugins()
     
-    all_products = []
-    
-    # Note: Real scrapers are commented out due to anti-scraping measures
-    # In production, use official APIs or services like:
-    # - Amazon Product Advertising API
-    # - BestBuy API
-    # - Newegg API
-    
-    # Try Amazon scraper (may fail due to blocking)
-    # try:
-    #     amazon_scraper = AmazonScraper()
-    #     amazon_products = amazon_scraper.scrape()
-    #     all_products.extend(amazon_products)
-    #     logger.info(f"Scraped {len(amazon_products)} products from Amazon")
-    # except Exception as e:
-    #     logger.error(f"Amazon scraping failed: {str(e)}")
-    
-    # Try BestBuy scraper (may fail due to blocking)
-    # try:
-    #     bestbuy_scraper = BestBuyScraper()
-    #     bestbuy_products = bestbuy_scraper.scrape()
-    #     all_products.extend(bestbuy_products)
-    #     logger.info(f"Scraped {len(bestbuy_products)} products from BestBuy")
-    # except Exception as e:
-    #     logger.error(f"BestBuy scraping failed: {str(e)}")
-    
-    # Insert dummy data
-    dummy_products = generate_dummy_data()
-    for product in dummy_products:
-        insert_product(
-            name=product['name'],
-            price=product['price'],
-            store=product['store'],
-            link=product['link'],
-            image=product['image'],
-            category=product['category'],
-            description=product.get('description', ''),
-            rating=product.get('rating', 0),
-            availability=product.get('availability', 'in_stock')
-        )
+    sink = ProductSink()
+    sink.start()
+    report = run_scrapers(stores, settings, sink, crawl_state, frontier_capacity)
+    sink.stop()
+    
+    logger.info(f"Scrape finished: {sink.stats['received']} products received, "
+                f"{sink.stats['inserted']} new\n{format_scrape_report(report)}")
     
-    logger.info(f"Total products in database: {len(get_all_products())}")
+    # New listings can satisfy price watches on their product name
+    match_pending_alerts()
+    
+    # Give the new listings their similar-product lists (and add them to existing ones)
+    from similar import update_similar_products
+    update_similar_products()
+    logger.info(f"Total products in database: {count_products()}")
+    return report
 
-if __name__ == "__main__":
+def main():
+    parser = argparse.ArgumentParser(description="Scrape stores into the product database")
+    parser.add_argument("--stores", help="comma-separated store adapters to run (default: all enabled)")
+    parser.add_argument("--list", action="store_true", help="list registered store adapters and exit")
+    parser.add_argument("--base-url", help="base URL for every selected store, e.g. a store stub")
+    parser.add_argument("--concurrency", type=int, help="pages fetched at once per store")
+    parser.add_argument("--no-delay", action="store_true", help="don't pause between pages")
+    parser.add_argument("--crawl-state", help="directory to checkpoint crawls to, so an interrupted "
+                                              "crawl resumes instead of starting over")
+    parser.add_argument("--frontier-capacity", type=int, default=DEFAULT_CAPACITY,
+                        help="URLs per store the seen-URL filter is sized for (it grows past this)")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    
+    load_scraper_plugins()
+    if args.list:
+        for name, cls in sorted(SCRAPERS.items()):
+            state = "enabled" if cls.enabled else "disabled"
+            print(f"{name:<12} {state:<9} concurrency={cls.concurrency} delay={cls.request_delay}")
+        return
+    
+    stores = args.stores.split(',') if args.stores else None
+    overrides = {}
+    if args.base_url:
+        overrides['base_url'] = args.base_url
+    if args.concurrency:
+        overrides['concurrency'] = args.concurrency
+    if args.no_delay:
+        overrides['request_delay'] = (0.0, 0.0)
+    
+    settings = {}
+    for name in stores or [name for name, cls in SCRAPERS.items() if cls.enabled]:
+        store_overrides = dict(overrides)
+        # The demo catalogue has no base URL
+        if name == DummyDataScraper.name:
+            store_overrides.pop('base_url', None)
+        settings[name] = store_overrides
+    
     init_db()
-    scrape_and_insert_dummy_data()
-    logger.info("Scraping complete!")
+    # Rows written to partitions are only visible to an API that is partitioned the same way
+    configure_partitions_from_env()
+    report = scrape_all_sources(stores, settings, args.crawl_state, args.frontier_capacity)
+    print(format_scrape_report(report))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""
+Precomputed "similar products" lists.
+
+Each product becomes a TF-IDF vector of its name and description tokens,
+with name tokens counted twice. Two products score as the cosine of their
+vectors blended with how close their prices are:
+
+    score = (1 - PRICE_WEIGHT) * cosine + PRICE_WEIGHT * price_closeness
+
+Products are only compared within their category. Listings with the same
+name as the product are left out, because they are the same item in another
+store and /price-comparison already shows them. Each list also holds at most
+one listing per product name.
+
+Vectors are sparse (CSR arrays), so a category costs memory for its nonzero
+weights, not for products x vocabulary. Scoring is bounded too: the NumPy
+scorer takes BLOCK_SIZE queries at a time against chunks of the category,
+holding about BLOCK_ENTRIES floats per step, and keeps each query's best
+candidates between chunks.
+
+The TOP_K best neighbours of every product are stored in similar_products,
+so /products/<id>/similar is a single primary-key range read. A normal run
+scores only products that have no list yet, or whose name or price changed
+since the last run (read from the product change log). It compares them
+against their category and slots them into existing lists they beat. Lists
+that ranked a changed product are rescored too, since they hold its old score.
+Categories with nothing new are skipped without reading their text.
+--full rebuilds everything.
+
+Without NumPy, an inverted index over the tokens gives the same lists, more
+slowly.
+
+    python similar.py                  # products added or changed since the last run
+    python similar.py --full --top-k 20
+"""
+
+import argparse
+import heapq
+import logging
+import math
+import re
+import time
+from array import array
+from database import (init_db, category_codes, get_similarity_corpus,
+                      get_similar_lists, save_similar_lists, delete_similar_lists,
+                      get_lists_referencing, get_category_product_ids, get_similar_thresholds,
+                      get_renamed_or_repriced, get_change_checkpoint, save_change_checkpoint,
+                      latest_change_seq)
+from partitions import configure_from_env as configure_partitions_from_env
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 10
+
+# Share of the score that comes from price; the rest is text similarity
+PRICE_WEIGHT = 0.25
+# Prices this many times apart (or more) get no price credit
+PRICE_RATIO_CUTOFF = 4.0
+
+# Token columns kept per category, most frequent first. Tokens that occur in a
+# single product can't match another one and never get a column.
+MAX_FEATURES = 32768
+
+# Products scored together by the NumPy scorer
+BLOCK_SIZE = 256
+
+# Floats one NumPy scoring step may hold (block x chunk entries)
+BLOCK_ENTRIES = 4_000_000
+
+# A chunk at least 1/DENSE_FILL full in the block's columns is multiplied as a dense matrix
+DENSE_FILL = 8
+
+NAME_WEIGHT = 2
+
+# Candidates fetched per product before duplicate names are dropped
+CANDIDATES_PER_NEIGHBOUR = 4
+
+# change_checkpoints entry: the last product change an incremental run has seen
+CHECKPOINT = "similar_products"
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_LOG_CUTOFF = math.log(PRICE_RATIO_CUTOFF)
+
+_numpy = None
+
+
+def _load_numpy():
+    """The numpy module, or None when it isn't installed. Imported once."""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+
+def tokenize(name, description):
+    """Token counts for a product, name tokens weighted NAME_WEIGHT times."""
+    counts = {}
+    for weight, text in ((NAME_WEIGHT, name), (1, description)):
+        for token in _TOKEN.findall((text or "").lower()):
+            if len(token) > 1:
+                counts[token] = counts.get(token, 0) + weight
+    return counts
+
+
+class CategoryCorpus:
+    """Sparse normalised token vectors (CSR arrays), log prices and name groups for one category."""
+
+    def __init__(self, rows):
+        self.ids = [row[0] for row in rows]
+        self.log_prices = array('d', (math.log(max(row[3] or 0, 1)) for row in rows))
+
+        # Listings sharing a name share a group and are never each other's neighbours
+        groups = {}
+        self.groups = array('q', (groups.setdefault(row[1].strip().lower(), len(groups)) for row in rows))
+
+        # Two passes over the rows, so only one product's token counts exist at a time
+        df = {}
+        for row in rows:
+            for token in tokenize(row[1], row[2]):
+                df[token] = df.get(token, 0) + 1
+        n = len(rows)
+        shared = sorted((t for t, count in df.items() if count > 1),
+                        key=lambda t: (-df[t], t))
+        self.columns = {token: i for i, token in enumerate(shared[:MAX_FEATURES])}
+
+        # Sublinear TF-IDF, L2-normalised over every token so unmatched words still dilute
+        self.indptr = array('q', [0])
+        self.indices = array('i')
+        self.data = array('f')
+        for row in rows:
+            doc = tokenize(row[1], row[2])
+            weights = {t: (1 + math.log(c)) * (math.log((1 + n) / (1 + df[t])) + 1)
+                       for t, c in doc.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for column, weight in sorted((self.columns[t], w / norm) for t, w in weights.items()
+                                         if t in self.columns):
+                self.indices.append(column)
+                self.data.append(weight)
+            self.indptr.append(len(self.indices))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def vector(self, i):
+        """(column, weight) pairs of row i."""
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return zip(self.indices[start:end], self.data[start:end])
+
+
+def _price_closeness(a, b):
+    return max(0.0, 1.0 - abs(a - b) / _LOG_CUTOFF)
+
+
+def _distinct(candidates, groups, k):
+    """Best k (score, j) candidates, keeping one listing per product name."""
+    chosen, used = [], set()
+    for score, j in sorted(candidates, reverse=True):
+        if groups[j] not in used:
+            used.add(groups[j])
+            chosen.append((score, j))
+            if len(chosen) == k:
+                break
+    return chosen
+
+
+def _python_neighbours(corpus, queries, k, thresholds):
+    """Score `queries` (row indexes) against the category through an inverted index.
+
+    Returns (forward, reverse): forward[i] is row i's top k as [(score, j)], best
+    first; reverse[j] lists (score, i) for non-query rows j that query i beats
+    thresholds[j] for.
+    """
+    postings = {}
+    for j in range(len(corpus)):
+        for column, weight in corpus.vector(j):
+            postings.setdefault(column, []).append((j, weight))
+
+    is_query = set(queries)
+    forward, reverse = {}, {}
+    for i in queries:
+        dots = {}
+        for column, weight in corpus.vector(i):
+            for j, other in postings[column]:
+                dots[j] = dots.get(j, 0.0) + weight * other
+        group, price = corpus.groups[i], corpus.log_prices[i]
+        candidates = [((1 - PRICE_WEIGHT) * dot
+                       + PRICE_WEIGHT * _price_closeness(price, corpus.log_prices[j]), j)
+                      for j, dot in dots.items() if dot > 0 and corpus.groups[j] != group]
+        forward[i] = _distinct(heapq.nlargest(k * CANDIDATES_PER_NEIGHBOUR, candidates),
+                               corpus.groups, k)
+        if thresholds is not None:
+            for score, j in candidates:
+                if j not in is_query and score > thresholds[j]:
+                    reverse.setdefault(j, []).append((score, i))
+    return forward, reverse
+
+
+def _numpy_neighbours(np, corpus, queries, k, thresholds, block_size):
+    """_python_neighbours() with array operations, in bounded steps.
+
+    Queries are scored block_size at a time against the category in chunks of
+    rows. A step multiplies only the chunk's entries in columns the block uses,
+    so it holds at most about BLOCK_ENTRIES floats, and each query keeps just
+    its best candidates so far between chunks.
+    """
+    n = len(corpus)
+    indptr = np.frombuffer(corpus.indptr, dtype=np.int64)
+    indices = np.frombuffer(corpus.indices, dtype=np.int32)
+    data = np.frombuffer(corpus.data, dtype=np.float32)
+    log_prices = np.frombuffer(corpus.log_prices, dtype=np.float64)
+    groups = np.frombuffer(corpus.groups, dtype=np.int64)
+    entry_rows = np.repeat(np.arange(n), np.diff(indptr))
+    limits = None
+    if thresholds is not None:
+        limits = np.asarray(thresholds, dtype=np.float64)
+        limits[np.asarray(queries)] = np.inf
+
+    # Row ranges holding about BLOCK_ENTRIES / block_size entries each
+    chunk_entries = max(1, BLOCK_ENTRIES // block_size)
+    cuts = np.searchsorted(indptr, np.arange(chunk_entries, int(indptr[-1]), chunk_entries))
+    bounds = np.unique(np.concatenate(([0], cuts, [n])))
+    # Column -> position among the current block's columns, -1 for columns it doesn't use
+    column_slot = np.full(max(len(corpus.columns), 1), -1, dtype=np.int64)
+
+    forward, reverse = {}, {}
+    keep = k * CANDIDATES_PER_NEIGHBOUR
+    for start in range(0, len(queries), block_size):
+        rows = np.asarray(queries[start:start + block_size], dtype=np.int64)
+        counts = indptr[rows + 1] - indptr[rows]
+        positions = np.repeat(indptr[rows] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        block_columns = np.unique(indices[positions])
+        column_slot[block_columns] = np.arange(len(block_columns))
+        # Column-major, so each entry below gathers one contiguous row of query weights
+        query_weights = np.zeros((max(len(block_columns), 1), len(rows)), dtype=np.float32)
+        query_weights[column_slot[indices[positions]], np.repeat(np.arange(len(rows)), counts)] = data[positions]
+
+        best_scores = np.full((len(rows), 0), -np.inf)
+        best_ids = np.zeros((len(rows), 0), dtype=np.int64)
+        for first, last in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            entries = slice(int(indptr[first]), int(indptr[last]))
+            slots = column_slot[indices[entries]]
+            used = slots >= 0
+            if not used.any():
+                continue
+            others_per_entry = entry_rows[entries][used]
+            if used.sum() * DENSE_FILL >= len(block_columns) * (last - first):
+                # Dense enough (a small vocabulary) for one BLAS product over the chunk's rows
+                chunk = np.zeros((last - first, len(block_columns)), dtype=np.float32)
+                chunk[others_per_entry - first, slots[used]] = data[entries][used]
+                text = query_weights.T @ chunk.T
+                others = np.arange(first, last)
+            else:
+                contributions = query_weights[slots[used]] * data[entries][used][:, None]
+                # Entries are in row order; sum each row's run of entries
+                runs = np.flatnonzero(np.concatenate(([True], others_per_entry[1:] != others_per_entry[:-1])))
+                text = np.add.reduceat(contributions, runs, axis=0).T
+                others = others_per_entry[runs]
+
+            closeness = np.clip(1 - np.abs(log_prices[rows, None] - log_prices[None, others]) / _LOG_CUTOFF,
+                                0, None)
+            scores = (1 - PRICE_WEIGHT) * text + PRICE_WEIGHT * closeness
+            scores[(text <= 0) | (groups[rows, None] == groups[None, others])] = -np.inf
+
+            if limits is not None:
+                for r, c in zip(*np.nonzero(scores > limits[None, others])):
+                    reverse.setdefault(int(others[c]), []).append((float(scores[r, c]), int(rows[r])))
+
+            best_scores = np.concatenate((best_scores, scores), axis=1)
+            best_ids = np.concatenate((best_ids, np.broadcast_to(others, scores.shape)), axis=1)
+            if best_scores.shape[1] > keep:
+                top = np.argpartition(-best_scores, keep - 1, axis=1)[:, :keep]
+                best_scores = np.take_along_axis(best_scores, top, axis=1)
+                best_ids = np.take_along_axis(best_ids, top, axis=1)
+        column_slot[block_columns] = -1
+
+        for r, i in enumerate(rows.tolist()):
+            found = [(score, j) for score, j in zip(best_scores[r].tolist(), best_ids[r].tolist())
+                     if score > -np.inf]
+            forward[i] = _distinct(found, corpus.groups, k)
+    return forward, reverse
+
+
+def _merge(current, additions, k, group_of):
+    """Best k of two (similar_id, score) lists, one entry per product name."""
+    merged, used = [], set()
+    for similar_id, score in sorted(current + additions, key=lambda item: -item[1]):
+        # Neighbours deleted since they were stored have no group; keep them apart
+        group = group_of.get(similar_id, ('deleted', similar_id))
+        if group not in used:
+            used.add(group)
+            merged.append((similar_id, score))
+            if len(merged) == k:
+                break
+    return merged
+
+
+def update_similar_products(full=False, top_k=TOP_K, block_size=BLOCK_SIZE, use_numpy=True):
+    """Compute neighbour lists for new and changed products (or every product with full=True).
+
+    Returns counters: categories visited, products scored, lists written, seconds.
+    """
+    np = _load_numpy() if use_numpy else None
+    stats = {"categories": 0, "scored": 0, "changed": 0, "lists_written": 0, "stale_removed": 0,
+             "numpy": np is not None, "elapsed": 0.0}
+    started = time.monotonic()
+    seq = latest_change_seq()
+    changed = set() if full else get_renamed_or_repriced(get_change_checkpoint(CHECKPOINT))
+    stats["changed"] = len(changed)
+    # Lists that ranked a changed product hold its old score, so they are rescored as well
+    rescore = changed | get_lists_referencing(changed) if changed else set()
+    seen = set()
+
+    for category_id, category in category_codes.items():
+        thresholds = None
+        if not full:
+            # Only IDs and stored thresholds are read for a category with nothing to score
+            product_ids = get_category_product_ids(category_id)
+            listed = get_similar_thresholds(product_ids, top_k)
+            if all(product_id in listed and product_id not in rescore for product_id in product_ids):
+                continue
+
+        rows = get_similarity_corpus(category_id)
+        if not rows:
+            continue
+        corpus = CategoryCorpus(rows)
+        del rows
+        ids = corpus.ids
+        seen.update(ids)
+        if full:
+            queries = list(range(len(ids)))
+        else:
+            queries = [i for i, product_id in enumerate(ids)
+                       if product_id not in listed or product_id in rescore]
+            thresholds = [listed.get(product_id, -1.0) for product_id in ids]
+        if not queries:
+            continue
+
+        if np is not None:
+            forward, reverse = _numpy_neighbours(np, corpus, queries, top_k, thresholds, block_size)
+        else:
+            forward, reverse = _python_neighbours(corpus, queries, top_k, thresholds)
+
+        group_of = dict(zip(ids, corpus.groups))
+        updates = {ids[i]: [(ids[j], round(score, 6)) for score, j in forward.get(i, [])]
+                   for i in queries}
+        lists = get_similar_lists([ids[j] for j in reverse]) if reverse else {}
+        for j, additions in reverse.items():
+            # A changed product's old score is replaced by the one just computed
+            current = [(similar_id, score) for similar_id, score in lists.get(ids[j], [])
+                       if similar_id not in changed]
+            updates[ids[j]] = _merge(current, [(ids[i], round(score, 6)) for score, i in additions],
+                                     top_k, group_of)
+        stats["lists_written"] += save_similar_lists(updates)
+        stats["categories"] += 1
+        stats["scored"] += len(queries)
+        logger.info(f"Similar products: {category}: scored {len(queries)} of {len(corpus)}, "
+                    f"updated {len(reverse)} existing lists")
+
+    if full:
+        stats["stale_removed"] = delete_similar_lists(seen)
+    save_change_checkpoint(CHECKPOINT, seq)
+    stats["elapsed"] = round(time.monotonic() - started, 3)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute similar-product lists")
+    parser.add_argument("--full", action="store_true",
+                        help="rebuild every list, not just new and changed products")
+    parser.add_argument("--top-k", type=int, default=TOP_K, help="neighbours stored per product")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE,
+                        help="products scored together (NumPy only)")
+    parser.add_argument("--no-numpy", action="store_true", help="use the pure-Python scorer")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    configure_partitions_from_env()
+    stats = update_similar_products(args.full, args.top_k, args.block_size, not args.no_numpy)
+    print(f"Scored {stats['scored']} products in {stats['categories']} categories, "
+          f"wrote {stats['lists_written']} lists in {stats['elapsed']:.1f}s "
+          f"({'NumPy' if stats['numpy'] else 'pure Python'})")
+
+
+if __name__ == "__main__":
+    main()
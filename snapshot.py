@@ -0,0 +1,252 @@
+"""
+Read-replica snapshots of the product database.
+
+A publisher copies the live database with the SQLite backup API into a new
+file and drops the write-side tables (change log, raw comparison events,
+alert queues). It then runs ANALYZE and VACUUM and points the CURRENT file
+in the snapshot directory at the new copy with an atomic rename. Snapshots
+are never modified after they are published.
+
+API workers read through SnapshotReader. It opens the current snapshot with
+immutable=1, so SQLite takes no locks and never checks for other writers,
+and with a large mmap_size so pages are shared through the OS page cache.
+When CURRENT changes, each thread moves to the new file on its next query.
+Scraper ingest therefore never competes with API reads for the database
+lock. The trade-off is that reads lag writes by up to the publish interval.
+
+A snapshot records the watermarks it was copied at (database.read_watermarks:
+the product change log, the comparison rollup and the similar_products write
+counter). The publisher skips a copy only when none of them has moved.
+
+Only products.db is copied. With a partitioned catalogue, product reads go
+to the partition files and never to the snapshot, so snapshots then serve
+just the similar and frequently-compared lists and the lookup tables.
+
+    python snapshot.py --dir snapshots --interval 60
+    PRICECOMPARE_SNAPSHOT_DIR=snapshots python app.py
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+import database
+from database import get_db, open_connection, product_cache, read_watermarks
+
+logger = logging.getLogger(__name__)
+
+# File in the snapshot directory naming the snapshot readers should use
+POINTER_FILE = "CURRENT"
+
+# Table in each snapshot holding the watermarks it was copied at
+WATERMARK_TABLE = "snapshot_watermarks"
+
+# Tables only the writer side needs; dropped from snapshots before VACUUM
+SNAPSHOT_EXCLUDED_TABLES = [
+    "product_changes", "change_checkpoints", "comparisons", "rollup_state",
+    "price_watches", "alert_outbox", "migration_progress",
+]
+
+
+def current_snapshot(directory):
+    """Return the path of the published snapshot in `directory`, or None."""
+    try:
+        with open(os.path.join(directory, POINTER_FILE)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(directory, name) if name else None
+
+
+def publish_snapshot(directory, keep: int = 3, force: bool = False):
+    """Copy the live database into a new snapshot and make it current.
+
+    Returns the new snapshot's path, or None when nothing has changed since the
+    current snapshot (unless `force` is set).
+    """
+    os.makedirs(directory, exist_ok=True)
+    with get_db() as source:
+        # Read in the backup's transaction, so the watermarks match what is copied
+        source.execute("BEGIN")
+        watermarks = read_watermarks(source)
+        current = current_snapshot(directory)
+        if not force and current and _snapshot_watermarks(current) == watermarks:
+            source.rollback()
+            return None
+
+        seq = watermarks['product_changes']
+        name = f"products-{seq:012d}-{time.strftime('%Y%m%d%H%M%S')}.db"
+        path = os.path.join(directory, name)
+        tmp_path = path + ".tmp"
+        target = sqlite3.connect(tmp_path)
+        try:
+            # One step: a consistent copy that, under WAL, doesn't block the writers
+            source.backup(target)
+        except Exception:
+            target.close()
+            os.remove(tmp_path)
+            raise
+        finally:
+            source.rollback()
+
+    started = time.monotonic()
+    try:
+        # The copy inherits WAL mode from the source; immutable readers must not need a -wal file
+        target.execute("PRAGMA journal_mode=DELETE")
+        for table in SNAPSHOT_EXCLUDED_TABLES:
+            target.execute(f"DROP TABLE IF EXISTS {table}")
+        target.execute(f"CREATE TABLE {WATERMARK_TABLE} (name TEXT PRIMARY KEY, value INTEGER)")
+        target.executemany(f"INSERT INTO {WATERMARK_TABLE} (name, value) VALUES (?, ?)",
+                           watermarks.items())
+        target.commit()
+        target.execute("ANALYZE")
+        target.commit()
+        target.execute("VACUUM")
+    finally:
+        target.close()
+
+    os.replace(tmp_path, path)
+    _write_pointer(directory, name)
+    logger.info(f"Published snapshot {name} ({os.path.getsize(path) / 1e6:.1f} MB, "
+                f"compacted in {time.monotonic() - started:.1f}s)")
+    _prune(directory, keep)
+    return path
+
+
+def _snapshot_watermarks(path):
+    """The watermarks a snapshot was copied at, or None if it has none (or is gone)."""
+    try:
+        conn = sqlite3.connect(f"file:{path}?immutable=1", uri=True)
+    except sqlite3.Error:
+        return None
+    try:
+        return dict(conn.execute(f"SELECT name, value FROM {WATERMARK_TABLE}"))
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+
+def _write_pointer(directory, name):
+    tmp_path = os.path.join(directory, POINTER_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(directory, POINTER_FILE))
+
+
+def _prune(directory, keep):
+    # Readers still holding an older file keep it alive until they close it
+    snapshots = sorted(name for name in os.listdir(directory)
+                       if name.startswith("products-") and name.endswith(".db"))
+    for name in snapshots[:-keep]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError as e:
+            logger.warning(f"Could not remove old snapshot {name}: {str(e)}")
+
+
+class SnapshotReader:
+    """Per-thread read-only connections to the current snapshot, for database.set_read_source()."""
+
+    def __init__(self, directory, mmap_size: int = 256 * 1024 * 1024, check_interval: float = 1.0):
+        self.directory = directory
+        self.mmap_size = mmap_size
+        self.check_interval = check_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._path = None
+        self._checked_at = 0.0
+
+    def path(self):
+        """The snapshot in use, re-reading CURRENT at most every check_interval seconds."""
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if now - self._checked_at >= self.check_interval:
+                    self._checked_at = now
+                    path = current_snapshot(self.directory)
+                    if path != self._path and path and os.path.exists(path):
+                        logger.info(f"Switching reads to snapshot {os.path.basename(path)}")
+                        self._path = path
+                        # Cached products may be older or newer than the new snapshot
+                        product_cache.clear()
+        return self._path
+
+    def __call__(self):
+        path = self.path()
+        if path is None:
+            return None
+        local = self._local
+        if getattr(local, "path", None) != path:
+            if getattr(local, "conn", None) is not None:
+                local.conn.close()
+            local.conn = open_connection(f"file:{path}?immutable=1", uri=True)
+            local.conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            local.path = path
+        return local.conn
+
+
+class SnapshotPublisher:
+    """Publish a snapshot every `interval` seconds from a background thread."""
+
+    def __init__(self, directory, interval: float = 60.0, keep: int = 3):
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start publishing (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="snapshot-publisher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+
+    def _run(self):
+        while True:
+            try:
+                publish_snapshot(self.directory, self.keep)
+            except Exception as e:
+                logger.error(f"Snapshot publish failed: {str(e)}")
+            if self._stop.wait(self.interval):
+                return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish read-only snapshots of the product database")
+    parser.add_argument("--dir", default="snapshots", help="snapshot directory")
+    parser.add_argument("--db", default=database.DATABASE, help="live database to copy")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="seconds between snapshots; 0 publishes once and exits")
+    parser.add_argument("--keep", type=int, default=3, help="snapshots to keep on disk")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    database.DATABASE = args.db
+    if args.interval <= 0:
+        path = publish_snapshot(args.dir, args.keep, force=True)
+        print(f"Published {path}")
+        return
+
+    publisher = SnapshotPublisher(args.dir, args.interval, args.keep)
+    publisher.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        publisher.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Structured-data extraction for store pages.
+
+Most product pages embed the listing as schema.org JSON-LD
+(<script type="application/ld+json">) or as a JSON state blob for the
+front-end (__NEXT_DATA__, window.__INITIAL_STATE__). Reading that JSON gives
+exact prices, currency, availability and SKU, and skips building a DOM.
+
+The scan is a handful of regex searches for the script markers; a page
+without them costs one pass over the text and extract_products() returns
+an empty list, so the caller can fall back to its DOM parser.
+"""
+
+import json
+import re
+from typing import Dict, List, Optional
+
+_LD_JSON_SCRIPT = re.compile(r'<script[^>]*?type\s*=\s*["\']?application/ld\+json', re.I)
+_NEXT_DATA_SCRIPT = re.compile(r'<script[^>]*?id\s*=\s*["\']__NEXT_DATA__["\']', re.I)
+_STATE_ASSIGNMENT = re.compile(r'window\.__(?:INITIAL|PRELOADED)_STATE__\s*=\s*')
+_SCRIPT_END = re.compile(r'</script', re.I)
+_PRICE_NUMBER = re.compile(r'\d[\d.,]*')
+
+# schema.org ItemAvailability values, by their last path segment
+AVAILABILITY = {
+    'instock': 'in_stock', 'onlineonly': 'in_stock', 'instoreonly': 'in_stock',
+    'limitedavailability': 'in_stock',
+    'outofstock': 'out_of_stock', 'soldout': 'out_of_stock', 'discontinued': 'out_of_stock',
+    'preorder': 'preorder', 'presale': 'preorder', 'backorder': 'preorder',
+}
+
+# Nesting below this is page furniture, not listings
+_MAX_DEPTH = 24
+
+_decoder = json.JSONDecoder()
+
+
+def parse_price(value) -> Optional[float]:
+    """Parse a price such as 1299, "1299.99", "$1,299.99", "1.299,99 €" or "1.299 €".
+
+    A lone separator followed by exactly three digits groups thousands, in
+    either convention. Returns None when there's no number, rather than a
+    price of 0.
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return round(float(value), 2) if value >= 0 else None
+    match = _PRICE_NUMBER.search(str(value))
+    if not match:
+        return None
+    number = match.group().rstrip('.,')
+    if ',' in number and '.' in number:
+        # Whichever separator comes last is the decimal point
+        if number.rfind(',') > number.rfind('.'):
+            number = number.replace('.', '').replace(',', '.')
+        else:
+            number = number.replace(',', '')
+    elif ',' in number or '.' in number:
+        separator = ',' if ',' in number else '.'
+        whole, _, fraction = number.rpartition(separator)
+        if len(fraction) == 3 and whole.replace(separator, '').lstrip('0'):
+            number = number.replace(separator, '')
+        else:
+            number = f"{whole.replace(separator, '')}.{fraction}"
+    try:
+        return round(float(number), 2)
+    except ValueError:
+        return None
+
+
+def find_json_blocks(html: str) -> List:
+    """Parsed JSON from every JSON-LD, __NEXT_DATA__ and window state script on the page."""
+    blocks = []
+    for pattern in (_LD_JSON_SCRIPT, _NEXT_DATA_SCRIPT):
+        for match in pattern.finditer(html):
+            start = html.find('>', match.end()) + 1
+            end = _SCRIPT_END.search(html, start)
+            if not start or end is None:
+                continue
+            try:
+                blocks.append(json.loads(html[start:end.start()]))
+            except ValueError:
+                continue
+    for match in _STATE_ASSIGNMENT.finditer(html):
+        try:
+            blocks.append(_decoder.raw_decode(html, match.end())[0])
+        except ValueError:
+            continue
+    return blocks
+
+
+def _types(node: Dict):
+    types = node.get('@type', ())
+    return (types,) if isinstance(types, str) else types
+
+
+def _is_product(node: Dict) -> bool:
+    if 'Product' in _types(node):
+        return True
+    # State blobs carry bare listing objects: a name, a SKU and a price or offer
+    return (isinstance(node.get('name'), str) and ('sku' in node or 'skuId' in node)
+            and ('price' in node or 'offers' in node))
+
+
+def _product_nodes(node, found: List, depth: int = 0):
+    if depth > _MAX_DEPTH:
+        return
+    if isinstance(node, list):
+        for child in node:
+            _product_nodes(child, found, depth + 1)
+    elif isinstance(node, dict):
+        if _is_product(node):
+            found.append(node)
+            return
+        for child in node.values():
+            if isinstance(child, (dict, list)):
+                _product_nodes(child, found, depth + 1)
+
+
+def _first(value):
+    return value[0] if isinstance(value, list) and value else value
+
+
+def _image_url(value) -> str:
+    value = _first(value)
+    if isinstance(value, dict):
+        value = value.get('url') or value.get('contentUrl')
+    return value if isinstance(value, str) else ''
+
+
+def _availability(value) -> str:
+    if not isinstance(value, str) or not value:
+        return 'in_stock'
+    key = value.rstrip('/').rsplit('/', 1)[-1].replace('_', '').replace(' ', '').lower()
+    return AVAILABILITY.get(key, 'in_stock')
+
+
+def _offer(node: Dict) -> Dict:
+    """The offer to price a product from: the first with a price, or the node itself."""
+    offers = node.get('offers')
+    if isinstance(offers, dict) and isinstance(offers.get('offers'), list):
+        offers = offers['offers']
+    if isinstance(offers, list):
+        offers = next((o for o in offers if isinstance(o, dict)
+                       and ('price' in o or 'lowPrice' in o)), None)
+    return offers if isinstance(offers, dict) else node
+
+
+def product_fields(node: Dict) -> Optional[Dict]:
+    """Normalise one schema.org Product (or state-blob listing). None if it has no name or price."""
+    name = node.get('name')
+    offer = _offer(node)
+    price = offer.get('price', offer.get('lowPrice'))
+    if price is None and isinstance(offer.get('priceSpecification'), dict):
+        price = offer['priceSpecification'].get('price')
+    price = parse_price(price)
+    if not isinstance(name, str) or not name.strip() or price is None:
+        return None
+
+    rating = node.get('aggregateRating')
+    rating = parse_price(rating.get('ratingValue')) if isinstance(rating, dict) else None
+    url = node.get('url') or offer.get('url')
+    return {
+        'name': name.strip(),
+        'price': price,
+        'currency': offer.get('priceCurrency') or node.get('currency') or node.get('priceCurrency'),
+        'availability': _availability(offer.get('availability') or node.get('availability')),
+        'sku': str(node.get('sku') or node.get('skuId') or node.get('productID') or '') or None,
+        'url': url if isinstance(url, str) else '',
+        'image': _image_url(node.get('image')),
+        'rating': min(rating, 5.0) if rating is not None else None,
+        'description': node.get('description') if isinstance(node.get('description'), str) else '',
+    }
+
+
+def extract_products(html: str) -> List[Dict]:
+    """Products from the page's structured data, or [] if it has none.
+
+    Items that are present but unusable (no name or price) come back as None,
+    so callers can count them as parse failures.
+    """
+    nodes = []
+    for block in find_json_blocks(html):
+        _product_nodes(block, nodes)
+    return [product_fields(node) for node in nodes]
@@ -0,0 +1,194 @@
+"""
+Autocomplete index for the search box.
+
+Keeps a sorted array of lowercase terms built from product names, brands and
+categories so prefix lookups are two binary searches instead of a LIKE scan.
+The index is built once and then kept current from the product change feed.
+"""
+
+import bisect
+import heapq
+import threading
+from changefeed import ChangeConsumer
+from database import get_products_by_ids, read_catalogue, category_codes
+
+# Upper bound appended to a prefix to find the end of its range in the sorted keys
+_PREFIX_END = '\uffff'
+
+# Prefixes this short match a large slice of the index; their results are memoized
+_MEMO_PREFIX_LENGTH = 2
+
+
+def _name_terms(name):
+    """Every word start of a name, so "pro" finds "iPhone 15 Pro"."""
+    words = name.lower().split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+def _brand(name):
+    words = name.split()
+    return words[0] if words else None
+
+
+class SuggestionIndex(ChangeConsumer):
+    """Sorted-array prefix index over product names, brands and categories."""
+
+    name = "suggestion_index"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Sorted (term, text, kind) tuples
+        self._keys = []
+        # name -> [listings, best rating]; brand/category -> listings
+        self._names = {}
+        self._brands = {}
+        self._categories = {}
+        self._memo = {}
+        # Terms whose suggestions changed since the memo was last pruned
+        self._touched = set()
+
+    def start(self) -> int:
+        """Build the index from the products table; returns the change seq it reflects."""
+        return self.build()
+
+    def build(self) -> int:
+        """Rebuild the index from scratch in one read transaction."""
+        seq, (rows,) = read_catalogue(["SELECT name, category_id, rating FROM product_records"])
+
+        names = {}
+        brands = {}
+        categories = {}
+        for name, category_id, rating in rows:
+            category = category_codes.name(category_id)
+            entry = names.setdefault(name, [0, 0])
+            entry[0] += 1
+            entry[1] = max(entry[1], rating or 0)
+            brand = _brand(name)
+            if brand:
+                brands[brand] = brands.get(brand, 0) + 1
+            if category:
+                categories[category] = categories.get(category, 0) + 1
+
+        keys = [(term, name, 'product') for name in names for term in _name_terms(name)]
+        keys.extend((brand.lower(), brand, 'brand') for brand in brands)
+        keys.extend((category.lower(), category, 'category') for category in categories)
+        keys.sort()
+
+        with self._lock:
+            self._keys = keys
+            self._names = names
+            self._brands = brands
+            self._categories = categories
+            self._memo = {}
+            self._touched = set()
+        return seq
+
+    def apply(self, changes):
+        """Update listing counts and terms for a batch of product changes."""
+        current = {product['id']: product for product in
+                   get_products_by_ids([change['product_id'] for change in changes
+                                        if change['op'] != 'delete'])}
+        with self._lock:
+            for change in changes:
+                op = change['op']
+                if op in ('update', 'delete'):
+                    old_name = change['old_name'] if op == 'update' else change['name']
+                    if op == 'delete' or old_name != change['name']:
+                        self._remove_listing(old_name, change['category'])
+                if op == 'insert' or (op == 'update' and change['old_name'] != change['name']):
+                    product = current.get(change['product_id'])
+                    rating = product['rating'] if product else 0
+                    self._add_listing(change['name'], change['category'], rating)
+                elif op == 'update' and change['product_id'] in current:
+                    entry = self._names.get(change['name'])
+                    if entry:
+                        entry[1] = max(entry[1], current[change['product_id']]['rating'] or 0)
+                        self._touched.update(_name_terms(change['name']))
+            self._prune_memo()
+
+    def _prune_memo(self):
+        """Drop memoized results for the prefixes of terms whose counts or ratings changed."""
+        affected = {term[:length] for term in self._touched
+                    for length in range(1, _MEMO_PREFIX_LENGTH + 1)}
+        self._touched = set()
+        if affected:
+            self._memo = {memo_key: suggestions for memo_key, suggestions in self._memo.items()
+                          if memo_key[0] not in affected}
+
+    def _add_listing(self, name, category, rating):
+        self._touched.update(_name_terms(name))
+        entry = self._names.get(name)
+        if entry is None:
+            self._names[name] = [1, rating or 0]
+            for term in _name_terms(name):
+                bisect.insort(self._keys, (term, name, 'product'))
+        else:
+            entry[0] += 1
+            entry[1] = max(entry[1], rating or 0)
+        self._count(self._brands, _brand(name), 'brand', 1)
+        self._count(self._categories, category, 'category', 1)
+
+    def _remove_listing(self, name, category):
+        # The best rating is kept as an upper bound; the next full build() tightens it
+        self._touched.update(_name_terms(name))
+        entry = self._names.get(name)
+        if entry is not None:
+            entry[0] -= 1
+            if entry[0] <= 0:
+                del self._names[name]
+                for term in _name_terms(name):
+                    self._discard_key((term, name, 'product'))
+        self._count(self._brands, _brand(name), 'brand', -1)
+        self._count(self._categories, category, 'category', -1)
+
+    def _count(self, counts, text, kind, delta):
+        if not text:
+            return
+        self._touched.add(text.lower())
+        count = counts.get(text, 0) + delta
+        if count > 0:
+            if text not in counts:
+                bisect.insort(self._keys, (text.lower(), text, kind))
+            counts[text] = count
+        elif text in counts:
+            del counts[text]
+            self._discard_key((text.lower(), text, kind))
+
+    def _discard_key(self, key):
+        index = bisect.bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            del self._keys[index]
+
+    def _score(self, text, kind):
+        if kind == 'product':
+            entry = self._names.get(text)
+            return (entry[0], entry[1]) if entry else (0, 0)
+        counts = self._brands if kind == 'brand' else self._categories
+        return (counts.get(text, 0), 0)
+
+    def suggest(self, prefix: str, limit: int = 10):
+        """Return up to `limit` suggestions whose terms start with `prefix`."""
+        key = prefix.strip().lower()
+        if not key:
+            return []
+
+        memo_key = (key, limit) if len(key) <= _MEMO_PREFIX_LENGTH else None
+        with self._lock:
+            if memo_key in self._memo:
+                return self._memo[memo_key]
+
+            lo = bisect.bisect_left(self._keys, (key,))
+            hi = bisect.bisect_left(self._keys, (key + _PREFIX_END,), lo)
+            # Every match is ranked; a popular title can sort anywhere in the range
+            matches = {(text, kind) for _, text, kind in self._keys[lo:hi]}
+
+            # Score is (number of listings, best rating): products sold by more stores rank higher
+            top = heapq.nlargest(limit, ((self._score(text, kind), text, kind) for text, kind in matches))
+            suggestions = [
+                {"text": text, "type": kind, "listings": score[0]}
+                for score, text, kind in top
+            ]
+
+            if memo_key is not None:
+                self._memo[memo_key] = suggestions
+        return suggestions
@@ -0,0 +1,358 @@
+"""
+Thumbnail cache behind the /img/<product_id> proxy.
+
+Product images live on third-party hosts at full size. The proxy downloads
+each source image once and keeps resized thumbnails on disk, so a product
+grid loads a few KB per card from our own origin. The cache is bounded by
+total size and evicts the least recently used files first.
+
+Sources are stored under a hash of their URL. Thumbnails are stored under a
+hash of the source bytes, the width and the format. Listings that point at
+the same picture therefore share thumbnails, and the content hash doubles
+as the ETag.
+
+Image URLs come from scraped pages and admin input, so the proxy only
+fetches from public addresses. The host is resolved first, and loopback,
+private, link-local and other reserved addresses are refused, on every
+redirect hop too. The fetch then connects to the address that was checked
+(TLS still verifies the host name), so a host that re-resolves to a private
+address between the check and the connection isn't followed there.
+allow_private turns the check off for a local store stub.
+
+Resizing needs Pillow. Without it, the original image is cached and served
+unchanged. Pillow and requests are imported on the first miss, not when the
+API starts.
+"""
+
+import hashlib
+import io
+import ipaddress
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from urllib.parse import urljoin, urlsplit, urlunsplit
+from cache import LRUCache
+
+# Widths thumbnails are rendered at; a requested width is rounded up to the next one
+THUMBNAIL_WIDTHS = (80, 160, 240, 320, 480, 640, 960)
+
+DEFAULT_THUMBNAIL_WIDTH = 320
+
+# Seconds to remember that a source URL failed, so a dead host isn't hit on every request
+FAILURE_TTL = 60.0
+
+# Redirects followed when fetching a source image; each hop is checked like the first URL
+MAX_REDIRECTS = 3
+
+# Source URLs whose content hash / last failure is remembered in memory
+URL_MEMO_SIZE = 100_000
+
+Thumbnail = namedtuple("Thumbnail", ["data", "mimetype", "etag"])
+
+
+class ImageFetchError(Exception):
+    """The source image could not be downloaded or decoded."""
+
+
+_pillow = None
+
+
+def _load_pillow():
+    """The PIL.Image module, or None when Pillow isn't installed. Imported once."""
+    global _pillow
+    if _pillow is None:
+        try:
+            from PIL import Image
+        except ImportError:
+            Image = False
+        _pillow = Image
+    return _pillow or None
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def check_public_url(url):
+    """Raise ImageFetchError unless `url` is http(s) and its host resolves only to public addresses.
+
+    Returns one of the checked addresses; fetch from it rather than resolving the host again.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ImageFetchError(f"Unsupported image URL {url}")
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, parts.port or 0, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError) as e:
+        raise ImageFetchError(f"Cannot resolve {parts.hostname}: {str(e)}")
+    for address in addresses:
+        ip = ipaddress.ip_address(address[4][0].split("%")[0])
+        if not ip.is_global or ip.is_multicast:
+            raise ImageFetchError(f"Refusing to fetch {url}: {ip} is not a public address")
+    return str(ipaddress.ip_address(addresses[0][4][0].split("%")[0]))
+
+
+def pin_address(url, address):
+    """(`url` with its host replaced by `address`, the Host header naming the original host)."""
+    parts = urlsplit(url)
+    host = f"[{address}]" if ":" in address else address
+    port = f":{parts.port}" if parts.port else ""
+    original = f"[{parts.hostname}]" if ":" in parts.hostname else parts.hostname
+    return urlunsplit(parts._replace(netloc=host + port)), original + port
+
+
+_pinned_adapter = None
+
+
+def _pinned_address_adapter():
+    """A requests adapter for URLs pinned to an IP address: TLS still sends the Host
+    header's name as SNI and verifies the certificate against it."""
+    global _pinned_adapter
+    if _pinned_adapter is None:
+        from requests.adapters import HTTPAdapter
+
+        class PinnedAddressAdapter(HTTPAdapter):
+            def build_connection_pool_key_attributes(self, request, verify, cert=None):
+                host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+                hostname = urlsplit(f"//{request.headers.get('Host', '')}").hostname
+                if host_params["scheme"] == "https" and hostname:
+                    pool_kwargs["server_hostname"] = hostname
+                    pool_kwargs["assert_hostname"] = hostname
+                return host_params, pool_kwargs
+
+        _pinned_adapter = PinnedAddressAdapter()
+    return _pinned_adapter
+
+
+def sniff_mimetype(data):
+    """Guess an image MIME type from its first bytes."""
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    return None
+
+
+class ThumbnailCache:
+    """Size-bounded on-disk LRU of source images and their thumbnails."""
+
+    def __init__(self, directory: str = "image_cache", max_bytes: int = 256 * 1024 * 1024,
+                 timeout: float = 10.0, max_source_bytes: int = 10 * 1024 * 1024,
+                 quality: int = 80, allow_private: bool = False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.max_source_bytes = max_source_bytes
+        self.quality = quality
+        self.allow_private = allow_private
+        self._session = None
+        self.stats = {"hits": 0, "misses": 0, "fetches": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        # File name -> size in bytes, least recently used first
+        self._files = OrderedDict()
+        self._bytes = 0
+        self._url_hashes = LRUCache(URL_MEMO_SIZE)
+        self._failures = LRUCache(URL_MEMO_SIZE)
+        # Striped locks so concurrent requests for one image fetch and render it once
+        self._stripes = [threading.Lock() for _ in range(64)]
+        self._loaded = False
+
+    def _load(self):
+        """Index files left by earlier runs, oldest modification first."""
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name, stat.st_size))
+        with self._lock:
+            for _, name, size in sorted(entries):
+                self._files[name] = size
+                self._bytes += size
+            self._loaded = True
+        self._evict()
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            session = requests.Session()
+            session.headers['User-Agent'] = 'PriceCompare-ImageProxy/1.0'
+            if not self.allow_private:
+                session.mount("http://", _pinned_address_adapter())
+                session.mount("https://", _pinned_address_adapter())
+            self._session = session
+        return self._session
+
+    @staticmethod
+    def snap_width(width):
+        """Round a requested width up to a rendered width, capping at the largest."""
+        return next((w for w in THUMBNAIL_WIDTHS if w >= width), THUMBNAIL_WIDTHS[-1])
+
+    def thumbnail(self, url, width=DEFAULT_THUMBNAIL_WIDTH, webp=False) -> Thumbnail:
+        """Return the thumbnail of the image at `url`, fetching and rendering it on a miss."""
+        if not self._loaded:
+            self._load()
+        width = self.snap_width(width)
+        ext = "webp" if webp else "jpg"
+
+        content_hash = self._url_hashes.get(url)
+        if content_hash is not None:
+            cached = self._read(f"{content_hash}-{width}.{ext}")
+            if cached is not None:
+                self.stats["hits"] += 1
+                return Thumbnail(cached, "image/webp" if webp else "image/jpeg", f"{content_hash}-{width}-{ext}")
+
+        with self._stripes[hash(url) % len(self._stripes)]:
+            source = self._source(url)
+            content_hash = _sha256(source)[:32]
+            self._url_hashes.put(url, content_hash)
+            if _load_pillow() is None:
+                return Thumbnail(source, sniff_mimetype(source) or "application/octet-stream", content_hash)
+
+            name = f"{content_hash}-{width}.{ext}"
+            data = self._read(name)
+            if data is None:
+                self.stats["misses"] += 1
+                data = self._render(source, width, webp)
+                self._write(name, data)
+            else:
+                self.stats["hits"] += 1
+        return Thumbnail(data, "image/webp" if webp else "image/jpeg", f"{content_hash}-{width}-{ext}")
+
+    def _source(self, url):
+        """The original image bytes, from disk or downloaded once."""
+        name = "src-" + _sha256(url.encode())
+        data = self._read(name)
+        if data is not None:
+            return data
+
+        failed_at = self._failures.get(url)
+        if failed_at is not None and time.monotonic() - failed_at < FAILURE_TTL:
+            raise ImageFetchError(f"Recent fetch of {url} failed")
+        try:
+            data = self._fetch(url)
+        except ImageFetchError:
+            self._failures.put(url, time.monotonic())
+            raise
+        self._failures.invalidate(url)
+        self._write(name, data)
+        return data
+
+    def _fetch(self, url):
+        import requests
+        self.stats["fetches"] += 1
+        try:
+            for _ in range(MAX_REDIRECTS + 1):
+                target, headers = url, None
+                if not self.allow_private:
+                    # Connect to the address just checked; resolving again could return another one
+                    target, host = pin_address(url, check_public_url(url))
+                    headers = {"Host": host}
+                response = self.session.get(target, headers=headers, timeout=self.timeout, stream=True,
+                                            allow_redirects=False)
+                if not response.is_redirect:
+                    break
+                response.close()
+                url = urljoin(url, response.headers['Location'])
+            else:
+                raise ImageFetchError(f"Too many redirects fetching {url}")
+            with response:
+                if response.status_code != 200:
+                    raise ImageFetchError(f"HTTP {response.status_code} from {url}")
+                chunks = []
+                size = 0
+                for chunk in response.iter_content(64 * 1024):
+                    size += len(chunk)
+                    if size > self.max_source_bytes:
+                        raise ImageFetchError(f"Image at {url} is larger than {self.max_source_bytes} bytes")
+                    chunks.append(chunk)
+        except requests.RequestException as e:
+            raise ImageFetchError(f"Fetching {url} failed: {str(e)}")
+        data = b"".join(chunks)
+        if sniff_mimetype(data) is None:
+            raise ImageFetchError(f"{url} is not an image")
+        return data
+
+    def _render(self, source, width, webp):
+        Image = _load_pillow()
+        try:
+            with Image.open(io.BytesIO(source)) as image:
+                # Let the JPEG decoder skip detail we'd throw away anyway
+                image.draft("RGB", (width, width * 4))
+                if image.width > width:
+                    height = max(1, round(image.height * width / image.width))
+                    image = image.resize((width, height), Image.LANCZOS)
+                output = io.BytesIO()
+                if webp:
+                    image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+                    image.save(output, "WEBP", quality=self.quality, method=4)
+                else:
+                    if "A" in image.getbands() or image.mode == "P":
+                        image = image.convert("RGBA")
+                        background = Image.new("RGB", image.size, (255, 255, 255))
+                        background.paste(image, mask=image.getchannel("A"))
+                        image = background
+                    image.convert("RGB").save(output, "JPEG", quality=self.quality,
+                                              optimize=True, progressive=True)
+                return output.getvalue()
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            raise ImageFetchError(f"Could not decode image: {str(e)}")
+
+    def _read(self, name):
+        with self._lock:
+            if name not in self._files:
+                return None
+            self._files.move_to_end(name)
+        try:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            # Evicted by another worker sharing the directory
+            with self._lock:
+                size = self._files.pop(name, None)
+                if size is not None:
+                    self._bytes -= size
+            return None
+
+    def _write(self, name, data):
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            previous = self._files.pop(name, None)
+            if previous is not None:
+                self._bytes -= previous
+            self._files[name] = len(data)
+            self._bytes += len(data)
+        self._evict()
+
+    def _evict(self):
+        removed = []
+        with self._lock:
+            while self._bytes > self.max_bytes and len(self._files) > 1:
+                name, size = self._files.popitem(last=False)
+                self._bytes -= size
+                removed.append(name)
+            self.stats["evictions"] += len(removed)
+        for name in removed:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def size(self):
+        """Bytes currently held on disk."""
+        return self._bytes
@@ -0,0 +1,112 @@
+import { useEffect, useRef, useState } from "react";
+
+const API_URL = process.env.REACT_APP_API_URL || "http://localhost:5000";
+
+// Matches the API's per-stream limit (MAX_STREAM_IDS) and batch lookup limit (MAX_BATCH_IDS)
+const MAX_STREAM_IDS = 500;
+
+// Cards mounting and unmounting together (a new page of results) reopen the stream once
+const RECONNECT_DELAY_MS = 250;
+
+// One EventSource for every mounted card: product id -> callbacks of the cards showing it
+const listeners = new Map();
+let source = null;
+let reconnectTimer = null;
+// Set when the server dropped us, so the next stream starts by catching up
+let missedEvents = false;
+
+function notify(update) {
+  (listeners.get(update.id) || []).forEach((callback) => callback(update));
+}
+
+function dispatch(event) {
+  notify(JSON.parse(event.data));
+}
+
+// Changes made while no stream was open never arrive as events; read the current prices instead
+async function refresh(ids) {
+  try {
+    const response = await fetch(`${API_URL}/products/batch`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ ids }),
+    });
+    if (!response.ok) {
+      return;
+    }
+    const { data, missing } = await response.json();
+    data.forEach((product) => notify({ id: product.id, price: product.price, refreshed: true }));
+    missing.forEach((id) => notify({ id, deleted: true }));
+  } catch (error) {
+    // The next reconnect tries again
+  }
+}
+
+function reconnect() {
+  clearTimeout(reconnectTimer);
+  reconnectTimer = setTimeout(() => {
+    if (source) {
+      source.close();
+      source = null;
+    }
+    const ids = [...listeners.keys()].slice(0, MAX_STREAM_IDS);
+    if (ids.length === 0 || typeof EventSource === "undefined") {
+      return;
+    }
+    const stream = new EventSource(`${API_URL}/stream/prices?ids=${ids.join(",")}`);
+    let opened = false;
+    // A reopen after a network error (EventSource retries by itself) may also have missed changes
+    stream.addEventListener("open", () => {
+      if (opened || missedEvents) {
+        missedEvents = false;
+        refresh(ids);
+      }
+      opened = true;
+    });
+    stream.addEventListener("price", dispatch);
+    // We fell too far behind and the server dropped us; reopen and catch up from current prices
+    stream.addEventListener("dropped", () => {
+      missedEvents = true;
+      reconnect();
+    });
+    source = stream;
+  }, RECONNECT_DELAY_MS);
+}
+
+/**
+ * Live price for one product: null until the server reports a change, then
+ * { price, old_price } or { deleted: true }. All cards share one stream.
+ * `shownPrice` is the price the card already shows; a refresh after a
+ * reconnect that finds the same price is not reported as a change.
+ */
+export default function usePriceStream(productId, shownPrice) {
+  const [update, setUpdate] = useState(null);
+  const shown = useRef(shownPrice);
+  shown.current = shownPrice;
+
+  useEffect(() => {
+    if (productId == null) {
+      return undefined;
+    }
+    setUpdate(null);
+    const callback = (next) =>
+      setUpdate((current) => {
+        const price = current?.price ?? shown.current;
+        return next.refreshed && !current?.deleted && next.price === price ? current : next;
+      });
+    const callbacks = listeners.get(productId) || new Set();
+    callbacks.add(callback);
+    listeners.set(productId, callbacks);
+    reconnect();
+
+    return () => {
+      callbacks.delete(callback);
+      if (callbacks.size === 0) {
+        listeners.delete(productId);
+        reconnect();
+      }
+    };
+  }, [productId]);
+
+  return update;
+}